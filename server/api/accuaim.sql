@@ -1,6 +1,8 @@
 -- DROP previous schema and types
-DROP TABLE IF EXISTS shots, blocks, practice_sessions, users CASCADE;
+DROP TABLE IF EXISTS schema_migrations, session_heatmaps, block_shot_summaries, revoked_tokens, token_cutoffs, deleted_data_version, user_stats, shots, blocks, practice_sessions, users CASCADE;
 DROP TYPE IF EXISTS shot_result, target_area;
+DROP SEQUENCE IF EXISTS data_version_seq;
+DROP FUNCTION IF EXISTS user_stats_on_user_insert, user_stats_on_session_insert, user_stats_on_blocks_change, user_stats_on_shots_change, user_stats_touch, user_stats_on_user_delete, rebuild_user_stats, ensure_shot_partitions, archive_shot_partitions, session_heatmaps_on_shots_change CASCADE;
 
 -- ENUM type for physical target locations
 CREATE TYPE target_area AS ENUM (
@@ -31,6 +33,9 @@ CREATE TABLE practice_sessions (
     FOREIGN KEY (UserID) REFERENCES users(UserID) ON DELETE CASCADE 
 );
 
+-- Newest-first session history per user (keyset pagination)
+CREATE INDEX practice_sessions_user_start_idx ON practice_sessions (UserID, SessionStart DESC, SessionID DESC);
+
 -- Blocks table
 CREATE TABLE blocks (
     BlockID SERIAL PRIMARY KEY,
@@ -48,6 +53,268 @@ CREATE TABLE shots (
     FOREIGN KEY (BlockID) REFERENCES blocks(BlockID) ON DELETE CASCADE
 );
 
+-- Access tokens revoked before they expire (logout). Rows past ExpiresAt
+-- are purged; the app keeps the live ones in memory.
+CREATE TABLE revoked_tokens (
+    TokenID VARCHAR(32) PRIMARY KEY,
+    ExpiresAt TIMESTAMPTZ NOT NULL
+);
+
+-- Tokens issued to a user before NotBefore are no longer accepted
+-- (set on password change and account removal).
+CREATE TABLE token_cutoffs (
+    UserID INT PRIMARY KEY,
+    NotBefore TIMESTAMPTZ NOT NULL
+);
+
+-- Change counter: every write that affects what a user's endpoints return
+-- stamps the user's row with the next value (used for ETags).
+CREATE SEQUENCE data_version_seq;
+
+-- Per-user running totals backing the leaderboard and the dashboard.
+-- Maintained by the triggers below; rebuild_user_stats() recomputes it from scratch.
+CREATE TABLE user_stats (
+    UserID INT PRIMARY KEY,
+    TotalPlanned INT NOT NULL DEFAULT 0,
+    TotalMade INT NOT NULL DEFAULT 0,
+    AccuracyPercent NUMERIC(5, 2) GENERATED ALWAYS AS (
+        ROUND(TotalMade * 100.0 / NULLIF(TotalPlanned, 0), 2)
+    ) STORED,
+    CurrentStreak INT NOT NULL DEFAULT 0,      -- consecutive practice days ending at LastPracticeDate
+    LastPracticeDate DATE,
+    LastSessionID INT,
+    LastSessionStart TIMESTAMP,
+    LastSessionPlanned INT NOT NULL DEFAULT 0,
+    LastSessionMade INT NOT NULL DEFAULT 0,
+    DataVersion BIGINT NOT NULL DEFAULT nextval('data_version_seq'),
+    FOREIGN KEY (UserID) REFERENCES users(UserID) ON DELETE CASCADE
+);
+
+-- One index per leaderboard sort key so each ordering (and every keyset page
+-- of it) is an index range scan. UserID is the final tiebreaker.
+CREATE INDEX user_stats_accuracy_idx ON user_stats (AccuracyPercent DESC, TotalMade DESC, UserID DESC) WHERE TotalPlanned > 0;
+CREATE INDEX user_stats_made_idx ON user_stats (TotalMade DESC, UserID DESC) WHERE TotalPlanned > 0;
+CREATE INDEX user_stats_planned_idx ON user_stats (TotalPlanned DESC, TotalMade DESC, UserID DESC) WHERE TotalPlanned > 0;
+CREATE INDEX user_stats_version_idx ON user_stats (DataVersion);
+
+CREATE FUNCTION user_stats_on_user_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO user_stats (UserID)
+    SELECT UserID FROM new_rows
+    ON CONFLICT (UserID) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Row-level: advances the streak and makes a newer session the "last session".
+-- A session backdated before LastPracticeDate leaves the streak alone;
+-- rebuild_user_stats() recomputes it exactly.
+CREATE FUNCTION user_stats_on_session_insert() RETURNS trigger AS $$
+DECLARE
+    new_day DATE := NEW.SessionStart::date;
+BEGIN
+    UPDATE user_stats
+    SET CurrentStreak = CASE
+            WHEN LastPracticeDate IS NULL OR new_day > LastPracticeDate + 1 THEN 1
+            WHEN new_day = LastPracticeDate + 1 THEN CurrentStreak + 1
+            ELSE CurrentStreak
+        END,
+        LastPracticeDate = GREATEST(LastPracticeDate, new_day),
+        LastSessionPlanned = CASE WHEN LastSessionStart IS NULL OR NEW.SessionStart >= LastSessionStart
+                                  THEN 0 ELSE LastSessionPlanned END,
+        LastSessionMade = CASE WHEN LastSessionStart IS NULL OR NEW.SessionStart >= LastSessionStart
+                               THEN 0 ELSE LastSessionMade END,
+        LastSessionID = CASE WHEN LastSessionStart IS NULL OR NEW.SessionStart >= LastSessionStart
+                             THEN NEW.SessionID ELSE LastSessionID END,
+        LastSessionStart = GREATEST(LastSessionStart, NEW.SessionStart),
+        DataVersion = nextval('data_version_seq')
+    WHERE UserID = NEW.UserID;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION user_stats_on_blocks_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE user_stats us
+        SET TotalPlanned = us.TotalPlanned + d.Planned,
+            LastSessionPlanned = us.LastSessionPlanned + d.LastPlanned,
+            DataVersion = nextval('data_version_seq')
+        FROM (SELECT ps.UserID,
+                     SUM(nr.ShotsPlanned) AS Planned,
+                     COALESCE(SUM(nr.ShotsPlanned) FILTER (WHERE ps.SessionID = cur.LastSessionID), 0) AS LastPlanned
+              FROM new_rows nr
+              JOIN practice_sessions ps ON nr.SessionID = ps.SessionID
+              JOIN user_stats cur ON cur.UserID = ps.UserID
+              GROUP BY ps.UserID) d
+        WHERE us.UserID = d.UserID;
+    ELSE
+        UPDATE user_stats us
+        SET TotalPlanned = us.TotalPlanned - d.Planned,
+            LastSessionPlanned = us.LastSessionPlanned - d.LastPlanned,
+            DataVersion = nextval('data_version_seq')
+        FROM (SELECT ps.UserID,
+                     SUM(orw.ShotsPlanned) AS Planned,
+                     COALESCE(SUM(orw.ShotsPlanned) FILTER (WHERE ps.SessionID = cur.LastSessionID), 0) AS LastPlanned
+              FROM old_rows orw
+              JOIN practice_sessions ps ON orw.SessionID = ps.SessionID
+              JOIN user_stats cur ON cur.UserID = ps.UserID
+              GROUP BY ps.UserID) d
+        WHERE us.UserID = d.UserID;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION user_stats_on_shots_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE user_stats us
+        SET TotalMade = us.TotalMade + d.Made,
+            LastSessionMade = us.LastSessionMade + d.LastMade,
+            DataVersion = nextval('data_version_seq')
+        FROM (SELECT ps.UserID,
+                     COUNT(*) AS Made,
+                     COUNT(*) FILTER (WHERE ps.SessionID = cur.LastSessionID) AS LastMade
+              FROM new_rows nr
+              JOIN blocks b ON nr.BlockID = b.BlockID
+              JOIN practice_sessions ps ON b.SessionID = ps.SessionID
+              JOIN user_stats cur ON cur.UserID = ps.UserID
+              GROUP BY ps.UserID) d
+        WHERE us.UserID = d.UserID;
+    ELSE
+        UPDATE user_stats us
+        SET TotalMade = us.TotalMade - d.Made,
+            LastSessionMade = us.LastSessionMade - d.LastMade,
+            DataVersion = nextval('data_version_seq')
+        FROM (SELECT ps.UserID,
+                     COUNT(*) AS Made,
+                     COUNT(*) FILTER (WHERE ps.SessionID = cur.LastSessionID) AS LastMade
+              FROM old_rows orw
+              JOIN blocks b ON orw.BlockID = b.BlockID
+              JOIN practice_sessions ps ON b.SessionID = ps.SessionID
+              JOIN user_stats cur ON cur.UserID = ps.UserID
+              GROUP BY ps.UserID) d
+        WHERE us.UserID = d.UserID;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Row-level: changes that do not touch the totals but are visible to clients
+-- (session end time, name/email on the leaderboard) still bump the version
+CREATE FUNCTION user_stats_touch() RETURNS trigger AS $$
+BEGIN
+    UPDATE user_stats SET DataVersion = nextval('data_version_seq') WHERE UserID = NEW.UserID;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Single row holding the version stamped by the latest user deletion, so the
+-- global version still moves when the user with the newest version is removed
+CREATE TABLE deleted_data_version (
+    Version BIGINT NOT NULL
+);
+INSERT INTO deleted_data_version VALUES (0);
+
+CREATE FUNCTION user_stats_on_user_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE deleted_data_version SET Version = nextval('data_version_seq');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level triggers: a multi-row insert updates each user once
+CREATE TRIGGER users_stats_insert AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_on_user_insert();
+CREATE TRIGGER sessions_stats_insert AFTER INSERT ON practice_sessions
+    FOR EACH ROW EXECUTE FUNCTION user_stats_on_session_insert();
+CREATE TRIGGER blocks_stats_insert AFTER INSERT ON blocks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_on_blocks_change();
+CREATE TRIGGER blocks_stats_delete AFTER DELETE ON blocks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_on_blocks_change();
+CREATE TRIGGER shots_stats_insert AFTER INSERT ON shots
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_on_shots_change();
+CREATE TRIGGER shots_stats_delete AFTER DELETE ON shots
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_on_shots_change();
+CREATE TRIGGER users_stats_delete AFTER DELETE ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_on_user_delete();
+CREATE TRIGGER users_stats_touch AFTER UPDATE OF FullName, Email ON users
+    FOR EACH ROW EXECUTE FUNCTION user_stats_touch();
+CREATE TRIGGER sessions_stats_touch AFTER UPDATE ON practice_sessions
+    FOR EACH ROW EXECUTE FUNCTION user_stats_touch();
+
+-- Recomputes user_stats from the raw tables (backfill / repair)
+CREATE FUNCTION rebuild_user_stats() RETURNS void AS $$
+BEGIN
+    INSERT INTO user_stats (UserID)
+    SELECT UserID FROM users
+    ON CONFLICT (UserID) DO NOTHING;
+
+    UPDATE user_stats us
+    SET TotalPlanned = COALESCE((
+            SELECT SUM(b.ShotsPlanned)
+            FROM practice_sessions ps JOIN blocks b ON ps.SessionID = b.SessionID
+            WHERE ps.UserID = us.UserID), 0),
+        TotalMade = COALESCE((
+            SELECT COUNT(s.ShotID)
+            FROM practice_sessions ps
+            JOIN blocks b ON ps.SessionID = b.SessionID
+            JOIN shots s ON b.BlockID = s.BlockID
+            WHERE ps.UserID = us.UserID), 0),
+        CurrentStreak = 0,
+        LastPracticeDate = NULL,
+        LastSessionID = NULL,
+        LastSessionStart = NULL,
+        LastSessionPlanned = 0,
+        LastSessionMade = 0,
+        DataVersion = nextval('data_version_seq');
+
+    -- Streak: length of the run of consecutive days ending at the latest practice day
+    WITH PracticeDays AS (
+        SELECT DISTINCT UserID, SessionStart::date AS practice_date
+        FROM practice_sessions
+    ),
+    Runs AS (
+        SELECT UserID, practice_date,
+               practice_date - (ROW_NUMBER() OVER (PARTITION BY UserID ORDER BY practice_date))::int AS run_id
+        FROM PracticeDays
+    ),
+    LatestRun AS (
+        SELECT DISTINCT ON (UserID) UserID, MAX(practice_date) AS last_day, COUNT(*) AS streak
+        FROM Runs
+        GROUP BY UserID, run_id
+        ORDER BY UserID, MAX(practice_date) DESC
+    )
+    UPDATE user_stats us
+    SET CurrentStreak = lr.streak,
+        LastPracticeDate = lr.last_day
+    FROM LatestRun lr
+    WHERE us.UserID = lr.UserID;
+
+    WITH LastSession AS (
+        SELECT DISTINCT ON (UserID) UserID, SessionID, SessionStart
+        FROM practice_sessions
+        ORDER BY UserID, SessionStart DESC, SessionID DESC
+    )
+    UPDATE user_stats us
+    SET LastSessionID = ls.SessionID,
+        LastSessionStart = ls.SessionStart,
+        LastSessionPlanned = COALESCE((
+            SELECT SUM(b.ShotsPlanned) FROM blocks b WHERE b.SessionID = ls.SessionID), 0),
+        LastSessionMade = COALESCE((
+            SELECT COUNT(s.ShotID) FROM blocks b JOIN shots s ON b.BlockID = s.BlockID
+            WHERE b.SessionID = ls.SessionID), 0)
+    FROM LastSession ls
+    WHERE us.UserID = ls.UserID;
+END;
+$$ LANGUAGE plpgsql;
+
 ---
 --- NEW TEST DATA ---
 ---
@@ -0,0 +1,253 @@
+import asyncio
+
+from api.async_db import exec_get_one, exec_get_all, exec_commit, exec_commit_returning, exec_stream
+from api.shot_buffer import get_shot_buffer
+from api.passwords import hash_password, check_password, password_needs_rehash, PasswordQueueFullError
+from api.cache import (get_cache, user_tag, session_tag, dashboard_tag, LEADERBOARD_TAG, invalidate_shots,
+                       invalidate_user)
+from api.heatmaps import heatmap_config, store_session_heatmap
+from api.live_sessions import publish_shots, end_live_session
+from api.active_sessions import get_active_sessions
+from api.accuaim_db import (
+    USER_SESSIONS_SQL, INSERT_SHOT_SQL, RECORD_SHOT_SQL, USER_BY_EMAIL_SQL, CREATE_USER_SQL, SESSION_DATA_SQL,
+    LOGIN_SQL, REHASH_SQL, CREATE_SESSION_SQL,
+    END_SESSION_SQL, DASHBOARD_SQL, USER_DATA_VERSION_SQL, GLOBAL_DATA_VERSION_SQL,
+    SESSIONS_PAGE_SIZE, LEADERBOARD_PAGE_SIZE, PASSWORD_BUSY_MESSAGE,
+    is_valid_email, _users_query, _sessions_page_query, _sessions_page, _session_data,
+    _session_summary, _leaderboard_query, _leaderboard_page, _dashboard_stats)
+
+# Coroutine versions of the accuaim_db functions behind the ASGI app
+# (server/asgi.py). They run the same statements through async_db, share the
+# cache keys and invalidation with the Flask app, and return the same values,
+# so both entry points can serve the same database side by side.
+#
+# bcrypt and the numpy heatmap binning stay blocking; they run in a worker
+# thread so the event loop keeps serving other requests meanwhile. So do the
+# cache, the active session store and live publishing, which are Redis round
+# trips with the redis backends.
+
+
+async def _cached(key, producer, tags=()):
+    # Async form of cache.cached(): producer is a coroutine function
+    cache = get_cache()
+    hit, value = await asyncio.to_thread(cache.get, key)
+    if hit:
+        return value
+    value = await producer()
+    await asyncio.to_thread(cache.set, key, value, tags)
+    return value
+
+
+def _shots_recorded(user_id, session_id, block_ids):
+    # Runs in a worker thread after a shot write, see _cached
+    invalidate_shots(user_id, session_id)
+    publish_shots(session_id, block_ids)
+
+
+def _session_created(user_id, new_session):
+    invalidate_user(user_id)
+    get_active_sessions().register(new_session[0], user_id,
+                                   [(block[0], block[2], block[3]) for block in new_session[4]])
+
+
+def _session_ended(user_id, session_id):
+    invalidate_user(user_id, leaderboard=False)
+    end_live_session(session_id)
+    store_session_heatmap(session_id, heatmap_config()['grid_size'])
+
+
+async def stream_all_users(email_contains=None, created_after=None, after_id=None, limit=None):
+    """
+    Yields users (without passwords) ordered by UserID, see
+    accuaim_db.stream_all_users.
+    """
+    sql, args = _users_query(email_contains, created_after, after_id, limit)
+    async for row in exec_stream(sql, args):
+        yield row
+
+
+async def create_user(email, full_name, password):
+    """
+    Creates a new user with a hashed password, see accuaim_db.create_user.
+    """
+    if not full_name:
+        return "Error: The full name cannot be empty."
+
+    if not is_valid_email(email):
+        return "Error: The entered email is not in the correct format."
+
+    if await exec_get_one(USER_BY_EMAIL_SQL, (email,)):
+        return "Error: An account with the entered email already exists."
+
+    try:
+        hashed_password = await asyncio.to_thread(hash_password, password)
+    except PasswordQueueFullError:
+        return PASSWORD_BUSY_MESSAGE
+
+    try:
+        await exec_commit(CREATE_USER_SQL, (email, full_name, hashed_password))
+        return f"User {full_name} created successfully."
+    except Exception as e:
+        return f"An error occurred while creating the user: {e}"
+
+
+async def login(email, password):
+    """
+    Verifies a user's credentials, see accuaim_db.login.
+
+    Raises:
+        PasswordQueueFullError: if the password workers are saturated
+    """
+    user = await exec_get_one(LOGIN_SQL, (email,))
+    if user and await asyncio.to_thread(check_password, password, user[3]):
+        if password_needs_rehash(user[3]):
+            try:
+                new_hash = await asyncio.to_thread(hash_password, password)
+                await exec_commit(REHASH_SQL, (new_hash, user[0]))
+            except Exception:
+                pass
+        return {"UserID": user[0], "email": user[1], "name": user[2]}
+    return None
+
+
+async def _user_version(user_id, version):
+    # Same versioned cache keys as accuaim_db._user_version
+    return await get_user_data_version(user_id) if version is None else version
+
+
+async def get_user_sessions(user_id, version=None):
+    """
+    Retrieves all sessions of a user, see accuaim_db.get_user_sessions.
+    """
+    version = await _user_version(user_id, version)
+    return await _cached(f"sessions:{user_id}:v{version}",
+                         lambda: exec_get_all(USER_SESSIONS_SQL, (user_id,)),
+                         tags=[user_tag(user_id)])
+
+
+async def get_user_sessions_page(user_id, before=None, limit=SESSIONS_PAGE_SIZE, version=None):
+    """
+    Retrieves one page of a user's sessions, newest first, see
+    accuaim_db.get_user_sessions_page.
+    """
+    query = _sessions_page_query(user_id, before, limit)
+    if "error" in query:
+        return query
+    limit = query['limit']
+
+    async def load():
+        return _sessions_page(await exec_get_all(query['sql'], query['args']), limit)
+
+    version = await _user_version(user_id, version)
+    return await _cached(f"sessions:{user_id}:v{version}:{before}:{limit}", load, tags=[user_tag(user_id)])
+
+
+async def create_session(user_id, blocks):
+    """
+    Adds a session and its blocks in one statement, see
+    accuaim_db.create_session.
+    """
+    new_session = await exec_commit_returning(CREATE_SESSION_SQL, {
+        'user_id': user_id,
+        'blocks': blocks,
+    })
+    if not new_session:
+        return "User does not exist"
+
+    await asyncio.to_thread(_session_created, user_id, new_session)
+    return new_session
+
+
+async def get_session_data(user_id, session_id, version=None):
+    """
+    Retrieves a session summary with per-block stats, see
+    accuaim_db.get_session_data.
+    """
+    active = await asyncio.to_thread(get_active_sessions().block_stats, session_id)
+    if active is not None and active[0] == user_id:
+        return _session_summary(session_id, active[1])
+
+    async def load():
+        rows = await exec_get_all(SESSION_DATA_SQL, {'session_id': session_id, 'user_id': user_id})
+        return _session_data(session_id, rows)
+
+    version = await _user_version(user_id, version)
+    return await _cached(f"session:{user_id}:{session_id}:v{version}", load,
+                         tags=[user_tag(user_id), session_tag(user_id, session_id)])
+
+
+async def record_new_shot(block_id, position_x=None, position_y=None):
+    """
+    Records a made shot, see accuaim_db.record_new_shot. In buffered mode the
+    shot joins the same write-behind buffer as the Flask app's shots.
+    """
+    buffer = get_shot_buffer()
+    if buffer is not None:
+        try:
+            buffer.add(block_id, position_x, position_y)
+            return "Made shot queued successfully."
+        except Exception as e:
+            return f"An error occurred while recording the shot: {e}"
+
+    try:
+        owner = await asyncio.to_thread(get_active_sessions().owner_of_block, block_id)
+        if owner:
+            await exec_commit(INSERT_SHOT_SQL, (block_id, position_x, position_y))
+        else:
+            owner = await exec_commit_returning(RECORD_SHOT_SQL, (block_id, position_x, position_y))
+        if owner:
+            await asyncio.to_thread(_shots_recorded, owner[0], owner[1], [block_id])
+        return "Made shot recorded successfully."
+    except Exception as e:
+        return f"An error occurred while recording the shot: {e}"
+
+
+async def update_session_end_time(SessionID):
+    """
+    Ends a session and stores its heatmap grid, see
+    accuaim_db.update_session_end_time.
+    """
+    owner = await exec_commit_returning(END_SESSION_SQL, (SessionID,))
+    if owner:
+        await asyncio.to_thread(_session_ended, owner[0], SessionID)
+    return "session updated correctly"
+
+
+async def get_leaderboard_page(sort_by='accuracy', after=None, limit=LEADERBOARD_PAGE_SIZE, version=None):
+    """
+    Retrieves one leaderboard page, see accuaim_db.get_leaderboard_page.
+    """
+    async def load():
+        query = _leaderboard_query(sort_by, after, limit)
+        if "error" in query:
+            return query
+        result = await exec_get_all(query['sql'], query['args'])
+        return _leaderboard_page(query['sort_by'], result, query['limit'])
+
+    if version is None:
+        version = await get_global_data_version()
+    return await _cached(f"leaderboard:v{version}:{sort_by}:{after}:{limit}", load, tags=[LEADERBOARD_TAG])
+
+
+async def get_user_dashboard_stats(user_id, version=None):
+    """
+    Retrieves the dashboard numbers, see accuaim_db.get_user_dashboard_stats.
+    """
+    async def load():
+        return _dashboard_stats(await exec_get_one(DASHBOARD_SQL, {'user_id': user_id}))
+
+    version = await _user_version(user_id, version)
+    return await _cached(f"dashboard:{user_id}:v{version}", load,
+                         tags=[user_tag(user_id), dashboard_tag(user_id)])
+
+
+async def get_user_data_version(user_id):
+    """Returns the user's change counter, see accuaim_db.get_user_data_version."""
+    result = await exec_get_one(USER_DATA_VERSION_SQL, (user_id,))
+    return result[0] if result else None
+
+
+async def get_global_data_version():
+    """Returns the cross-user change counter, see accuaim_db.get_global_data_version."""
+    result = await exec_get_one(GLOBAL_DATA_VERSION_SQL)
+    return result[0]
@@ -1,30 +1,139 @@
 from api.db_utils import *
+from api.shot_buffer import get_shot_buffer
+from api.passwords import (hash_password, check_password, password_needs_rehash,
+                           PasswordQueueFullError)
+from api.cache import (get_cache, cached, user_tag, session_tag, dashboard_tag, LEADERBOARD_TAG,
+                       invalidate_shots, invalidate_user, invalidate_leaderboard)
+from api.auth_tokens import revoke_user_tokens
+from api.migrate import migrate, migration_status
+from api.heatmaps import (heatmap_config, block_heatmap, session_heatmap, store_session_heatmap,
+                          user_heatmap)
+from api.live_sessions import publish_shots, end_live_session
+from api.active_sessions import get_active_sessions
 import re
-import bcrypt
+import json
+import base64
+from datetime import datetime, timezone
+from decimal import Decimal
+from psycopg2.extras import Json
 
 def rebuild_tables():
+    """
+    Drops and recreates the baseline schema with its sample data, then applies
+    every migration. Use migrate() alone to update a database in place.
+    """
     exec_sql_file('accuaim.sql')
+    migrate()
+    reset_prepared_statements()
+    get_cache().clear()
+    get_active_sessions().clear()
+
+USER_SESSIONS_SQL = prepared_statement('user_sessions', """
+    SELECT * 
+    FROM practice_sessions 
+    WHERE practice_sessions.UserID = %s;
+    """)
 
-def get_user_sessions(user_id):
+def _user_version(user_id, version):
+    # Cached entries are keyed by the data version the caller's ETag names, so
+    # a worker that missed an invalidation never sends an older body under it
+    return get_user_data_version(user_id) if version is None else version
+
+def get_user_sessions(user_id, version=None):
     """
     Gets all sessions under given user
 
     Args:
         user_id (int): The user id to fetch sessions for
+        version (int, optional): the user's data version, if already read
         
     Returns:
         list: a list of tuples containing session details
     """
+    version = _user_version(user_id, version)
+    result = cached(f"sessions:{user_id}:v{version}",
+                    lambda: exec_get_all(USER_SESSIONS_SQL, (user_id,)),
+                    tags=[user_tag(user_id)])
     
+    return result
+
+SESSIONS_PAGE_SIZE = 50
+MAX_SESSIONS_PAGE_SIZE = 500
+
+def get_user_sessions_page(user_id, before=None, limit=SESSIONS_PAGE_SIZE, version=None):
+    """
+    Gets one page of a user's sessions, newest first, using keyset pagination
+    on (SessionStart, SessionID) so every page is an index range scan.
+
+    Args:
+        user_id (int): The user id to fetch sessions for
+        before (str, optional): cursor returned with the previous page
+        limit (int): page size, capped at MAX_SESSIONS_PAGE_SIZE
+        version (int, optional): the user's data version, if already read
+
+    Returns:
+        dict: {'sessions': list of session tuples, 'next_cursor': str or None},
+            or {'error': str}
+    """
+    query = _sessions_page_query(user_id, before, limit)
+    if "error" in query:
+        return query
+    limit = query['limit']
+
+    def load():
+        return _sessions_page(exec_get_all(query['sql'], query['args']), limit)
+
+    version = _user_version(user_id, version)
+    return cached(f"sessions:{user_id}:v{version}:{before}:{limit}", load, tags=[user_tag(user_id)])
+
+def _sessions_page_query(user_id, before, limit):
+    # The statement and arguments for one page, shared with accuaim_async
+    limit = max(1, min(limit, MAX_SESSIONS_PAGE_SIZE))
+    args = {'user_id': user_id, 'limit': limit + 1}
+
+    keyset = ""
+    if before:
+        values = decode_cursor(before)
+        try:
+            args['before'] = (datetime.fromisoformat(values[0]), int(values[1]))
+        except (TypeError, ValueError, IndexError):
+            return {"error": "Error: Invalid sessions cursor."}
+        keyset = "AND (SessionStart, SessionID) < %(before)s"
+
+    sql = f"""
+    SELECT SessionID, UserID, SessionStart, SessionEnd
+    FROM practice_sessions
+    WHERE UserID = %(user_id)s {keyset}
+    ORDER BY SessionStart DESC, SessionID DESC
+    LIMIT %(limit)s;
+    """
+    return {'sql': sql, 'args': args, 'limit': limit}
+
+def _sessions_page(result, limit):
+    next_cursor = None
+    if len(result) > limit:
+        result = result[:limit]
+        next_cursor = encode_cursor([result[-1][2].isoformat(), result[-1][0]])
+    return {'sessions': result, 'next_cursor': next_cursor}
+
+def stream_user_sessions(user_id):
+    """
+    Yields all of a user's sessions, newest first, from a server-side cursor
+    so the full history is never held in memory.
+
+    Args:
+        user_id (int): The user id to fetch sessions for
+
+    Yields:
+        tuple: (SessionID, UserID, SessionStart, SessionEnd)
+    """
     sql = """
-    SELECT * 
-    FROM practice_sessions 
-    WHERE practice_sessions.UserID = %s;
+    SELECT SessionID, UserID, SessionStart, SessionEnd
+    FROM practice_sessions
+    WHERE UserID = %s
+    ORDER BY SessionStart DESC, SessionID DESC;
     """
-    
-    result = exec_get_all(sql, (user_id,))
-    
-    return result
+    yield from exec_stream(sql, (user_id,))
     
     
     
@@ -40,8 +149,7 @@ def get_session_shots(session_id):
     """
     # THE FIX is in the ORDER BY clause below
     sql = """
-    SELECT s.ShotID, s.BlockID, s.ShotTime, s.ShotPositionX, s.ShotPositionY, s.Result, 
-           b.TargetArea
+    SELECT s.ShotID, s.BlockID, s.ShotTime, b.TargetArea, s.ShotPositionX, s.ShotPositionY
     FROM shots s
     JOIN blocks b ON s.BlockID = b.BlockID
     WHERE b.SessionID = %s
@@ -55,31 +163,68 @@ def get_session_shots(session_id):
             'ShotID': shot[0],
             'BlockID': shot[1],
             'ShotTime': shot[2],
-            'ShotPositionX': shot[3],
-            'ShotPositionY': shot[4],
-            'Result': shot[5],
-            'TargetArea': shot[6]
+            'TargetArea': shot[3],
+            'ShotPositionX': shot[4],
+            'ShotPositionY': shot[5]
         }
         for shot in result
     ]
 
-def get_block_made_shots(block_id):
+SHOT_COLUMNS = ('ShotID', 'BlockID', 'ShotTime', 'TargetArea', 'ShotPositionX', 'ShotPositionY')
+
+def get_session_shot_columns(session_id, user_id=None):
     """
-    Gets all made shots for a given block ID from the database.
+    Gets the same shots as get_session_shots in column-oriented form: one
+    list per field, built by the database with array_agg, so no per-shot
+    objects are created. ShotTime is given as epoch milliseconds.
 
     Args:
-        block_id (int): The block ID to fetch made shots for.
+        session_id (int): The session ID to fetch shots for.
+        user_id (int, optional): only return shots if the session belongs to this user
 
     Returns:
-        list: A list of dictionaries containing made shot details.
+        dict: field name -> list of values (empty lists when there are no shots),
+        or None if user_id is given and does not own the session
     """
-    sql = """
+    owner = "AND ps.UserID = %(user_id)s" if user_id is not None else ""
+    sql = f"""
+    SELECT
+        COALESCE(array_agg(s.ShotID ORDER BY b.BlockID, s.ShotTime) FILTER (WHERE s.ShotID IS NOT NULL), '{{}}'),
+        COALESCE(array_agg(s.BlockID ORDER BY b.BlockID, s.ShotTime) FILTER (WHERE s.ShotID IS NOT NULL), '{{}}'),
+        COALESCE(array_agg((EXTRACT(EPOCH FROM s.ShotTime) * 1000)::bigint ORDER BY b.BlockID, s.ShotTime)
+                 FILTER (WHERE s.ShotID IS NOT NULL), '{{}}'),
+        COALESCE(array_agg(b.TargetArea::text ORDER BY b.BlockID, s.ShotTime) FILTER (WHERE s.ShotID IS NOT NULL), '{{}}'),
+        COALESCE(array_agg(s.ShotPositionX ORDER BY b.BlockID, s.ShotTime) FILTER (WHERE s.ShotID IS NOT NULL), '{{}}'),
+        COALESCE(array_agg(s.ShotPositionY ORDER BY b.BlockID, s.ShotTime) FILTER (WHERE s.ShotID IS NOT NULL), '{{}}')
+    FROM practice_sessions ps
+    LEFT JOIN blocks b ON b.SessionID = ps.SessionID
+    LEFT JOIN shots s ON s.BlockID = b.BlockID
+    WHERE ps.SessionID = %(session_id)s {owner}
+    GROUP BY ps.SessionID;
+    """
+    result = exec_get_one(sql, {'session_id': session_id, 'user_id': user_id})
+    if result is None:
+        return None if user_id is not None else {column: [] for column in SHOT_COLUMNS}
+    return dict(zip(SHOT_COLUMNS, result))
+
+BLOCK_MADE_SHOTS_SQL = """
     SELECT ShotID, BlockID, ShotTime, ShotPositionX, ShotPositionY, Result
     FROM shots
     WHERE BlockID = %s AND Result = 'Made'
     ORDER BY ShotTime;
     """
-    result = exec_get_all(sql, (block_id,))
+
+def get_block_made_shots(block_id):
+    """
+    Gets all made shots for a given block ID from the database.
+
+    Args:
+        block_id (int): The block ID to fetch made shots for.
+
+    Returns:
+        list: A list of dictionaries containing made shot details.
+    """
+    result = exec_get_all(BLOCK_MADE_SHOTS_SQL, (block_id,))
     return [
         {
             'ShotID': shot[0],
@@ -92,17 +237,158 @@ def get_block_made_shots(block_id):
         for shot in result
     ]
 
-def record_new_shot(block_id):
+INSERT_SHOT_SQL = prepared_statement('insert_shot', "INSERT INTO shots (BlockID, ShotPositionX, ShotPositionY) VALUES (%s, %s, %s)")
+
+RECORD_SHOT_SQL = prepared_statement('record_shot', """
+    WITH new_shot AS (
+        INSERT INTO shots (BlockID, ShotPositionX, ShotPositionY) VALUES (%s, %s, %s)
+        RETURNING BlockID
+    )
+    SELECT ps.UserID, ps.SessionID
+    FROM new_shot ns
+    JOIN blocks b ON ns.BlockID = b.BlockID
+    JOIN practice_sessions ps ON b.SessionID = ps.SessionID;
+    """)
+
+def record_new_shot(block_id, position_x=None, position_y=None):
     """
     Records a new MADE shot in the database for a given block.
     The existence of a row in the 'shots' table signifies a made shot.
-    """
-    sql = "INSERT INTO shots (BlockID) VALUES (%s);"
+    position_x/position_y optionally give where it hit, as fractions (0-1)
+    of the target's width and height.
+
+    When shot_buffer.mode is 'buffered' in db.yml the shot is queued and
+    written with the next group commit, so reads may lag by up to one
+    flush interval. Shots of a tracked active session are plain inserts;
+    their owner comes from the active session store.
+    """
+    buffer = get_shot_buffer()
+    if buffer is not None:
+        try:
+            buffer.add(block_id, position_x, position_y)
+            return "Made shot queued successfully."
+        except Exception as e:
+            return f"An error occurred while recording the shot: {e}"
+
     try:
-        exec_commit(sql, (block_id,))
+        owner = get_active_sessions().owner_of_block(block_id)
+        if owner:
+            exec_commit(INSERT_SHOT_SQL, (block_id, position_x, position_y))
+        else:
+            owner = exec_commit_returning(RECORD_SHOT_SQL, (block_id, position_x, position_y))
+        if owner:
+            invalidate_shots(owner[0], owner[1])
+            publish_shots(owner[1], [block_id])
         return "Made shot recorded successfully."
     except Exception as e:
         return f"An error occurred while recording the shot: {e}"
+
+MAX_SHOT_BATCH = 1000
+
+def _parse_shot(shot, session_blocks):
+    """
+    Validates one entry of a shot batch.
+
+    Returns:
+        tuple: (row, error) where row is (BlockID, ShotTime, ShotPositionX,
+            ShotPositionY) and error is None,
+            or row is None and error describes why the shot was rejected
+    """
+    if not isinstance(shot, dict):
+        return None, "Shot must be an object."
+
+    block_id = shot.get('block_id')
+    if not isinstance(block_id, int) or isinstance(block_id, bool):
+        return None, "block_id must be an integer."
+    if block_id not in session_blocks:
+        return None, f"Block {block_id} does not belong to this session."
+
+    shot_time = shot.get('timestamp')
+    if shot_time is not None:
+        try:
+            shot_time = datetime.fromisoformat(shot_time)
+        except (TypeError, ValueError):
+            return None, "timestamp must be an ISO 8601 string."
+        # ShotTime has no time zone and holds UTC; casting an aware value to
+        # timestamp would drop its offset instead of converting it
+        if shot_time.tzinfo is not None:
+            shot_time = shot_time.astimezone(timezone.utc).replace(tzinfo=None)
+
+    position = []
+    for key in ('position_x', 'position_y'):
+        value = shot.get(key)
+        if value is not None:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return None, f"{key} must be a number."
+            if not 0 <= value <= 1:
+                return None, f"{key} must be between 0 and 1."
+        position.append(value)
+
+    return (block_id, shot_time, position[0], position[1]), None
+
+def record_new_shots(user_id, session_id, shots):
+    """
+    Records a batch of MADE shots for a session with a single multi-row INSERT.
+    Block ownership is checked once for the whole batch; invalid entries are
+    rejected individually without failing the rest of the batch.
+
+    Args:
+        user_id (int): The user who owns the session.
+        session_id (int): The session the shots belong to.
+        shots (list): dicts with 'block_id', optional ISO 8601 'timestamp'
+            (defaults to now; one with an offset is stored in UTC) and optional 'position_x'/'position_y'
+            (fractions 0-1 of the target's width and height).
+
+    Returns:
+        dict: {'accepted': int, 'rejected': int, 'results': list} where results
+            has one entry per input shot, or {'error': str}
+    """
+    if not isinstance(shots, list) or not shots:
+        return {"error": "Error: 'shots' must be a non-empty list."}
+    if len(shots) > MAX_SHOT_BATCH:
+        return {"error": f"Error: At most {MAX_SHOT_BATCH} shots can be recorded per request."}
+
+    ownership_sql = """
+    SELECT b.BlockID
+    FROM blocks b
+    JOIN practice_sessions ps ON b.SessionID = ps.SessionID
+    WHERE ps.SessionID = %s AND ps.UserID = %s;
+    """
+    session_blocks = {row[0] for row in exec_get_all(ownership_sql, (session_id, user_id))}
+    if not session_blocks:
+        return {"error": "This session does not belong to the user or does not exist."}
+
+    results = []
+    rows = []
+    row_indexes = []
+    for index, shot in enumerate(shots):
+        row, error = _parse_shot(shot, session_blocks)
+        if error:
+            results.append({'index': index, 'accepted': False, 'error': error})
+        else:
+            results.append({'index': index, 'accepted': True})
+            rows.append(row)
+            row_indexes.append(index)
+
+    sql = """
+    INSERT INTO shots (BlockID, ShotTime, ShotPositionX, ShotPositionY) VALUES %s
+    RETURNING ShotID"""
+    try:
+        inserted = exec_insert_many(sql, rows, template="(%s, COALESCE(%s::timestamp, CURRENT_TIMESTAMP), %s, %s)")
+    except Exception as e:
+        return {"error": f"An error occurred while recording the shots: {e}"}
+
+    for index, row in zip(row_indexes, inserted):
+        results[index]['ShotID'] = row[0]
+    if inserted:
+        invalidate_shots(user_id, session_id)
+        publish_shots(session_id, [row[0] for row in rows])
+
+    return {
+        'accepted': len(rows),
+        'rejected': len(shots) - len(rows),
+        'results': results,
+    }
     
 def calculate_block_accuracy(block_id):
     """
@@ -126,36 +412,44 @@ def calculate_block_accuracy(block_id):
 def reorder_shots(session_id):
     """
     Reorders the ShotIDs for a given session to maintain a continuous sequence.
+    The session's shots take fresh IDs from shots_shotid_seq in their current
+    order, in one UPDATE. IDs are global across sessions, so renumbering from
+    1 would collide with (or, on the partitioned table, silently duplicate)
+    the IDs of other sessions.
     
     Args:
         session_id (int): The session ID to reorder shots for.
     
     Returns:
-        str: Success or error message.
+        str: Success message, or a note that the session has no shots.
+
+    Raises:
+        psycopg2.Error: if the UPDATE fails; no shot is renumbered then
     """
-    # Fetch all shots for the session, ordered by ShotID
     sql = """
-        SELECT s.ShotID FROM shots s
-        JOIN blocks b ON s.BlockID = b.BlockID
-        WHERE b.SessionID = %s
-        ORDER BY s.ShotID;
-        """
-    shots = exec_get_all(sql, (session_id,))
-    
-    # If there are shots to reorder
-    if not shots:
+    WITH numbered AS (
+        SELECT ordered.ShotID, ordered.BlockID, ordered.ShotTime,
+               nextval('shots_shotid_seq') AS NewID
+        FROM (
+            SELECT s.ShotID, s.BlockID, s.ShotTime
+            FROM shots s
+            JOIN blocks b ON s.BlockID = b.BlockID
+            WHERE b.SessionID = %s
+            ORDER BY s.ShotID
+        ) ordered
+    ),
+    moved AS (
+        UPDATE shots s
+        SET ShotID = n.NewID
+        FROM numbered n
+        WHERE s.ShotID = n.ShotID AND s.BlockID = n.BlockID AND s.ShotTime = n.ShotTime
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM moved;
+    """
+    if exec_commit_returning(sql, (session_id,))[0] == 0:
         return "No shots found in this session."
-
-    # Reorder ShotIDs starting from 1, sequentially
-    try:
-        for index, shot in enumerate(shots, start=1):
-            shot_id = shot[0]
-            update_sql = "UPDATE shots SET ShotID = %s WHERE ShotID = %s"
-            exec_commit(update_sql, (index, shot_id))
-        
-        return "Shots reordered successfully."
-    except Exception as e:
-        return f"An error occurred while reordering shots: {e}"
+    return "Shots reordered successfully."
 
 
 def remove_shot(user_id, shot_id):
@@ -169,27 +463,28 @@ def remove_shot(user_id, shot_id):
     Returns:
         str: Success or error message.
     """
-    # Verify that the shot belongs to a block in a session owned by the user
-    ownership_sql = """
-    SELECT s.ShotID
-    FROM shots s
-    JOIN blocks b ON s.BlockID = b.BlockID
-    JOIN practice_sessions ps ON b.SessionID = ps.SessionID
-    WHERE s.ShotID = %s AND ps.UserID = %s;
+    # Deletes only if the shot is in a session owned by the user, in one statement
+    sql = """
+    DELETE FROM shots s
+    USING blocks b, practice_sessions ps
+    WHERE s.ShotID = %s
+      AND s.BlockID = b.BlockID
+      AND b.SessionID = ps.SessionID
+      AND ps.UserID = %s
+    RETURNING b.SessionID, s.BlockID;
     """
-    
-    shot_exists = exec_get_one(ownership_sql, (shot_id, user_id))
-    
-    if not shot_exists:
-        return "Error: Shot not found or you don't have permission to remove it."
-    
     try:
-        remove_sql = "DELETE FROM shots WHERE ShotID = %s"
-        exec_commit(remove_sql, (shot_id,))
-        return "Shot successfully removed."
+        removed = exec_commit_returning(sql, (shot_id, user_id))
     except Exception as e:
         return f"An error occurred while trying to remove the shot: {e}"
 
+    if not removed:
+        return "Error: Shot not found or you don't have permission to remove it."
+
+    invalidate_shots(user_id, removed[0])
+    publish_shots(removed[0], [removed[1]], delta=-1)
+    return "Shot successfully removed."
+
 def get_all_users():
     """
     retrieves all users from the database
@@ -206,6 +501,57 @@ def get_all_users():
     
     return results
 
+def _like_pattern(text):
+    # Escapes LIKE wildcards so user input is matched literally as a substring
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped.lower()}%"
+
+MAX_USERS_PAGE_SIZE = 1000
+
+def stream_all_users(email_contains=None, created_after=None, after_id=None, limit=None):
+    """
+    Yields users (without passwords) ordered by UserID from a server-side
+    cursor, optionally filtered and paginated, so memory stays flat however
+    large the table grows. At most MAX_USERS_PAGE_SIZE users per call; page
+    through the rest with after_id.
+
+    Args:
+        email_contains (str, optional): case-insensitive substring of the email
+        created_after (datetime, optional): only users created after this time
+        after_id (int, optional): only users with a larger UserID (pagination)
+        limit (int, optional): maximum number of users to yield, capped at
+            MAX_USERS_PAGE_SIZE (the default)
+
+    Yields:
+        tuple: (UserID, Email, FullName, CreatedAt)
+    """
+    sql, args = _users_query(email_contains, created_after, after_id, limit)
+    yield from exec_stream(sql, args)
+
+def _users_query(email_contains, created_after, after_id, limit):
+    # The filtered listing statement, shared with accuaim_async
+    limit = MAX_USERS_PAGE_SIZE if limit is None else max(1, min(limit, MAX_USERS_PAGE_SIZE))
+    conditions = []
+    args = {}
+    if email_contains:
+        conditions.append("LOWER(Email) LIKE %(email)s")
+        args['email'] = _like_pattern(email_contains)
+    if created_after is not None:
+        conditions.append("CreatedAt > %(created_after)s")
+        args['created_after'] = created_after
+    if after_id is not None:
+        conditions.append("UserID > %(after_id)s")
+        args['after_id'] = after_id
+
+    sql = f"""
+    SELECT UserID, Email, FullName, CreatedAt
+    FROM users
+    {"WHERE " + " AND ".join(conditions) if conditions else ""}
+    ORDER BY UserID
+    LIMIT %(limit)s"""
+    args['limit'] = limit
+    return sql, args
+
 def get_user(UserID):
     """
     Retrieves a users information using given UserID
@@ -227,6 +573,17 @@ def get_user(UserID):
         return result
     return "User does not exist"
     
+PASSWORD_BUSY_MESSAGE = "Error: The server is busy, please try again shortly."
+
+USER_BY_EMAIL_SQL = prepared_statement('user_by_email', """
+    SELECT * FROM users WHERE LOWER(Email) = LOWER(%s)
+    """)
+
+CREATE_USER_SQL = prepared_statement('create_user', """
+    INSERT INTO users (Email, FullName, PasswordHash)
+    VALUES (%s, %s, %s);
+    """)
+
 def create_user(email, full_name, password):
     """
     Creates a new user in the users table with a hashed password.
@@ -245,34 +602,34 @@ def create_user(email, full_name, password):
     if not is_valid_email(email):
         return "Error: The entered email is not in the correct format."
     
-    sql_check = """
-    SELECT * FROM users WHERE LOWER(Email) = LOWER(%s)
-    """
-    
-    user_exists = exec_get_one(sql_check, (email,))
+    user_exists = exec_get_one(USER_BY_EMAIL_SQL, (email,))
     
     if user_exists:
         return "Error: An account with the entered email already exists."
     
-    # Hash the password using bcrypt
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
+    # Hash the password using bcrypt (on the password worker pool)
+    try:
+        hashed_password = hash_password(password)
+    except PasswordQueueFullError:
+        return PASSWORD_BUSY_MESSAGE
     
-    sql = """
-    INSERT INTO users (Email, FullName, PasswordHash)
-    VALUES (%s, %s, %s);
-    """
     try:
-        exec_commit(sql, (email, full_name, hashed_password.decode('utf-8')))
+        exec_commit(CREATE_USER_SQL, (email, full_name, hashed_password))
         return f"User {full_name} created successfully."
     except Exception as e:
         return f"An error occurred while creating the user: {e}"
 
     
-def remove_user(user_id, password):
+def remove_user(user_id, password=None, authenticated=False):
     """
     Removes a user from the users table. Associated records are
     deleted automatically by the database via ON DELETE CASCADE.
+
+    Args:
+        user_id (int): The user to remove
+        password (str): The user's password, checked unless authenticated
+        authenticated (bool): True when the caller already verified an
+            access token for this user, so bcrypt is skipped
     """
     # First, check if the user exists and the password is correct
     sql_check = "SELECT UserID, PasswordHash FROM users WHERE UserID = %s"
@@ -282,14 +639,21 @@ def remove_user(user_id, password):
         return "Error: User not found."
     
     # Verify password
-    if not bcrypt.checkpw(password.encode('utf-8'), user[1].encode('utf-8')):
-        return "Error: Incorrect password."
+    if not authenticated:
+        try:
+            if password is None or not check_password(password, user[1]):
+                return "Error: Incorrect password."
+        except PasswordQueueFullError:
+            return PASSWORD_BUSY_MESSAGE
 
     # With ON DELETE CASCADE, you only need to delete the user.
     # The database will handle deleting all related sessions, blocks, and shots.
     sql_delete_user = "DELETE FROM users WHERE UserID = %s"
     try:
         exec_commit(sql_delete_user, (user_id,))
+        invalidate_user(user_id)
+        get_active_sessions().evict_user(user_id)
+        revoke_user_tokens(user_id)
         return f"User with ID {user_id} and all associated records removed successfully."
     except Exception as e:
         return f"An error occurred while removing the user: {e}"
@@ -375,6 +739,7 @@ def update_user(user_id, new_name, new_email):
             WHERE UserID = %s
         """
         exec_commit(sql, (new_name, new_email, user_id))
+        invalidate_leaderboard()
                 
         return f"User successfully updated: Name = {new_name}, Email = {new_email}"
     except Exception as e:
@@ -404,6 +769,11 @@ def get_user_by_email(email):
         return {"UserID": user[0], "name": user[1], "email": user[2]}
     
     return None  # Return None if no user is found
+SESSION_BLOCKS_SQL = """
+    SELECT *
+    FROM blocks
+    WHERE SessionID = %s"""
+
 def get_session_blocks(session_id):
     """_summary_
     Retrives raw block data for all blocks under given session
@@ -414,31 +784,77 @@ def get_session_blocks(session_id):
     Returns:
         list: a list containing all blocks and their relevant data
     """
-    sql = """
-    SELECT *
-    FROM blocks
-    WHERE SessionID = %s"""
-    
-    session_blocks = exec_get_all(sql, (session_id,))
+    session_blocks = exec_get_all(SESSION_BLOCKS_SQL, (session_id,))
     
     return session_blocks
 
 # In accuaim_db.py
 
-def get_session_data(user_id, session_id):
+def get_session_data(user_id, session_id, version=None):
     """
     Retrieves important session data. Now includes block_stats for the new UI.
-    """
-    # ... (ownership check remains the same)
-    sql_check = "SELECT * FROM practice_sessions WHERE SessionID = %s AND UserID = %s;"
-    session_exists = exec_get_one(sql_check, (session_id, user_id))
-    
-    if not session_exists:
-        return {"error": "This session does not belong to the user or does not exist."}
-    
-    # This is the function that correctly calculates all block stats
-    block_stats = get_session_block_stats(session_id)
-    
+    Active sessions are answered from their in-memory counters; others are
+    cached until shots in the session change. version is the user's data
+    version, if the caller already read it.
+    """
+    active = get_active_sessions().block_stats(session_id)
+    if active is not None and active[0] == user_id:
+        return _session_summary(session_id, active[1])
+    version = _user_version(user_id, version)
+    return cached(f"session:{user_id}:{session_id}:v{version}",
+                  lambda: _load_session_data(user_id, session_id),
+                  tags=[user_tag(user_id), session_tag(user_id, session_id)])
+
+SESSION_OWNER_SQL = "SELECT * FROM practice_sessions WHERE SessionID = %s AND UserID = %s;"
+
+SESSION_NOT_FOUND = "This session does not belong to the user or does not exist."
+
+# Ownership check, per-block stats and session totals in one round trip: one
+# row per block plus a grand-total row (is_total), each carrying whether the
+# session belongs to the user. A session that is not the user's yields only
+# the total row, with owned false.
+SESSION_DATA_SQL = prepared_statement('session_data', """
+    WITH owned AS (
+        SELECT SessionID FROM practice_sessions
+        WHERE SessionID = %(session_id)s AND UserID = %(user_id)s
+    ),
+    block_stats AS (
+        SELECT
+            b.BlockID,
+            b.TargetArea,
+            b.ShotsPlanned,
+            COUNT(s.ShotID) + COALESCE(bs.MadeShots, 0) AS MadeShots
+        FROM owned o
+        JOIN blocks b ON b.SessionID = o.SessionID
+        LEFT JOIN shots s ON b.BlockID = s.BlockID
+        LEFT JOIN block_shot_summaries bs ON b.BlockID = bs.BlockID
+        GROUP BY b.BlockID, b.TargetArea, b.ShotsPlanned, bs.MadeShots
+    )
+    SELECT
+        EXISTS (SELECT 1 FROM owned) AS owned,
+        GROUPING(BlockID) = 1 AS is_total,
+        BlockID,
+        TargetArea,
+        COALESCE(SUM(ShotsPlanned), 0)::int AS ShotsPlanned,
+        COALESCE(SUM(MadeShots), 0)::int AS MadeShots
+    FROM block_stats
+    GROUP BY GROUPING SETS ((BlockID, TargetArea), ())
+    ORDER BY is_total, BlockID;
+    """)
+
+def _load_session_data(user_id, session_id):
+    rows = exec_get_all(SESSION_DATA_SQL, {'session_id': session_id, 'user_id': user_id})
+    return _session_data(session_id, rows)
+
+def _session_data(session_id, rows):
+    # Shapes the SESSION_DATA_SQL rows, shared with accuaim_async
+    if not rows or not rows[0][0]:
+        return {"error": SESSION_NOT_FOUND}
+    block_stats = _block_stats([row[2:] for row in rows if not row[1]])
+    total = rows[-1]
+    return _session_totals(session_id, block_stats, total[4], total[5])
+
+def _session_summary(session_id, block_stats):
     # Initialize counters
     made_shots_count = 0
     total_planned_shots = 0
@@ -447,7 +863,10 @@ def get_session_data(user_id, session_id):
     for block in block_stats:
        total_planned_shots += block['ShotsPlanned']
        made_shots_count += block['MadeShots']
-    
+
+    return _session_totals(session_id, block_stats, total_planned_shots, made_shots_count)
+
+def _session_totals(session_id, block_stats, total_planned_shots, made_shots_count):
     # Calculate derived stats
     missed_shots_count = total_planned_shots - made_shots_count
     shooting_percentage = (made_shots_count / total_planned_shots * 100) if total_planned_shots > 0 else 0.0
@@ -464,8 +883,13 @@ def get_session_data(user_id, session_id):
     }
     
     return session_data
-    
-    return session_data
+
+LOGIN_SQL = prepared_statement('login', """
+    SELECT UserID, Email, FullName, PasswordHash
+    FROM users
+    WHERE LOWER(Email) = LOWER(%s)
+    """)
+
 def login(email, password):
     """
     Verifies a user's credentials.
@@ -476,26 +900,40 @@ def login(email, password):
 
     Returns:
         dict: User information if verified, None if not
+
+    Raises:
+        PasswordQueueFullError: if the password workers are saturated
     """
-    sql = """
-    SELECT UserID, Email, FullName, PasswordHash
-    FROM users
-    WHERE LOWER(Email) = LOWER(%s)
-    """
-    
-    user = exec_get_one(sql, (email,))
-    if user and bcrypt.checkpw(password.encode('utf-8'), user[3].encode('utf-8')):
+    user = exec_get_one(LOGIN_SQL, (email,))
+    if user and check_password(password, user[3]):
+        if password_needs_rehash(user[3]):
+            _rehash_password(user[0], password)
         return {"UserID": user[0], "email": user[1],"name": user[2]}
     return None
 
-def change_password(UserID, current_password, new_password):
+REHASH_SQL = prepared_statement('rehash_password', "UPDATE users SET PasswordHash = %s WHERE UserID = %s")
+
+def _rehash_password(user_id, password):
+    """
+    Re-hashes a verified password with the current cost factor. Failures are
+    ignored: the old hash still works and the next login will retry.
+    """
+    try:
+        new_hash = hash_password(password)
+        exec_commit(REHASH_SQL, (new_hash, user_id))
+    except Exception:
+        pass
+
+def change_password(UserID, current_password, new_password, authenticated=False):
     """
-    Changes a user's password.
+    Changes a user's password. Tokens issued before the change stop working.
 
     Args:
         user_id (int): The user's ID
-        current_password (str): The current password
+        current_password (str): The current password, checked unless authenticated
         new_password (str): The new password to set
+        authenticated (bool): True when the caller already verified an
+            access token for this user, so only the new password is hashed
 
     Returns:
         str: Success or error message
@@ -512,14 +950,16 @@ def change_password(UserID, current_password, new_password):
     if not user:
         return "Error: User not found."
         
-    # Verify current password
-    if not bcrypt.checkpw(current_password.encode('utf-8'), 
-                        user[0].encode('utf-8')):
-        return "Error: Current password is incorrect."
-        
-    # Hash and set new password
-    salt = bcrypt.gensalt()
-    new_hash = bcrypt.hashpw(new_password.encode('utf-8'), salt)
+    try:
+        # Verify current password
+        if not authenticated and (current_password is None
+                                  or not check_password(current_password, user[0])):
+            return "Error: Current password is incorrect."
+            
+        # Hash and set new password
+        new_hash = hash_password(new_password)
+    except PasswordQueueFullError:
+        return PASSWORD_BUSY_MESSAGE
     
     update_sql = """
     UPDATE users
@@ -528,7 +968,8 @@ def change_password(UserID, current_password, new_password):
     """
     
     try:
-        exec_commit(update_sql, (new_hash.decode('utf-8'), UserID))
+        exec_commit(update_sql, (new_hash, UserID))
+        revoke_user_tokens(UserID)
         return "Password successfully updated."
     except Exception as e:
         return f"An error occurred while updating the password: {e}"
@@ -549,6 +990,42 @@ def get_all_blocks():
     
     return result
 
+def stream_all_blocks(session_id=None, target_area=None, after_id=None, limit=None):
+    """
+    Yields blocks ordered by BlockID from a server-side cursor, optionally
+    filtered and paginated, so memory stays flat however large the table grows.
+
+    Args:
+        session_id (int, optional): only blocks of this session
+        target_area (str, optional): only blocks aimed at this target area
+        after_id (int, optional): only blocks with a larger BlockID (pagination)
+        limit (int, optional): maximum number of blocks to yield
+
+    Yields:
+        tuple: (BlockID, SessionID, TargetArea, ShotsPlanned)
+    """
+    conditions = []
+    args = {}
+    if session_id is not None:
+        conditions.append("SessionID = %(session_id)s")
+        args['session_id'] = session_id
+    if target_area:
+        conditions.append("TargetArea::text = %(target_area)s")
+        args['target_area'] = target_area
+    if after_id is not None:
+        conditions.append("BlockID > %(after_id)s")
+        args['after_id'] = after_id
+
+    sql = f"""
+    SELECT BlockID, SessionID, TargetArea, ShotsPlanned
+    FROM blocks
+    {"WHERE " + " AND ".join(conditions) if conditions else ""}
+    ORDER BY BlockID
+    {"LIMIT %(limit)s" if limit is not None else ""}"""
+    args['limit'] = limit
+    
+    yield from exec_stream(sql, args)
+
 def get_block_shots(block_id):
     """
     Gets all made shots for a given block ID from the database.
@@ -568,25 +1045,30 @@ def get_block_shots(block_id):
         }
         for shot in result
     ]
-def get_session_block_stats(session_id):
-    """
-    Gets shooting statistics for each block in a session.
-    Missed shots are now calculated (ShotsPlanned - MadeShots).
-    """
-    sql = """
+SESSION_BLOCK_STATS_SQL = prepared_statement('session_block_stats', """
     SELECT 
         b.BlockID,
         b.TargetArea,
         b.ShotsPlanned,
-        COUNT(s.ShotID) as MadeShots
+        COUNT(s.ShotID) + COALESCE(bs.MadeShots, 0) as MadeShots
     FROM blocks b
     LEFT JOIN shots s ON b.BlockID = s.BlockID
+    LEFT JOIN block_shot_summaries bs ON b.BlockID = bs.BlockID
     WHERE b.SessionID = %s
-    GROUP BY b.BlockID, b.TargetArea, b.ShotsPlanned
+    GROUP BY b.BlockID, b.TargetArea, b.ShotsPlanned, bs.MadeShots
     ORDER BY b.BlockID;
+    """)
+
+def get_session_block_stats(session_id):
     """
-    result = exec_get_all(sql, (session_id,))
-    
+    Gets shooting statistics for each block in a session.
+    Missed shots are now calculated (ShotsPlanned - MadeShots).
+    Made shots include those already rolled into block_shot_summaries.
+    """
+    result = exec_get_all(SESSION_BLOCK_STATS_SQL, (session_id,))
+    return _block_stats(result)
+
+def _block_stats(result):
     # Calculate missed shots in Python
     return [
         {
@@ -601,51 +1083,85 @@ def get_session_block_stats(session_id):
 
 def add_blocks(blocks, session_id):
     """
-    Adds given blocks to database 
+    Adds given blocks to database in a single multi-row INSERT
 
     Args:
         blocks (dict): contains all blocks fo the givens session id
         session_id (int) : the session to link the blocks to
     
+    Returns:
+        list: the inserted block rows (BlockID, SessionID, TargetArea, ShotsPlanned)
     """
     
-    sql = """INSERT INTO blocks (SessionID, TargetArea, ShotsPlanned) VALUES (%s, %s, %s)"""
-    for block in blocks:
-        exec_commit(sql, (session_id, block["targetArea"], block["shotsPlanned"]))
+    sql = """
+    INSERT INTO blocks (SessionID, TargetArea, ShotsPlanned) VALUES %s
+    RETURNING BlockID, SessionID, TargetArea, ShotsPlanned"""
+    rows = [(session_id, block["targetArea"], block["shotsPlanned"]) for block in blocks]
         
-    return (get_session_blocks(session_id))
+    return exec_insert_many(sql, rows, template="(%s, %s::target_area, %s)")
         
-    
+CREATE_SESSION_SQL = prepared_statement('create_session', """
+    WITH new_session AS (
+        INSERT INTO practice_sessions (UserID, SessionStart)
+        SELECT UserID, CURRENT_TIMESTAMP FROM users WHERE UserID = %(user_id)s
+        RETURNING SessionID, UserID, SessionStart, SessionEnd
+    ),
+    new_blocks AS (
+        INSERT INTO blocks (SessionID, TargetArea, ShotsPlanned)
+        SELECT ns.SessionID, b.targetArea::target_area, b.shotsPlanned
+        FROM new_session ns
+        CROSS JOIN ROWS FROM (
+            jsonb_to_recordset(%(blocks)s::jsonb) AS ("targetArea" text, "shotsPlanned" int)
+        ) WITH ORDINALITY AS b(targetArea, shotsPlanned, ord)
+        ORDER BY b.ord
+        RETURNING BlockID, SessionID, TargetArea, ShotsPlanned
+    )
+    SELECT ns.SessionID, ns.UserID, ns.SessionStart, ns.SessionEnd,
+           COALESCE(
+               (SELECT json_agg(json_build_array(nb.BlockID, nb.SessionID, nb.TargetArea, nb.ShotsPlanned)
+                                ORDER BY nb.BlockID)
+                FROM new_blocks nb),
+               '[]'::json)
+    FROM new_session ns;
+    """)
+
 def create_session(user_id, blocks):
     """
     Adds session to database correlated with user.
     The session start time is automatically set to the current time.
+    The user check, session insert and block inserts run as one statement,
+    so the cost does not depend on how many sessions the user already has.
 
     Args:
         user_id (int): The user to link the new session to.
         blocks (list): A list of block dictionaries to add to the session.
     
     Returns:
-        tuple: The new session's details, or an error string.
+        tuple: The new session's details (SessionID, UserID, SessionStart,
+            SessionEnd, blocks), where blocks is a list of
+            [BlockID, SessionID, TargetArea, ShotsPlanned], or an error string.
     """
-    if get_user(user_id) == "User does not exist":
-        return "User does not exist"
+    new_session = exec_commit_returning(CREATE_SESSION_SQL, {
+        'user_id': user_id,
+        'blocks': Json(blocks),
+    })
     
-    sql = """INSERT INTO practice_sessions (UserID, SessionStart) VALUES (%s, CURRENT_TIMESTAMP);"""   
+    if not new_session:
+        return "User does not exist"
     
-    exec_commit(sql, (user_id,)) 
-
-    sessions = get_user_sessions(user_id)
-    new_session = sessions[-1]
-
-    add_blocks(blocks, new_session[0])
+    invalidate_user(user_id)
+    get_active_sessions().register(new_session[0], user_id,
+                                   [(block[0], block[2], block[3]) for block in new_session[4]])
     
     return new_session
 
     
+END_SESSION_SQL = prepared_statement('end_session', "UPDATE practice_sessions SET sessionEnd = CURRENT_TIMESTAMP WHERE SessionID = %s RETURNING UserID")
+
 def update_session_end_time(SessionID):
     """
-    Updates the end time for the given session
+    Updates the end time for the given session and stores its heatmap grid,
+    so all-time heatmaps read the grid instead of the session's shots.
     
     Args:
         SessionID (int): given session
@@ -653,62 +1169,179 @@ def update_session_end_time(SessionID):
     Return:
         success message"""
         
-    sql = "UPDATE practice_sessions SET sessionEnd = CURRENT_TIMESTAMP WHERE SessionID = %s "
-    exec_commit(sql, (SessionID,))
+    owner = exec_commit_returning(END_SESSION_SQL, (SessionID,))
+    if owner:
+        invalidate_user(owner[0], leaderboard=False)
+        end_live_session(SessionID)
+        store_session_heatmap(SessionID, heatmap_config()['grid_size'])
     
     return "session updated correctly"
 
-def get_leaderboard_stats(sort_by='accuracy'):
+def get_heatmap(user_id, session_id=None, block_id=None, grid_size=None):
     """
-    Retrieves the leaderboard statistics for all users, sorted by a given parameter.
-    This version wraps the main query in a CTE to allow sorting by aliased columns.
+    Gets a shot heatmap for one block, one session or (by default) all of the
+    user's sessions, binned into a grid_size x grid_size grid.
+
+    Args:
+        user_id (int): The user the shots belong to.
+        session_id (int, optional): limit to this session
+        block_id (int, optional): limit to this block
+        grid_size (int, optional): cells per side, default from db.yml
+
+    Returns:
+        dict: {'grid_size': int, 'shots': int, 'bins': list of rows, bottom
+            row first}, or {'error': str}
+    """
+    config = heatmap_config()
+    if grid_size is None:
+        grid_size = config['grid_size']
+    if not 1 <= grid_size <= config['max_grid_size']:
+        return {"error": f"Error: grid must be between 1 and {config['max_grid_size']}."}
+
+    if block_id is not None:
+        owner_sql = """
+        SELECT 1 FROM blocks b JOIN practice_sessions ps ON b.SessionID = ps.SessionID
+        WHERE b.BlockID = %s AND ps.UserID = %s AND (%s IS NULL OR ps.SessionID = %s);
+        """
+        if not exec_get_one(owner_sql, (block_id, user_id, session_id, session_id)):
+            return {"error": "This block does not belong to the user or does not exist."}
+        return block_heatmap(block_id, grid_size)
+
+    if session_id is not None:
+        owner_sql = "SELECT 1 FROM practice_sessions WHERE SessionID = %s AND UserID = %s;"
+        if not exec_get_one(owner_sql, (session_id, user_id)):
+            return {"error": "This session does not belong to the user or does not exist."}
+        return session_heatmap(session_id, grid_size)
+
+    return user_heatmap(user_id, grid_size)
+
+def encode_cursor(values):
     """
-    if sort_by not in ['accuracy', 'made', 'planned']:
-        sort_by = 'accuracy'
-        
-    sql = """
-    WITH UserPlanned AS (
-        SELECT ps.UserID, SUM(b.ShotsPlanned) AS TotalPlanned
-        FROM practice_sessions ps
-        JOIN blocks b ON ps.SessionID = b.SessionID
-        GROUP BY ps.UserID
-    ),
-    UserMade AS (
-        SELECT ps.UserID, COUNT(s.ShotID) AS TotalMade
-        FROM practice_sessions ps
-        JOIN blocks b ON ps.SessionID = b.SessionID
-        JOIN shots s ON b.BlockID = s.BlockID
-        GROUP BY ps.UserID
-    ),
-    -- THIS IS THE NEW CTE WRAPPER
-    LeaderboardData AS (
-        SELECT
-            u.UserID,
-            u.FullName,
-            COALESCE(um.TotalMade, 0) AS TotalMade,
-            COALESCE(up.TotalPlanned, 0) AS TotalPlanned,
-            ROUND(
-                COALESCE(um.TotalMade, 0) * 100.0 / NULLIF(COALESCE(up.TotalPlanned, 0), 0), 2
-            ) AS AccuracyPercent
-        FROM users u
-        LEFT JOIN UserPlanned up ON u.UserID = up.UserID
-        LEFT JOIN UserMade um ON u.UserID = um.UserID
-        WHERE COALESCE(up.TotalPlanned, 0) > 0
-    )
-    -- FINAL SELECT FROM THE WRAPPER CTE
-    SELECT *
-    FROM LeaderboardData
-    ORDER BY
-        CASE WHEN %(sort_by)s = 'accuracy' THEN AccuracyPercent END DESC,
-        CASE WHEN %(sort_by)s = 'made' THEN TotalMade END DESC,
-        CASE WHEN %(sort_by)s = 'planned' THEN TotalPlanned END DESC,
-        TotalMade DESC
-    LIMIT 100;
+    Packs keyset values into an opaque, url-safe pagination cursor.
+
+    Args:
+        values (list): JSON-serializable values of the last row's sort key
+    
+    Returns:
+        str: the cursor
+    """
+    payload = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
     """
+    Unpacks a cursor made by encode_cursor.
+
+    Returns:
+        list: the keyset values, or None if the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+# Keyset columns for each leaderboard sort key, all descending and matching
+# the user_stats index for that key, so a page starting after any cursor is
+# an index range scan.
+LEADERBOARD_KEYS = {
+    'accuracy': ("us.AccuracyPercent", "us.TotalMade", "us.UserID"),
+    'made': ("us.TotalMade", "us.UserID"),
+    'planned': ("us.TotalPlanned", "us.TotalMade", "us.UserID"),
+}
+
+LEADERBOARD_PAGE_SIZE = 100
+
+def _leaderboard_sql(sort_by, paged):
+    keys = LEADERBOARD_KEYS[sort_by]
+    after = f"AND ({', '.join(keys)}) < %(after)s" if paged else ""
+    return f"""
+    SELECT us.UserID, u.FullName, us.TotalMade, us.TotalPlanned, us.AccuracyPercent
+    FROM user_stats us
+    JOIN users u ON u.UserID = us.UserID
+    WHERE us.TotalPlanned > 0 {after}
+    ORDER BY {', '.join(key + ' DESC' for key in keys)}
+    LIMIT %(limit)s;
+    """
+
+# One fixed statement per sort key (first page and following pages)
+LEADERBOARD_SQL = {
+    (sort_by, paged): prepared_statement(f"leaderboard_{sort_by}{'_after' if paged else ''}",
+                                         _leaderboard_sql(sort_by, paged))
+    for sort_by in LEADERBOARD_KEYS
+    for paged in (False, True)
+}
+
+def encode_leaderboard_cursor(sort_by, row):
+    """
+    Builds the opaque cursor pointing just after the given leaderboard row.
+
+    Args:
+        sort_by (str): the sort key the page was read with
+        row (tuple): (UserID, FullName, TotalMade, TotalPlanned, AccuracyPercent)
+
+    Returns:
+        str: url-safe cursor string
+    """
+    user_id, _, made, planned, accuracy = row
+    values = {
+        'accuracy': [str(accuracy), made, user_id],
+        'made': [made, user_id],
+        'planned': [planned, made, user_id],
+    }[sort_by]
+    return encode_cursor([sort_by] + values)
+
+def decode_leaderboard_cursor(sort_by, cursor):
+    """
+    Parses a cursor produced by encode_leaderboard_cursor.
+
+    Returns:
+        tuple: keyset values to continue after, or None if the cursor is
+            malformed or belongs to a different sort key
+    """
+    values = decode_cursor(cursor)
+    if not values or values[0] != sort_by:
+        return None
+    values = values[1:]
+    if len(values) != len(LEADERBOARD_KEYS[sort_by]):
+        return None
+    try:
+        if sort_by == 'accuracy':
+            return (Decimal(values[0]), int(values[1]), int(values[2]))
+        return tuple(int(value) for value in values)
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+
+def _load_leaderboard_page(sort_by, after, limit):
+    query = _leaderboard_query(sort_by, after, limit)
+    if "error" in query:
+        return query
+    result = exec_get_all(query['sql'], query['args'])
+    return _leaderboard_page(query['sort_by'], result, query['limit'])
+
+def _leaderboard_query(sort_by, after, limit):
+    # The statement and arguments for one page, shared with accuaim_async
+    if sort_by not in LEADERBOARD_KEYS:
+        sort_by = 'accuracy'
+    limit = max(1, min(limit, LEADERBOARD_PAGE_SIZE))
+
+    args = {'limit': limit + 1}
+    if after:
+        args['after'] = decode_leaderboard_cursor(sort_by, after)
+        if args['after'] is None:
+            return {"error": "Error: Invalid leaderboard cursor."}
+    return {'sql': LEADERBOARD_SQL[(sort_by, bool(after))], 'args': args,
+            'sort_by': sort_by, 'limit': limit}
+
+def _leaderboard_page(sort_by, result, limit):
     
-    result = exec_get_all(sql, {'sort_by': sort_by})
+    next_cursor = None
+    if len(result) > limit:
+        result = result[:limit]
+        next_cursor = encode_leaderboard_cursor(sort_by, result[-1])
     
-    return [
+    entries = [
         {
             'UserID': row[0],
             'FullName': row[1],
@@ -718,64 +1351,142 @@ def get_leaderboard_stats(sort_by='accuracy'):
         }
         for row in result
     ]
+    return {'entries': entries, 'next_cursor': next_cursor}
+
+def get_leaderboard_page(sort_by='accuracy', after=None, limit=LEADERBOARD_PAGE_SIZE, version=None):
+    """
+    Retrieves one page of the leaderboard using keyset pagination, so deep
+    pages cost the same as the first one. Pages are cached until the next
+    change to anything shown on the leaderboard.
+
+    Args:
+        sort_by (str): 'accuracy', 'made' or 'planned'
+        after (str, optional): cursor returned with the previous page
+        limit (int): page size, capped at LEADERBOARD_PAGE_SIZE
+        version (int, optional): the global data version, if already read
+
+    Returns:
+        dict: {'entries': list, 'next_cursor': str or None}, or {'error': str}
+    """
+    if version is None:
+        version = get_global_data_version()
+    return cached(f"leaderboard:v{version}:{sort_by}:{after}:{limit}",
+                  lambda: _load_leaderboard_page(sort_by, after, limit),
+                  tags=[LEADERBOARD_TAG])
+
+def get_leaderboard_stats(sort_by='accuracy'):
+    """
+    Retrieves the top of the leaderboard for all users, sorted by a given parameter.
+    Reads the incrementally maintained user_stats table, so this is an indexed
+    top-N read rather than an aggregate over every shot.
+    """
+    return get_leaderboard_page(sort_by)['entries']
+
+def rebuild_user_stats():
+    """
+    Recomputes the per-user leaderboard totals and dashboard stats (streak,
+    last session) from the raw sessions, blocks and shots. Used to backfill
+    user_stats or repair it after manual edits.
+    """
+    exec_commit("SELECT rebuild_user_stats();")
+    get_cache().clear()
+    return "User stats rebuilt."
+
+PARTITION_DEFAULTS = {
+    'months_ahead': 3,     # monthly shots partitions created ahead of time
+    'retain_months': 12,   # full months of raw shots kept before archiving
+}
+
+def _partition_config():
+    config = dict(PARTITION_DEFAULTS)
+    config.update(load_config().get('partitions') or {})
+    return config
+
+def create_shot_partitions(months_ahead=None):
+    """
+    Creates the monthly shots partitions for the current month and the next
+    months_ahead months (default from the 'partitions' section of db.yml).
+    Shots outside every partition land in shots_default until their month's
+    partition is created. Safe to run repeatedly.
+
+    Returns:
+        int: number of partitions created
+    """
+    if months_ahead is None:
+        months_ahead = _partition_config()['months_ahead']
+    return exec_commit_returning("SELECT ensure_shot_partitions(CURRENT_DATE, %s);", (months_ahead,))[0]
+
+def archive_shot_partitions(retain_months=None):
+    """
+    Rolls the shots partitions older than retain_months full months into the
+    per-block block_shot_summaries table and drops them. Made-shot counts and
+    user stats stay the same; only the individual archived shot rows go away.
 
-def get_user_dashboard_stats(user_id):
+    Returns:
+        int: number of partitions archived
     """
-    Calculates all stats for the dashboard, now using the simplified shots table.
+    if retain_months is None:
+        retain_months = _partition_config()['retain_months']
+
+    # Positions do not survive archiving, so make sure every affected
+    # session has its heatmap grid stored first
+    grid_size = heatmap_config()['grid_size']
+    pending_sql = """
+    SELECT DISTINCT b.SessionID
+    FROM shots s
+    JOIN blocks b ON s.BlockID = b.BlockID
+    WHERE s.ShotTime < (date_trunc('month', CURRENT_DATE) - make_interval(months => %s))
+      AND NOT EXISTS (SELECT 1 FROM session_heatmaps h
+                      WHERE h.SessionID = b.SessionID AND h.GridSize = %s);
     """
+    for (session_id,) in exec_get_all(pending_sql, (retain_months, grid_size)):
+        store_session_heatmap(session_id, grid_size)
+
     sql = """
-    WITH RECURSIVE PracticeDays AS (
-        SELECT DISTINCT DATE(SessionStart) AS practice_date
-        FROM practice_sessions WHERE UserID = %(user_id)s
-    ),
-    StreakCTE AS (
-        SELECT practice_date, 1 AS streak_length FROM PracticeDays
-        WHERE practice_date = (SELECT MAX(practice_date) FROM PracticeDays)
-        UNION ALL
-        SELECT pd.practice_date, s.streak_length + 1 FROM StreakCTE s
-        JOIN PracticeDays pd ON pd.practice_date = s.practice_date - INTERVAL '1 day'
-    ),
-    UserPlanned AS (
-        SELECT SUM(b.ShotsPlanned) AS TotalPlanned FROM practice_sessions ps
-        JOIN blocks b ON ps.SessionID = b.SessionID WHERE ps.UserID = %(user_id)s
-    ),
-    UserMade AS (
-        -- CORRECTED: Removed "AND s.Result = 'Made'"
-        SELECT COUNT(s.ShotID) AS TotalMade FROM practice_sessions ps
-        JOIN blocks b ON ps.SessionID = b.SessionID
-        JOIN shots s ON b.BlockID = s.BlockID 
-        WHERE ps.UserID = %(user_id)s
-    ),
-    LastSession AS (
-        SELECT SessionID FROM practice_sessions
-        WHERE UserID = %(user_id)s ORDER BY SessionStart DESC LIMIT 1
-    ),
-    LastSessionPlanned AS (
-        SELECT SUM(b.ShotsPlanned) AS Planned FROM blocks b
-        WHERE b.SessionID = (SELECT SessionID FROM LastSession)
-    ),
-    LastSessionMade AS (
-        -- CORRECTED: Removed "AND s.Result = 'Made'"
-        SELECT COUNT(s.ShotID) AS Made FROM blocks b
-        JOIN shots s ON b.BlockID = s.BlockID
-        WHERE b.SessionID = (SELECT SessionID FROM LastSession)
-    )
-    -- Final SELECT remains the same
-    SELECT
-        (SELECT CASE WHEN MAX(practice_date) >= CURRENT_DATE - INTERVAL '1 day' THEN MAX(streak_length)
-                ELSE 0 END FROM StreakCTE) AS streak,
-        (SELECT TotalMade FROM UserMade) AS totalMade,
-        (SELECT TotalPlanned FROM UserPlanned) AS totalPlanned,
-        ROUND(
-            (SELECT TotalMade FROM UserMade) * 100.0 / NULLIF((SELECT TotalPlanned FROM UserPlanned), 0),
-        1) AS allTimeAccuracy,
-        ROUND(
-            (SELECT Made FROM LastSessionMade) * 100.0 / NULLIF((SELECT Planned FROM LastSessionPlanned), 0),
-        1) AS lastSessionAccuracy;
+    SELECT archive_shot_partitions(
+        (date_trunc('month', CURRENT_DATE) - make_interval(months => %s))::date);
     """
-    
-    result = exec_get_one(sql, {'user_id': user_id})
-    
+    archived = exec_commit_returning(sql, (retain_months,))[0]
+    if archived:
+        get_cache().clear()
+    return archived
+
+def maintain_shot_partitions():
+    """
+    Partition maintenance job (run daily, e.g. from cron): creates upcoming
+    partitions and archives expired ones.
+    """
+    return {'created': create_shot_partitions(), 'archived': archive_shot_partitions()}
+
+def get_user_dashboard_stats(user_id, version=None):
+    """
+    Reads the dashboard stats from the user's user_stats row, which triggers
+    keep current as sessions, blocks and shots are recorded, so the cost does
+    not grow with the user's history. Cached until the user's data changes;
+    version is the user's data version, if the caller already read it.
+    """
+    version = _user_version(user_id, version)
+    return cached(f"dashboard:{user_id}:v{version}",
+                  lambda: _load_dashboard_stats(user_id),
+                  tags=[user_tag(user_id), dashboard_tag(user_id)])
+
+DASHBOARD_SQL = prepared_statement('dashboard', """
+    SELECT
+        CASE WHEN LastPracticeDate >= CURRENT_DATE - INTERVAL '1 day' THEN CurrentStreak
+             ELSE 0 END AS streak,
+        TotalMade,
+        TotalPlanned,
+        ROUND(TotalMade * 100.0 / NULLIF(TotalPlanned, 0), 1) AS allTimeAccuracy,
+        ROUND(LastSessionMade * 100.0 / NULLIF(LastSessionPlanned, 0), 1) AS lastSessionAccuracy
+    FROM user_stats
+    WHERE UserID = %(user_id)s;
+    """)
+
+def _load_dashboard_stats(user_id):
+    result = exec_get_one(DASHBOARD_SQL, {'user_id': user_id})
+    return _dashboard_stats(result)
+
+def _dashboard_stats(result):
     if result and result[0] is not None:
         return {
             "streak": result[0],
@@ -789,7 +1500,53 @@ def get_user_dashboard_stats(user_id):
         "streak": 0, "totalMade": 0, "totalPlanned": 0, 
         "allTimeAccuracy": "0.0%", "lastSessionAccuracy": "N/A"
     }
+
+USER_DATA_VERSION_SQL = prepared_statement('user_data_version', "SELECT DataVersion FROM user_stats WHERE UserID = %s;")
+
+GLOBAL_DATA_VERSION_SQL = prepared_statement('global_data_version', """
+    SELECT GREATEST(
+        (SELECT MAX(DataVersion) FROM user_stats),
+        (SELECT Version FROM deleted_data_version));
+    """)
+
+def get_user_data_version(user_id):
+    """
+    Returns the user's change counter, bumped by triggers whenever anything
+    shown on their dashboard, session list or session details changes.
+
+    Args:
+        user_id (int): the user to look up
+
+    Returns:
+        int: the current version, or None if the user does not exist
+    """
+    result = exec_get_one(USER_DATA_VERSION_SQL, (user_id,))
+    return result[0] if result else None
+
+def get_global_data_version():
+    """
+    Returns the version of data spanning all users (leaderboard, all blocks):
+    the newest user version, or the version stamped by the latest user
+    deletion if that is newer.
+
+    Returns:
+        int: the current global version
+    """
+    result = exec_get_one(GLOBAL_DATA_VERSION_SQL)
+    return result[0]
+
 if __name__ == "__main__":
-    rebuild_tables()
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild-stats':
+        print(rebuild_user_stats())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'maintain-partitions':
+        print(maintain_shot_partitions())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        print(migrate())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'migration-status':
+        for version, name, applied_at in migration_status():
+            print(version, name, applied_at or 'pending')
+    else:
+        rebuild_tables()
 
     
\ No newline at end of file
@@ -0,0 +1,353 @@
+import json
+import threading
+import time
+from array import array
+
+from api.db_utils import load_config
+
+ACTIVE_SESSION_DEFAULTS = {
+    # 'none', 'memory' (per process: only for a single-process server) or 'redis' (shared)
+    'backend': 'none',
+    'idle_timeout_seconds': 3600,
+    'redis_url': 'redis://localhost:6379/0',
+    'key_prefix': 'accuaim:active:',
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _block_stat(block_id, area, planned, made, delta=None):
+    stat = {'BlockID': block_id, 'TargetArea': area, 'ShotsPlanned': planned,
+            'MadeShots': made, 'MissedShots': planned - made}
+    if delta is not None:
+        stat['delta'] = delta
+    return stat
+
+
+class _ActiveSession:
+    # Parallel arrays instead of a dict per block: a session costs a few
+    # hundred bytes however many shots it records
+    __slots__ = ('user_id', 'block_ids', 'areas', 'planned', 'made', 'last_used')
+
+    def __init__(self, user_id, blocks, now):
+        self.user_id = user_id
+        self.block_ids = array('i', [block[0] for block in blocks])
+        self.areas = tuple(str(block[1]) for block in blocks)
+        self.planned = array('i', [block[2] for block in blocks])
+        self.made = array('i', [0] * len(blocks))
+        self.last_used = now
+
+    def stat(self, index, delta=None):
+        return _block_stat(self.block_ids[index], self.areas[index], self.planned[index],
+                           self.made[index], delta)
+
+
+class MemorySessionStore:
+    """
+    Active sessions of this process: made/planned counters per block, loaded
+    when the session is created and moved by every committed shot write.
+    Sessions are evicted when they end or after idle_timeout seconds without
+    a shot or a read.
+
+    Only correct when one process records all shots of a session (e.g. the
+    Flask server); use the redis backend when running several workers.
+
+    Args:
+        idle_timeout (float): seconds after which an untouched session is dropped
+        clock (callable): monotonic time source, replaceable in tests
+    """
+
+    def __init__(self, idle_timeout=3600, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._blocks = {}          # BlockID -> (SessionID, index in the session's arrays)
+        self._last_sweep = clock()
+        self._stats = {'registered': 0, 'evicted': 0, 'idle_evicted': 0}
+
+    def _drop(self, session_id):
+        active = self._sessions.pop(session_id, None)
+        if active is not None:
+            for block_id in active.block_ids:
+                self._blocks.pop(block_id, None)
+        return active
+
+    def _sweep(self, now):
+        # Idle eviction piggybacks on regular calls, at most every tenth of the timeout
+        if now - self._last_sweep < self.idle_timeout / 10:
+            return
+        self._last_sweep = now
+        idle = [session_id for session_id, active in self._sessions.items()
+                if now - active.last_used > self.idle_timeout]
+        for session_id in idle:
+            self._drop(session_id)
+        self._stats['idle_evicted'] += len(idle)
+
+    def register(self, session_id, user_id, blocks):
+        """
+        Starts tracking a new session. blocks is a list of
+        (BlockID, TargetArea, ShotsPlanned); counters start at zero.
+        """
+        now = self.clock()
+        with self._lock:
+            self._sweep(now)
+            self._drop(session_id)
+            active = _ActiveSession(user_id, blocks, now)
+            self._sessions[session_id] = active
+            for index, block_id in enumerate(active.block_ids):
+                self._blocks[block_id] = (session_id, index)
+            self._stats['registered'] += 1
+
+    def owner_of_block(self, block_id):
+        """
+        Returns:
+            tuple: (UserID, SessionID) if the block belongs to an active session, else None
+        """
+        with self._lock:
+            entry = self._blocks.get(block_id)
+            if entry is None:
+                return None
+            return self._sessions[entry[0]].user_id, entry[0]
+
+    def add_shots(self, session_id, deltas):
+        """
+        Applies made-shot deltas ({BlockID: change}) after they were written.
+
+        Returns:
+            list: the changed blocks with their new counters and the delta,
+                or None if the session is not active here
+        """
+        now = self.clock()
+        with self._lock:
+            self._sweep(now)
+            active = self._sessions.get(session_id)
+            if active is None:
+                return None
+            active.last_used = now
+            updates = []
+            for block_id, delta in deltas.items():
+                entry = self._blocks.get(block_id)
+                if entry is None or entry[0] != session_id or not delta:
+                    continue
+                active.made[entry[1]] += delta
+                updates.append(active.stat(entry[1], delta))
+            return updates
+
+    def block_stats(self, session_id):
+        """
+        Returns:
+            tuple: (UserID, block stats as get_session_block_stats), or None
+                if the session is not active here
+        """
+        now = self.clock()
+        with self._lock:
+            self._sweep(now)
+            active = self._sessions.get(session_id)
+            if active is None:
+                return None
+            active.last_used = now
+            return active.user_id, [active.stat(index) for index in range(len(active.block_ids))]
+
+    def evict(self, session_id):
+        with self._lock:
+            if self._drop(session_id) is not None:
+                self._stats['evicted'] += 1
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for session_id in [sid for sid, active in self._sessions.items() if active.user_id == user_id]:
+                self._drop(session_id)
+                self._stats['evicted'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._blocks.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['active'] = len(self._sessions)
+        snapshot['backend'] = 'memory'
+        return snapshot
+
+
+# Increments the counters of a live session atomically, skipping blocks of
+# other sessions. Returns the session's block list followed by
+# BlockID, MadeShots pairs, or nil when the session is not active.
+_ADD_SHOTS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+local out = {redis.call('HGET', KEYS[1], 'blocks')}
+for i = 1, #ARGV - 1, 2 do
+    local field = 'm:' .. ARGV[i]
+    if redis.call('HEXISTS', KEYS[1], field) == 1 then
+        out[#out + 1] = ARGV[i]
+        out[#out + 1] = redis.call('HINCRBY', KEYS[1], field, ARGV[i + 1])
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[#ARGV])
+return out
+"""
+
+
+class RedisSessionStore:
+    """
+    Active sessions shared by every worker, kept in a Redis-compatible
+    server next to the app. Each session is one hash (owner, block list and a
+    made counter per block) with a block -> session index beside it; Redis
+    expiry implements the idle timeout. Requires the optional 'redis' package.
+
+    Args:
+        url (str): server URL, e.g. redis://localhost:6379/0
+        idle_timeout (int): seconds after which an untouched session expires
+        key_prefix (str): namespace for all keys written by this store
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', idle_timeout=3600, key_prefix='accuaim:active:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("active_sessions.backend 'redis' requires the 'redis' package.") from e
+        self.client = redis.Redis.from_url(url)
+        self.idle_timeout = int(idle_timeout)
+        self.prefix = key_prefix
+        self._add_shots = self.client.register_script(_ADD_SHOTS_SCRIPT)
+
+    def _key(self, session_id):
+        return f"{self.prefix}{session_id}"
+
+    def _block_key(self, block_id):
+        return f"{self.prefix}block:{block_id}"
+
+    def _user_key(self, user_id):
+        return f"{self.prefix}user:{user_id}"
+
+    def register(self, session_id, user_id, blocks):
+        blocks = [(block[0], str(block[1]), block[2]) for block in blocks]
+        mapping = {'user': user_id, 'blocks': json.dumps(blocks)}
+        mapping.update({f"m:{block[0]}": 0 for block in blocks})
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.hset(self._key(session_id), mapping=mapping)
+        pipe.expire(self._key(session_id), self.idle_timeout)
+        for block in blocks:
+            pipe.set(self._block_key(block[0]), f"{user_id}:{session_id}", ex=self.idle_timeout)
+        pipe.sadd(self._user_key(user_id), session_id)
+        pipe.expire(self._user_key(user_id), self.idle_timeout)
+        pipe.execute()
+
+    def owner_of_block(self, block_id):
+        raw = self.client.get(self._block_key(block_id))
+        if raw is None:
+            return None
+        user_id, session_id = raw.decode('utf-8').split(':')
+        return int(user_id), int(session_id)
+
+    def add_shots(self, session_id, deltas):
+        args = []
+        for block_id, delta in deltas.items():
+            if delta:
+                args.extend((block_id, delta))
+        result = self._add_shots(keys=[self._key(session_id)], args=args + [self.idle_timeout])
+        if result is None:
+            return None
+        blocks = {block[0]: block for block in json.loads(result[0])}
+        updates = []
+        for index in range(1, len(result), 2):
+            block_id, made = int(result[index]), int(result[index + 1])
+            _, area, planned = blocks[block_id]
+            updates.append(_block_stat(block_id, area, planned, made, deltas[block_id]))
+        return updates
+
+    def block_stats(self, session_id):
+        pipe = self.client.pipeline()
+        pipe.hgetall(self._key(session_id))
+        pipe.expire(self._key(session_id), self.idle_timeout)
+        fields = pipe.execute()[0]
+        if not fields:
+            return None
+        fields = {key.decode('utf-8'): value for key, value in fields.items()}
+        stats = [_block_stat(block_id, area, planned, int(fields[f"m:{block_id}"]))
+                 for block_id, area, planned in json.loads(fields['blocks'])]
+        return int(fields['user']), stats
+
+    def evict(self, session_id):
+        raw = self.client.hmget(self._key(session_id), 'user', 'blocks')
+        if raw[0] is None:
+            return
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.srem(self._user_key(int(raw[0])), session_id)
+        for block in json.loads(raw[1]):
+            pipe.delete(self._block_key(block[0]))
+        pipe.execute()
+
+    def evict_user(self, user_id):
+        for session_id in self.client.smembers(self._user_key(user_id)):
+            self.evict(int(session_id))
+        self.client.delete(self._user_key(user_id))
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+class NullSessionStore:
+    """Tracks nothing (active_sessions.backend: none); every lookup misses."""
+
+    def register(self, session_id, user_id, blocks):
+        pass
+
+    def owner_of_block(self, block_id):
+        return None
+
+    def add_shots(self, session_id, deltas):
+        return None
+
+    def block_stats(self, session_id):
+        return None
+
+    def evict(self, session_id):
+        pass
+
+    def evict_user(self, user_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'none'}
+
+
+def get_active_sessions():
+    """
+    Returns the process-wide active session store configured by the
+    'active_sessions' section of db.yml. Both servers call it at startup, so
+    a misconfigured backend stops them before the first request.
+
+    Raises:
+        ValueError: for an unknown backend
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = dict(ACTIVE_SESSION_DEFAULTS)
+                config.update(load_config().get('active_sessions') or {})
+                if config['backend'] == 'memory':
+                    _store = MemorySessionStore(config['idle_timeout_seconds'])
+                elif config['backend'] == 'redis':
+                    _store = RedisSessionStore(config['redis_url'], config['idle_timeout_seconds'],
+                                               config['key_prefix'])
+                elif config['backend'] == 'none':
+                    _store = NullSessionStore()
+                else:
+                    raise ValueError("active_sessions.backend must be 'memory', 'redis' or 'none', got %r"
+                                     % config['backend'])
+    return _store
@@ -0,0 +1,169 @@
+import asyncio
+import contextvars
+import json
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from api.db_pool import PoolExhaustedError
+from api.db_utils import (POOL_DEFAULTS, active_query_metrics, calling_function, convert_placeholders,
+                          load_config)
+
+# asyncpg counterpart of db_utils for the ASGI entry point (server/asgi.py).
+# Statements keep the psycopg2 placeholder style (%s, %(name)s, %%) so the SQL
+# in accuaim_db is shared verbatim; convert_placeholders rewrites it to $n.
+
+_pool = None
+_pool_lock = None
+_conn = contextvars.ContextVar('async_db_conn', default=None)
+
+async def _init_connection(conn):
+    # Decode json/jsonb like psycopg2 does, and accept Python objects for them
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, schema='pg_catalog',
+                                  encoder=json.dumps, decoder=json.loads)
+
+
+async def get_async_pool():
+    """
+    Returns the process-wide asyncpg pool, creating it on first use. Sizing
+    comes from the same 'pool' section of db.yml as the psycopg2 pool.
+    """
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                config = load_config()
+                pool_config = dict(POOL_DEFAULTS)
+                pool_config.update(config.get('pool') or {})
+                _pool = await asyncpg.create_pool(
+                    database=config['database'], user=config['user'],
+                    password=config['password'], host=config['host'], port=config['port'],
+                    min_size=pool_config['min_size'], max_size=pool_config['max_size'],
+                    max_inactive_connection_lifetime=pool_config['idle_timeout'],
+                    init=_init_connection)
+    return _pool
+
+
+async def close_async_pool():
+    """Closes all pooled connections at shutdown."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def _acquire(function=None):
+    pool = await get_async_pool()
+    metrics = active_query_metrics()
+    timeout = (load_config().get('pool') or {}).get('acquire_timeout',
+                                                     POOL_DEFAULTS['acquire_timeout'])
+    started = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=timeout)
+    except asyncio.TimeoutError:
+        raise PoolExhaustedError(f"no database connection available after {timeout}s")
+    finally:
+        if metrics is not None:
+            metrics.record_wait(function or calling_function(), time.perf_counter() - started)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+@asynccontextmanager
+async def transaction():
+    """
+    Runs every async_db call inside the block on one connection and commits
+    once at the end, like db_utils.transaction(). Nested blocks join the
+    outermost one; the connection follows the task through contextvars.
+    """
+    current = _conn.get()
+    if current is not None:
+        yield current
+        return
+
+    async with _acquire() as conn:
+        token = _conn.set(conn)
+        try:
+            async with conn.transaction():
+                yield conn
+        finally:
+            _conn.reset(token)
+
+
+@asynccontextmanager
+async def _connection(function=None):
+    current = _conn.get()
+    if current is not None:
+        yield current
+        return
+    async with _acquire(function) as conn:
+        yield conn
+
+
+def _row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, str):
+        # Command status, e.g. "INSERT 0 1"
+        count = result.rpartition(' ')[2]
+        return int(count) if count.isdigit() else -1
+    return 0 if result is None else 1
+
+
+async def _run(sql, args, method):
+    # Runs one statement with the named connection method and records it in
+    # the same query metrics as db_utils
+    metrics = active_query_metrics()
+    function = calling_function() if metrics is not None else None
+    text, params = convert_placeholders(sql, args)
+    async with _connection(function) as conn:
+        started = time.perf_counter()
+        result, failed = None, True
+        try:
+            result = await getattr(conn, method)(text, *params)
+            failed = False
+        finally:
+            if metrics is not None:
+                metrics.record(function, sql, args, time.perf_counter() - started,
+                               _row_count(result) if not failed else -1, failed)
+    return result
+
+
+async def exec_get_one(sql, args=()):
+    """Runs a query and returns its first row as a tuple, or None."""
+    row = await _run(sql, args, 'fetchrow')
+    return tuple(row) if row is not None else None
+
+
+async def exec_get_all(sql, args=()):
+    """Runs a query and returns every row as a list of tuples."""
+    rows = await _run(sql, args, 'fetch')
+    return [tuple(row) for row in rows]
+
+
+async def exec_commit(sql, args=()):
+    """Runs a write statement; it commits on its own unless a transaction is open."""
+    return await _run(sql, args, 'execute')
+
+
+async def exec_commit_returning(sql, args=()):
+    """Runs a data-modifying statement and returns the first row it RETURNs, or None."""
+    return await exec_get_one(sql, args)
+
+
+async def exec_stream(sql, args=(), prefetch=500):
+    """
+    Yields rows as tuples from a server-side cursor, fetching prefetch rows
+    at a time, so memory stays flat however many rows the query returns.
+    """
+    sql, params = convert_placeholders(sql, args)
+    async with transaction() as conn:
+        async for row in conn.cursor(sql, *params, prefetch=prefetch):
+            yield tuple(row)
@@ -0,0 +1,190 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+from api.cache import LRUCache
+from api.db_utils import exec_commit, exec_get_all, load_config
+
+AUTH_DEFAULTS = {
+    'secret': None,                     # required: shared by every worker, kept across restarts
+    'token_ttl_seconds': 7 * 24 * 3600,
+    'revocation_refresh_seconds': 30,   # how often other workers' revocations are picked up
+    'verify_cache_entries': 10000,
+}
+
+_tokens = None
+_tokens_lock = threading.Lock()
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenService:
+    """
+    Issues and verifies HMAC-SHA256 signed access tokens.
+
+    A token is "<payload>.<signature>" where the payload holds the user ID,
+    issue time, expiry and a random token ID. Verifying needs no database
+    access: signatures are checked once and the result cached, and revoked
+    token IDs plus per-user "not before" cutoffs are kept in memory, backed by
+    the revoked_tokens and token_cutoffs tables and re-read every
+    revocation_refresh_seconds so revocations from other workers apply too.
+
+    Args:
+        secret (bytes): HMAC key
+        ttl_seconds (int): token lifetime
+        refresh_seconds (float): interval between revocation reloads
+        cache_entries (int): verified tokens remembered
+    """
+
+    def __init__(self, secret, ttl_seconds, refresh_seconds=30, cache_entries=10000):
+        self.secret = secret
+        self.ttl = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+        self._verified = LRUCache(cache_entries, ttl_seconds)
+        self._lock = threading.Lock()
+        self._revoked = set()
+        self._cutoffs = {}
+        self._loaded_at = None
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, user_id):
+        """
+        Creates a token for the given user.
+
+        Returns:
+            str: the signed token
+        """
+        now = time.time()
+        claims = {'uid': user_id, 'iat': now, 'exp': now + self.ttl, 'jti': secrets.token_hex(16)}
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        return f"{payload}.{self._sign(payload)}"
+
+    def _claims(self, token):
+        hit, claims = self._verified.get(token)
+        if hit:
+            return claims
+        try:
+            payload, signature = token.split('.')
+        except (AttributeError, ValueError):
+            return None
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        self._verified.set(token, claims)
+        return claims
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.refresh_seconds:
+            return
+        revoked = {row[0] for row in exec_get_all(
+            "SELECT TokenID FROM revoked_tokens WHERE ExpiresAt > CURRENT_TIMESTAMP")}
+        cutoffs = {row[0]: row[1].timestamp() for row in exec_get_all(
+            "SELECT UserID, NotBefore FROM token_cutoffs")}
+        with self._lock:
+            self._revoked = revoked
+            self._cutoffs = cutoffs
+            self._loaded_at = now
+
+    def verify(self, token):
+        """
+        Checks a token's signature, expiry and revocation status.
+
+        Returns:
+            int: the token's user ID, or None if the token is not valid
+        """
+        claims = self._claims(token)
+        if claims is None or claims['exp'] < time.time():
+            return None
+        self._refresh()
+        with self._lock:
+            if claims['jti'] in self._revoked:
+                return None
+            if claims['iat'] < self._cutoffs.get(claims['uid'], 0):
+                return None
+        return claims['uid']
+
+    def revoke(self, token):
+        """
+        Revokes a single token (logout). Unknown or invalid tokens are ignored.
+        """
+        claims = self._claims(token)
+        if claims is None:
+            return
+        expires_at = datetime.fromtimestamp(claims['exp'], timezone.utc)
+        exec_commit("""
+        INSERT INTO revoked_tokens (TokenID, ExpiresAt) VALUES (%s, %s)
+        ON CONFLICT (TokenID) DO NOTHING;
+        """, (claims['jti'], expires_at))
+        exec_commit("DELETE FROM revoked_tokens WHERE ExpiresAt <= CURRENT_TIMESTAMP;")
+        with self._lock:
+            self._revoked.add(claims['jti'])
+
+    def revoke_user(self, user_id):
+        """
+        Revokes every token issued to the user up to now (e.g. after a
+        password change or account deletion).
+        """
+        now = time.time()
+        exec_commit("""
+        INSERT INTO token_cutoffs (UserID, NotBefore) VALUES (%s, %s)
+        ON CONFLICT (UserID) DO UPDATE SET NotBefore = EXCLUDED.NotBefore;
+        """, (user_id, datetime.fromtimestamp(now, timezone.utc)))
+        with self._lock:
+            self._cutoffs[user_id] = now
+
+
+def get_token_service():
+    """
+    Returns the process-wide TokenService configured by the 'auth' section of
+    db.yml. Call it at startup so a missing secret stops the server before it
+    hands out tokens the other workers would reject.
+
+    Raises:
+        RuntimeError: if auth.secret is not configured
+    """
+    global _tokens
+    if _tokens is None:
+        with _tokens_lock:
+            if _tokens is None:
+                config = dict(AUTH_DEFAULTS)
+                config.update(load_config().get('auth') or {})
+                if not config['secret']:
+                    raise RuntimeError("auth.secret must be set in db.yml (a long random string shared "
+                                       "by every worker) to issue and verify access tokens.")
+                _tokens = TokenService(str(config['secret']).encode('utf-8'), config['token_ttl_seconds'],
+                                       config['revocation_refresh_seconds'],
+                                       config['verify_cache_entries'])
+    return _tokens
+
+
+def issue_token(user_id):
+    return get_token_service().issue(user_id)
+
+
+def verify_token(token):
+    return get_token_service().verify(token)
+
+
+def revoke_token(token):
+    get_token_service().revoke(token)
+
+
+def revoke_user_tokens(user_id):
+    get_token_service().revoke_user(user_id)
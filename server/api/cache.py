@@ -0,0 +1,277 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from api.db_utils import load_config
+
+CACHE_DEFAULTS = {
+    'backend': 'lru',          # 'lru' (per process), 'redis' (shared) or 'none'
+    'ttl_seconds': 60,
+    'max_entries': 10000,
+    'redis_url': 'redis://localhost:6379/0',
+    'key_prefix': 'accuaim:',
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class LRUCache:
+    """
+    In-process least-recently-used cache with a per-entry time to live.
+
+    Entries can carry tags; invalidate_tag() drops every entry with that tag
+    without scanning the whole cache. Values are stored pickled, like in
+    RedisCache, so every hit returns a private copy callers may modify.
+
+    Args:
+        max_entries (int): entries kept before the least recently used is evicted
+        ttl_seconds (float): how long an entry stays valid
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=60):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value, tags)
+        self._tags = {}                 # tag -> set of keys
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _remove(self, key):
+        # Called with the lock held.
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        """
+        Returns (True, value) on a hit, (False, None) on a miss or expiry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            value = entry[1]
+        return True, pickle.loads(value)
+
+    def set(self, key, value, tags=()):
+        value = pickle.dumps(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    self._stats['invalidations'] += 1
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['entries'] = len(self._entries)
+        snapshot['backend'] = 'lru'
+        return snapshot
+
+
+class RedisCache:
+    """
+    Cache shared by all workers, stored in a Redis-compatible server (Redis,
+    KeyDB, Valkey, ...). Values are pickled; tags are Redis sets of keys.
+    Requires the optional 'redis' package.
+
+    Args:
+        url (str): server URL, e.g. redis://localhost:6379/0
+        ttl_seconds (int): expiry set on every entry
+        key_prefix (str): namespace for all keys written by this app
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', ttl_seconds=60, key_prefix='accuaim:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("cache.backend 'redis' requires the 'redis' package.") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = int(ttl_seconds)
+        self.prefix = key_prefix
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self._count('misses')
+            return False, None
+        self._count('hits')
+        return True, pickle.loads(raw)
+
+    def set(self, key, value, tags=()):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            pipe.sadd(tag_key, key)
+            pipe.expire(tag_key, self.ttl)
+        pipe.execute()
+
+    def delete(self, *keys):
+        if keys:
+            removed = self.client.delete(*[self.prefix + key for key in keys])
+            self._count('invalidations', removed)
+
+    def invalidate_tag(self, tag):
+        tag_key = self.prefix + 'tag:' + tag
+        keys = [key.decode('utf-8') for key in self.client.smembers(tag_key)]
+        self.client.delete(tag_key)
+        self.delete(*keys)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        try:
+            snapshot['evictions'] = self.client.info('stats').get('evicted_keys', 0)
+        except Exception:
+            snapshot['evictions'] = None
+        snapshot['backend'] = 'redis'
+        return snapshot
+
+
+class NullCache:
+    """Cache that never stores anything (cache.backend: none)."""
+
+    def get(self, key):
+        return False, None
+
+    def set(self, key, value, tags=()):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def invalidate_tag(self, tag):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'none'}
+
+
+def get_cache():
+    """
+    Returns the process-wide cache configured by the 'cache' section of db.yml.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = dict(CACHE_DEFAULTS)
+                config.update(load_config().get('cache') or {})
+                if config['backend'] == 'lru':
+                    _cache = LRUCache(config['max_entries'], config['ttl_seconds'])
+                elif config['backend'] == 'redis':
+                    _cache = RedisCache(config['redis_url'], config['ttl_seconds'], config['key_prefix'])
+                elif config['backend'] == 'none':
+                    _cache = NullCache()
+                else:
+                    raise ValueError("cache.backend must be 'lru', 'redis' or 'none', got %r" % config['backend'])
+    return _cache
+
+
+def cached(key, producer, tags=()):
+    """
+    Read-through helper: returns the cached value for key, or calls producer(),
+    stores its result under key with the given tags and returns it.
+    """
+    cache = get_cache()
+    hit, value = cache.get(key)
+    if hit:
+        return value
+    value = producer()
+    cache.set(key, value, tags)
+    return value
+
+
+def user_tag(user_id):
+    return f"user:{user_id}"
+
+
+# Keys carry the data version their ETag is built from, so one session's or
+# dashboard's entries are found through these tags
+def session_tag(user_id, session_id):
+    return f"session:{user_id}:{session_id}"
+
+
+def dashboard_tag(user_id):
+    return f"dashboard:{user_id}"
+
+
+LEADERBOARD_TAG = "leaderboard"
+
+
+def invalidate_shots(user_id, session_id):
+    """Call after shots were added to or removed from a user's session."""
+    cache = get_cache()
+    cache.invalidate_tag(session_tag(user_id, session_id))
+    cache.invalidate_tag(dashboard_tag(user_id))
+    cache.invalidate_tag(LEADERBOARD_TAG)
+
+
+def invalidate_user(user_id, leaderboard=True):
+    """Call after a user's sessions change or the user is removed."""
+    cache = get_cache()
+    cache.invalidate_tag(user_tag(user_id))
+    if leaderboard:
+        cache.invalidate_tag(LEADERBOARD_TAG)
+
+
+def invalidate_leaderboard():
+    """Call after anything shown on the leaderboard changes."""
+    get_cache().invalidate_tag(LEADERBOARD_TAG)
+
+
+def cache_stats():
+    """
+    Returns hit/miss/eviction counters for the configured cache.
+    """
+    return get_cache().stats()
@@ -0,0 +1,245 @@
+import threading
+import time
+
+import psycopg2
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no connection becomes available before the acquire timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of reusable psycopg2 connections.
+
+    Connections are handed out with getconn() and returned with putconn().
+    Idle connections are health-checked before reuse and closed once they have
+    been idle longer than idle_timeout (never dropping below min_size).
+
+    Args:
+        connect_kwargs (dict): keyword arguments passed to psycopg2.connect
+        min_size (int): connections kept open even when idle
+        max_size (int): hard upper bound on open connections
+        acquire_timeout (float): seconds getconn() waits before giving up
+        idle_timeout (float): seconds an idle connection is kept above min_size
+        health_check_after (float): idle seconds after which a connection is
+            pinged with SELECT 1 before being handed out
+    """
+
+    def __init__(self, connect_kwargs, min_size=1, max_size=10,
+                 acquire_timeout=10.0, idle_timeout=300.0, health_check_after=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size=%s max_size=%s" % (min_size, max_size))
+
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []          # list of (connection, returned_at), most recent last
+        self._in_use = set()
+        self._closed = False
+        self._stats = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'acquired': 0,
+            'released': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'exhausted': 0,
+            'health_check_failures': 0,
+            'idle_evictions': 0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append((self._open(), time.monotonic()))
+
+    def _open(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    @staticmethod
+    def _close(conns):
+        # Called without the lock: closing talks to the server.
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self, now):
+        # Called with the lock held; returns the evicted connections for the
+        # caller to close after releasing it. Oldest connections sit at the front.
+        evicted = []
+        total = len(self._idle) + len(self._in_use)
+        while self._idle and total > self.min_size:
+            conn, returned_at = self._idle[0]
+            if now - returned_at < self.idle_timeout:
+                break
+            self._idle.pop(0)
+            evicted.append(conn)
+            self._stats['idle_evictions'] += 1
+            self._stats['connections_closed'] += 1
+            total -= 1
+        return evicted
+
+    def getconn(self, timeout=None):
+        """
+        Checks a connection out of the pool, opening a new one if the pool is
+        below max_size, otherwise waiting for one to be returned.
+
+        Args:
+            timeout (float, optional): overrides acquire_timeout for this call
+
+        Returns:
+            connection: a psycopg2 connection ready for use
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            # Pick an idle connection (or reserve a slot for a new one) under
+            # the lock; health checks and closing happen after releasing it.
+            candidate, stale, error = None, [], None
+            with self._available:
+                while True:
+                    if self._closed:
+                        error = PoolExhaustedError("Connection pool is closed.")
+                        break
+
+                    now = time.monotonic()
+                    stale.extend(self._evict_idle(now))
+
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        # Holds its slot while it is checked outside the lock.
+                        self._in_use.add(candidate[0])
+                        break
+
+                    if len(self._in_use) < self.max_size:
+                        placeholder = object()
+                        self._in_use.add(placeholder)
+                        break
+
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['exhausted'] += 1
+                        error = PoolExhaustedError(
+                            "No database connection available after %.1fs (max_size=%d)."
+                            % (timeout, self.max_size))
+                        break
+                    waited = True
+                    self._available.wait(remaining)
+
+            self._close(stale)
+            if error is not None:
+                raise error
+            if candidate is None:
+                break
+
+            conn, returned_at = candidate
+            if self._is_healthy(conn, now - returned_at):
+                with self._available:
+                    return self._checkout(conn, started, waited)
+            self._close([conn])
+            with self._available:
+                self._in_use.discard(conn)
+                self._stats['health_check_failures'] += 1
+                self._stats['connections_closed'] += 1
+                self._available.notify()
+
+        try:
+            conn = self._open()
+        except Exception:
+            with self._available:
+                self._in_use.discard(placeholder)
+                self._available.notify()
+            raise
+
+        with self._available:
+            self._in_use.discard(placeholder)
+            return self._checkout(conn, started, waited)
+
+    def _checkout(self, conn, started, waited):
+        # Called with the lock held.
+        self._in_use.add(conn)
+        self._stats['acquired'] += 1
+        if waited:
+            self._stats['waits'] += 1
+            self._stats['wait_seconds_total'] += time.monotonic() - started
+        return conn
+
+    def putconn(self, conn, close=False):
+        """
+        Returns a connection to the pool. Any open transaction is rolled back so
+        the next borrower starts clean; broken connections are closed instead.
+
+        Args:
+            conn (connection): connection previously returned by getconn()
+            close (bool): close the connection instead of keeping it idle
+        """
+        if not close and not conn.closed:
+            try:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+            except Exception:
+                close = True
+
+        with self._available:
+            self._in_use.discard(conn)
+            self._stats['released'] += 1
+            close = close or conn.closed or self._closed
+            if close:
+                self._stats['connections_closed'] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+        if close:
+            self._close([conn])
+
+    def closeall(self):
+        """Closes every idle connection and refuses further checkouts."""
+        with self._available:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._stats['connections_closed'] += len(idle)
+            self._idle = []
+            self._available.notify_all()
+        self._close(idle)
+
+    def stats(self):
+        """
+        Returns a snapshot of pool usage counters.
+
+        Returns:
+            dict: sizes plus cumulative counters (opened, acquired, waits, exhausted, ...)
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['in_use'] = len(self._in_use)
+            snapshot['idle'] = len(self._idle)
+            snapshot['min_size'] = self.min_size
+            snapshot['max_size'] = self.max_size
+        return snapshot
@@ -1,50 +1,547 @@
-import psycopg2 
-import yaml 
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+import yaml
 import os
+import re
+import sys
+import threading
+import functools
+import time
+import uuid
+from contextlib import contextmanager
+
+from api.db_pool import ConnectionPool, PoolExhaustedError
+from api.query_metrics import LATENCY_BUCKETS, QueryMetrics
+
+_config = None
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+_metrics = None
+_metrics_enabled = True
+
+POOL_DEFAULTS = {
+    'min_size': 1,
+    'max_size': 10,
+    'acquire_timeout': 10.0,
+    'idle_timeout': 300.0,
+    'health_check_after': 30.0,
+}
+
+QUERY_METRICS_DEFAULTS = {
+    'enabled': True,            # false skips timing and tagging statements altogether
+    'slow_query_ms': 200,       # statements at least this slow are logged; null logs none
+    'buckets_seconds': list(LATENCY_BUCKETS),
+    'token': None,              # bearer token for /admin/queries; without one the endpoint answers 403
+}
+
+def load_config():
+    """
+    Reads db.yml once per process and caches the result.
+
+    Returns:
+        dict: the parsed database configuration
+    """
+    global _config
+    if _config is None:
+        yml_path = os.path.join(os.path.dirname(__file__), 'db.yml')
+        with open(yml_path, 'r') as file:
+            _config = yaml.load(file, Loader=yaml.FullLoader)
+    return _config
+
+def _connect_kwargs(config):
+    return dict(dbname=config['database'],
+                user=config['user'],
+                password=config['password'],
+                host=config['host'],
+                port=config['port'],
+                connection_factory=StatementConnection)
+
+# --- Prepared statements ---
+#
+# Fixed statements registered with prepared_statement() are sent once per
+# connection as PREPARE name AS ..., then run as EXECUTE name (...), so
+# PostgreSQL parses and analyses them once per connection instead of on every
+# call. Callers keep passing the SQL text to exec_get_one & co.; registration
+# is keyed by that text. Set prepare_statements: false in db.yml to disable.
+
+_statements = {}              # SQL text -> statement name
+_statement_stats = {}         # statement name -> timing counters
+_statements_lock = threading.Lock()
+_prepared_generation = 0
+_unpreparable = set()
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+class StatementConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers the statements prepared on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.prepared_generation = _prepared_generation
+
+def convert_placeholders(sql, args=()):
+    """
+    Rewrites a psycopg2-style statement (%s, %(name)s, %%) to PostgreSQL's
+    $n parameters. Tuples are expanded to a row of parameters, as psycopg2
+    adapts them, so row comparisons such as (a, b) < %(after)s keep working.
+
+    Returns:
+        tuple: (sql with $1..$n placeholders, list of parameter values)
+    """
+    params = []
+    positional = iter(args) if isinstance(args, (list, tuple)) else None
+
+    def bind(value):
+        if isinstance(value, tuple):
+            return "(" + ", ".join(bind(item) for item in value) + ")"
+        params.append(value)
+        return f"${len(params)}"
+
+    def replace(match):
+        if match.group(0) == '%%':
+            return '%'
+        if match.group(1) is not None:
+            return bind(args[match.group(1)])
+        return bind(next(positional))
+
+    return _PLACEHOLDER.sub(replace, sql), params
+
+def prepared_statement(name, sql):
+    """
+    Registers sql to run as the prepared statement name. Returns sql
+    unchanged, so module-level query constants can be wrapped in place.
+    """
+    with _statements_lock:
+        _statements[sql] = name
+        _statement_stats.setdefault(name, {'prepares': 0, 'prepare_ms_total': 0.0,
+                                           'executions': 0, 'execute_ms_total': 0.0,
+                                           'fallbacks': 0})
+    return sql
+
+def reset_prepared_statements():
+    """
+    Makes every connection drop its prepared statements before its next
+    prepared execution. Call after the schema was rebuilt.
+    """
+    global _prepared_generation
+    with _statements_lock:
+        _prepared_generation += 1
+        _unpreparable.clear()
+
+def prepared_statement_stats():
+    """
+    Returns per-statement timings. prepare_ms covers parsing and analysis,
+    done once per connection; execute_ms covers planning and execution
+    (PostgreSQL switches to a cached generic plan after a few executions
+    when it is not worse than the custom ones).
+
+    Returns:
+        dict: statement name -> counters and average milliseconds
+    """
+    with _statements_lock:
+        snapshot = {name: dict(stats) for name, stats in _statement_stats.items()}
+    for stats in snapshot.values():
+        stats['avg_prepare_ms'] = stats['prepare_ms_total'] / stats['prepares'] if stats['prepares'] else 0.0
+        stats['avg_execute_ms'] = stats['execute_ms_total'] / stats['executions'] if stats['executions'] else 0.0
+    return snapshot
+
+def _record(name, count_key, total_key, started):
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    with _statements_lock:
+        _statement_stats[name][count_key] += 1
+        _statement_stats[name][total_key] += elapsed_ms
+
+def _execute(cur, sql, args):
+    # Runs sql on cur, through its prepared statement when it has one
+    name = _statements.get(sql)
+    conn = cur.connection
+    if (name is None or name in _unpreparable or not isinstance(conn, StatementConnection)
+            or not load_config().get('prepare_statements', True)):
+        cur.execute(sql, args)
+        return
+
+    text, params = convert_placeholders(sql, args)
+    try:
+        if conn.prepared_generation != _prepared_generation:
+            cur.execute("DEALLOCATE ALL")
+            conn.prepared.clear()
+            conn.prepared_generation = _prepared_generation
+        if name not in conn.prepared:
+            started = time.perf_counter()
+            cur.execute(f"PREPARE {name} AS {text}")
+            _record(name, 'prepares', 'prepare_ms_total', started)
+            conn.prepared.add(name)
+        started = time.perf_counter()
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+        _record(name, 'executions', 'execute_ms_total', started)
+    except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.DuplicatePreparedStatement,
+            psycopg2.errors.FeatureNotSupported, psycopg2.errors.IndeterminateDatatype,
+            psycopg2.errors.AmbiguousParameter) as e:
+        # The connection lost (or never had) the prepared state this process
+        # assumed, a DDL change invalidated the plan's result type, or the
+        # statement cannot be prepared. The failed command aborted the
+        # transaction, so recovery is only possible for a single statement.
+        if current_transaction() is not None:
+            raise
+        conn.rollback()
+        if isinstance(e, (psycopg2.errors.IndeterminateDatatype, psycopg2.errors.AmbiguousParameter)):
+            _unpreparable.add(name)
+        else:
+            cur.execute("DEALLOCATE ALL")
+            conn.prepared.clear()
+        with _statements_lock:
+            _statement_stats[name]['fallbacks'] += 1
+        cur.execute(sql, args)
 
 def connect():
-    config = {}
-    yml_path = os.path.join(os.path.dirname(__file__), 'db.yml')
-    with open(yml_path, 'r') as file:
-        config = yaml.load(file, Loader=yaml.FullLoader)
+    """
+    Opens a new, unpooled connection. Prefer get_connection() for queries.
+    """
+    return psycopg2.connect(**_connect_kwargs(load_config()))
+
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating it on first use.
+    Pool sizing is read from the optional 'pool' section of db.yml.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = load_config()
+                pool_config = dict(POOL_DEFAULTS)
+                pool_config.update(config.get('pool') or {})
+                _pool = ConnectionPool(_connect_kwargs(config), **pool_config)
+    return _pool
+
+def close_pool():
+    """Closes all pooled connections, e.g. before forking or at shutdown."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+def pool_stats():
+    """
+    Returns usage counters for the connection pool.
+
+    Returns:
+        dict: pool size and exhaustion metrics, empty if the pool is not started
+    """
+    if _pool is None:
+        return {}
+    return _pool.stats()
 
-    return psycopg2.connect(dbname=config['database'],
-                            user=config['user'],
-                            password=config['password'],
-                            host=config['host'],
-                            port=config['port'])
+def query_metrics_config():
+    config = dict(QUERY_METRICS_DEFAULTS)
+    config.update(load_config().get('query_metrics') or {})
+    return config
+
+def get_query_metrics():
+    """
+    Returns the process-wide query metrics, configured by the optional
+    'query_metrics' section of db.yml.
+    """
+    global _metrics, _metrics_enabled
+    if _metrics is None:
+        with _pool_lock:
+            if _metrics is None:
+                config = query_metrics_config()
+                _metrics_enabled = bool(config['enabled'])
+                _metrics = QueryMetrics(config['slow_query_ms'], config['buckets_seconds'])
+    return _metrics
+
+def active_query_metrics():
+    """
+    Returns get_query_metrics(), or None when 'query_metrics: enabled' is off,
+    in which case statements are neither timed nor tagged (no stack walk).
+    """
+    metrics = get_query_metrics()
+    return metrics if _metrics_enabled else None
+
+# Modules whose frames are skipped when looking for the caller of a statement
+_DB_LAYER = frozenset(('contextlib', 'api.db_utils', 'db_utils', 'api.async_db', 'async_db',
+                       'api.db_pool', 'db_pool'))
+_TAGGED_MODULES = frozenset(('accuaim_db', 'accuaim_async'))
+
+def calling_function():
+    """
+    Names the function a statement runs for: the nearest public accuaim_db
+    (or accuaim_async) function on the stack, so helpers, lambdas and cache
+    loaders count towards the function that called them. Statements issued
+    elsewhere are tagged "module.function" after their nearest caller.
+    """
+    frame = sys._getframe(1)
+    tagged = fallback = None
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.rpartition('.')[2] in _TAGGED_MODULES:
+            name = frame.f_code.co_name
+            if not name.startswith(('_', '<')):
+                return name
+            tagged = tagged or name
+        elif fallback is None and module not in _DB_LAYER:
+            fallback = f"{module.rpartition('.')[2]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return tagged or fallback or 'unknown'
+
+def query_report():
+    """
+    Returns the query metrics of this process together with the prepared
+    statement timings and the pool counters, e.g. for the admin endpoint.
+    """
+    report = get_query_metrics().snapshot()
+    report['enabled'] = active_query_metrics() is not None
+    report['prepared_statements'] = prepared_statement_stats()
+    report['pool'] = pool_stats()
+    return report
+
+def prometheus_text():
+    """
+    Returns query_report() in the Prometheus text exposition format.
+    """
+    lines = [get_query_metrics().prometheus().rstrip("\n")]
+    statements = sorted(prepared_statement_stats().items())
+    for metric, key, scale, help_text in (
+            ('prepares_total', 'prepares', 1, 'Statements prepared on a connection.'),
+            ('prepare_seconds_total', 'prepare_ms_total', 0.001, 'Time spent preparing statements.'),
+            ('executions_total', 'executions', 1, 'Prepared statement executions.'),
+            ('execute_seconds_total', 'execute_ms_total', 0.001, 'Time spent executing prepared statements.'),
+            ('fallbacks_total', 'fallbacks', 1, 'Prepared executions that fell back to plain SQL.')):
+        lines.append(f"# HELP accuaim_db_prepared_{metric} {help_text}")
+        lines.append(f"# TYPE accuaim_db_prepared_{metric} counter")
+        for name, stats in statements:
+            lines.append(f'accuaim_db_prepared_{metric}{{statement="{name}"}} {stats[key] * scale!r}')
+    pool = pool_stats()
+    if pool:
+        lines.append("# HELP accuaim_db_pool Pool sizes and counters, see ConnectionPool.stats().")
+        lines.append("# TYPE accuaim_db_pool gauge")
+        for key, value in sorted(pool.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'accuaim_db_pool{{stat="{key}"}} {value!r}')
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def get_connection(function=None):
+    """
+    Borrows a pooled connection for the duration of a with-block. Connections
+    that raised a database-level error are closed rather than reused.
+
+    Args:
+        function (str, optional): name the wait for the connection is recorded
+            under; looked up with calling_function() when not given
+    """
+    pool = get_pool()
+    metrics = active_query_metrics()
+    started = time.perf_counter()
+    try:
+        conn = pool.getconn()
+    finally:
+        if metrics is not None:
+            metrics.record_wait(function or calling_function(), time.perf_counter() - started)
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+def current_transaction():
+    """
+    Returns the connection of the transaction open on this thread, or None.
+    """
+    return getattr(_local, 'conn', None)
+
+@contextmanager
+def transaction():
+    """
+    Runs every db_utils call inside the with-block on one pooled connection
+    and commits once at the end (or rolls back if the block raises).
+    Nested transaction() blocks join the outermost one.
+
+    Example:
+        with transaction():
+            exec_commit(sql_a, args_a)
+            row = exec_get_one(sql_b, args_b)
+    """
+    if current_transaction() is not None:
+        yield current_transaction()
+        return
+
+    with get_connection() as conn:
+        _local.conn = conn
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _local.conn = None
+
+def transactional(func):
+    """
+    Decorator form of transaction(): the whole function runs as one unit of work.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction():
+            return func(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def _connection(commit=False, function=None):
+    # Uses the thread's open transaction if there is one; otherwise borrows a
+    # connection for a single statement and commits it when asked to.
+    conn = current_transaction()
+    if conn is not None:
+        yield conn
+        return
+
+    with get_connection(function) as conn:
+        yield conn
+        if commit:
+            conn.commit()
+
+@contextmanager
+def _cursor(commit=False):
+    with _connection(commit) as conn:
+        yield conn.cursor()
 
 def exec_sql_file(path):
     full_path = os.path.join(os.path.dirname(__file__), f'{path}')
-    conn = connect()
-    cur = conn.cursor()
-    with open(full_path, 'r') as file:
-        cur.execute(file.read())
-    conn.commit()
-    conn.close()
+    with _cursor(commit=True) as cur:
+        with open(full_path, 'r') as file:
+            cur.execute(file.read())
+
+@contextmanager
+def _statement(sql, args, commit=False, run=_execute):
+    # Runs one statement on a cursor and records its latency (up to and
+    # including the commit), row count and outcome under the calling function.
+    # run may return the row count when cur.rowcount does not hold it. The
+    # caller is looked up once and also tags the wait for the connection.
+    metrics = active_query_metrics()
+    function = calling_function() if metrics is not None else None
+    joined = current_transaction() is not None
+    with _connection(function=function) as conn:
+        cur = conn.cursor()
+        started = time.perf_counter()
+        rows, failed = -1, True
+        try:
+            rows = run(cur, sql, args)
+            if rows is None:
+                rows = cur.rowcount
+            yield cur
+            if commit and not joined:
+                conn.commit()
+            failed = False
+        finally:
+            if metrics is not None:
+                metrics.record(function, sql, args, time.perf_counter() - started, rows, failed)
 
 def exec_get_one(sql, args={}):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute(sql, args)
-    one = cur.fetchone()
-    conn.close()
+    with _statement(sql, args) as cur:
+        one = cur.fetchone()
     return one
 
 def exec_get_all(sql, args={}):
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute(sql, args)
-    # https://www.psycopg.org/docs/cursor.html#cursor.fetchall
-    list_of_tuples = cur.fetchall()
-    conn.close()
+    with _statement(sql, args) as cur:
+        # https://www.psycopg.org/docs/cursor.html#cursor.fetchall
+        list_of_tuples = cur.fetchall()
     return list_of_tuples
 
 def exec_commit(sql, args={}):
-    #print("exec_commit:\n" + sql+"\n")
-    conn = connect()
-    cur = conn.cursor()
-    result = cur.execute(sql, args)
-    conn.commit()
-    conn.close()
-    return result
\ No newline at end of file
+    with _statement(sql, args, commit=True):
+        pass
+
+def exec_commit_returning(sql, args={}):
+    """
+    Runs a write statement that ends in RETURNING and commits it.
+
+    Returns:
+        tuple: the first returned row, or None
+    """
+    with _statement(sql, args, commit=True) as cur:
+        one = cur.fetchone()
+    return one
+
+def exec_insert_many(sql, rows, template=None, page_size=1000):
+    """
+    Inserts many rows with a single multi-row VALUES statement.
+
+    Args:
+        sql (str): statement with a single "VALUES %s" placeholder, optionally
+            ending in a RETURNING clause
+        rows (list): sequence of argument tuples, one per row
+        template (str, optional): per-row template, e.g. "(%s, %s::target_area)"
+        page_size (int): rows per statement sent to the server
+
+    Returns:
+        list: rows produced by RETURNING, or an empty list
+    """
+    if not rows:
+        return []
+    fetch = 'RETURNING' in sql.upper()
+    result = []
+
+    def run(cur, sql, rows):
+        result.extend(psycopg2.extras.execute_values(cur, sql, rows, template=template,
+                                                     page_size=page_size, fetch=fetch) or [])
+        return len(rows)
+
+    with _statement(sql, rows, commit=True, run=run):
+        pass
+    return result
+
+def exec_stream(sql, args={}, batch_size=1000):
+    """
+    Yields the rows of a query from a named (server-side) cursor, fetching
+    batch_size rows per round trip, so memory stays flat however many rows
+    match. The pooled connection is held until the generator is exhausted
+    or closed.
+
+    Args:
+        sql (str): the query
+        args (tuple/dict): query parameters
+        batch_size (int): rows fetched per round trip
+
+    Yields:
+        tuple: one row at a time
+    """
+    metrics = active_query_metrics()
+    function = calling_function() if metrics is not None else None
+    with _connection(function=function) as conn:
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        # Only the time spent in the database counts, not the consumer's
+        seconds, count, failed = 0.0, 0, False
+        try:
+            started = time.perf_counter()
+            cur.execute(sql, args)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                seconds += time.perf_counter() - started
+                if not rows:
+                    break
+                count += len(rows)
+                yield from rows
+                started = time.perf_counter()
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if metrics is not None:
+                metrics.record(function, sql, args, seconds, count, failed)
+            try:
+                cur.close()
+            except psycopg2.Error:
+                pass
@@ -0,0 +1,124 @@
+import numpy as np
+
+from api.db_utils import exec_commit, exec_get_one, load_config
+
+HEATMAP_DEFAULTS = {
+    'grid_size': 10,       # cells per side of the target
+    'max_grid_size': 50,
+}
+
+# Shot positions are fractions of the target's width and height
+POSITION_RANGE = ((0.0, 1.0), (0.0, 1.0))
+
+
+def heatmap_config():
+    config = dict(HEATMAP_DEFAULTS)
+    config.update(load_config().get('heatmap') or {})
+    return config
+
+
+def bin_positions(xs, ys, grid_size):
+    """
+    Counts shot positions per cell of a grid_size x grid_size grid with one
+    vectorized histogram.
+
+    Returns:
+        numpy.ndarray: integer counts indexed [row][column], row 0 at the bottom
+    """
+    counts, _, _ = np.histogram2d(np.asarray(ys, dtype=float), np.asarray(xs, dtype=float),
+                                  bins=grid_size, range=POSITION_RANGE)
+    return counts.astype(np.int64)
+
+
+def _result(grid, shots, grid_size):
+    return {'grid_size': grid_size, 'shots': int(shots), 'bins': grid.tolist()}
+
+
+def _positions(condition, args):
+    sql = f"""
+    SELECT COALESCE(array_agg(s.ShotPositionX), '{{}}'), COALESCE(array_agg(s.ShotPositionY), '{{}}')
+    FROM shots s
+    JOIN blocks b ON s.BlockID = b.BlockID
+    WHERE {condition} AND s.ShotPositionX IS NOT NULL AND s.ShotPositionY IS NOT NULL;
+    """
+    return exec_get_one(sql, args)
+
+
+def block_heatmap(block_id, grid_size):
+    """
+    Heatmap of one block, always binned from the raw shots.
+    """
+    xs, ys = _positions("s.BlockID = %(id)s", {'id': block_id})
+    return _result(bin_positions(xs, ys, grid_size), len(xs), grid_size)
+
+
+def compute_session_heatmap(session_id, grid_size):
+    """
+    Heatmap of one session binned from the raw shots.
+    """
+    xs, ys = _positions("b.SessionID = %(id)s", {'id': session_id})
+    return _result(bin_positions(xs, ys, grid_size), len(xs), grid_size)
+
+
+def session_heatmap(session_id, grid_size):
+    """
+    Heatmap of one session: the stored grid if the session has one, else
+    binned from the raw shots.
+    """
+    stored = exec_get_one("""
+    SELECT Bins, ShotCount FROM session_heatmaps WHERE SessionID = %s AND GridSize = %s;
+    """, (session_id, grid_size))
+    if stored:
+        return _result(np.array(stored[0], dtype=np.int64), stored[1], grid_size)
+    return compute_session_heatmap(session_id, grid_size)
+
+
+def store_session_heatmap(session_id, grid_size):
+    """
+    Computes and stores the session's grid, replacing any previous one.
+    Called when a session ends; a trigger drops the row again if the
+    session's shots change afterwards.
+    """
+    heatmap = compute_session_heatmap(session_id, grid_size)
+    exec_commit("""
+    INSERT INTO session_heatmaps (SessionID, GridSize, Bins, ShotCount)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (SessionID, GridSize) DO UPDATE
+    SET Bins = EXCLUDED.Bins, ShotCount = EXCLUDED.ShotCount, ComputedAt = CURRENT_TIMESTAMP;
+    """, (session_id, grid_size, heatmap['bins'], heatmap['shots']))
+    return heatmap
+
+
+def user_heatmap(user_id, grid_size):
+    """
+    All-time heatmap of a user: the stored grids of their sessions summed,
+    plus the raw shots of sessions without a stored grid (active ones, or
+    ones whose shots changed since they ended). One statement reads both, so
+    a grid stored meanwhile is never counted twice.
+    """
+    sql = """
+    WITH user_sessions AS (
+        SELECT SessionID FROM practice_sessions WHERE UserID = %(user_id)s
+    ),
+    stored AS (
+        SELECT h.SessionID, h.Bins, h.ShotCount
+        FROM session_heatmaps h
+        JOIN user_sessions us ON us.SessionID = h.SessionID
+        WHERE h.GridSize = %(grid_size)s
+    )
+    SELECT
+        (SELECT array_agg(Bins) FROM stored),
+        (SELECT COALESCE(SUM(ShotCount), 0) FROM stored),
+        COALESCE(array_agg(s.ShotPositionX), '{}'),
+        COALESCE(array_agg(s.ShotPositionY), '{}')
+    FROM user_sessions us
+    JOIN blocks b ON b.SessionID = us.SessionID
+    JOIN shots s ON s.BlockID = b.BlockID
+    WHERE us.SessionID NOT IN (SELECT SessionID FROM stored)
+      AND s.ShotPositionX IS NOT NULL AND s.ShotPositionY IS NOT NULL;
+    """
+    stored_bins, stored_shots, xs, ys = exec_get_one(sql, {'user_id': user_id, 'grid_size': grid_size})
+    grid = bin_positions(xs, ys, grid_size)
+    if stored_bins:
+        grid += np.array(stored_bins, dtype=np.int64).sum(axis=0)
+    return _result(grid, stored_shots + len(xs), grid_size)
@@ -0,0 +1,243 @@
+import json
+import threading
+from collections import Counter
+
+from api.db_utils import load_config
+from api.active_sessions import get_active_sessions
+
+LIVE_DEFAULTS = {
+    'heartbeat_seconds': 15,       # comment line sent on idle event streams
+    # The Flask app holds a worker thread per open stream, so it caps them
+    # (per process) and closes each after a while; EventSource reconnects.
+    # The ASGI app streams without threads and applies neither limit.
+    'flask_max_streams': 32,
+    'flask_stream_seconds': 300,
+}
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def live_config():
+    config = dict(LIVE_DEFAULTS)
+    config.update(load_config().get('live') or {})
+    return config
+
+
+class Subscription:
+    """
+    One client's view of a live session. Updates are coalesced per block
+    until the client collects them, so a slow reader holds at most one
+    pending entry per block instead of an ever-growing queue.
+
+    Args:
+        session_id (int): the session being watched
+        snapshot (list): block stats at subscribe time, as get_session_block_stats
+        notify (callable, optional): called after every update, e.g. to wake
+            an asyncio consumer with loop.call_soon_threadsafe
+    """
+
+    def __init__(self, session_id, snapshot, seq=0, notify=None):
+        self.session_id = session_id
+        self.snapshot = snapshot
+        self.seq = seq
+        self.closed = False
+        self._notify = notify
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._pending = {}
+
+    def push(self, seq, updates, closed=False):
+        with self._lock:
+            for update in updates:
+                previous = self._pending.get(update['BlockID'])
+                if previous is not None:
+                    update = dict(update, delta=previous['delta'] + update['delta'])
+                self._pending[update['BlockID']] = update
+            self.seq = seq
+            self.closed = self.closed or closed
+        self._ready.set()
+        if self._notify is not None:
+            self._notify()
+
+    def drain(self):
+        """
+        Returns:
+            tuple: (sequence number, list of block updates since the last drain)
+        """
+        with self._lock:
+            self._ready.clear()
+            updates = list(self._pending.values())
+            self._pending.clear()
+            return self.seq, updates
+
+    def wait(self, timeout):
+        """Blocks until an update arrives or timeout seconds pass, then drains."""
+        self._ready.wait(timeout)
+        return self.drain()
+
+
+class _LiveSession:
+    def __init__(self, blocks):
+        self.blocks = {block['BlockID']: dict(block) for block in blocks}
+        self.subscribers = set()
+        self.seq = 0
+
+    def apply(self, deltas):
+        updates = []
+        for block_id, delta in deltas.items():
+            block = self.blocks.get(block_id)
+            if block is None or not delta:
+                continue
+            block['MadeShots'] += delta
+            block['MissedShots'] = block['ShotsPlanned'] - block['MadeShots']
+            updates.append(dict(block, delta=delta))
+        return updates
+
+
+class LiveSessionHub:
+    """
+    Per-session made/missed counters for sessions someone is watching, kept
+    in memory and moved by the deltas published after each shot write, so
+    live screens get block updates pushed without re-running the block stats
+    aggregate. A session's counters are loaded once, when its first watcher
+    subscribes (from the active session store when it tracks the session),
+    and dropped with its last watcher or when the session ends.
+
+    Counters live in this process: run the live endpoints on the worker that
+    records the session's shots.
+
+    Args:
+        loader (callable): returns the block stats of a session, as
+            accuaim_db.get_session_block_stats
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def subscribe(self, session_id, notify=None):
+        with self._lock:
+            live = self._sessions.get(session_id)
+        if live is None:
+            # Loaded outside the lock so publishers for other sessions never wait on it
+            blocks = self._loader(session_id)
+            with self._lock:
+                live = self._sessions.setdefault(session_id, _LiveSession(blocks))
+        with self._lock:
+            subscription = Subscription(session_id, [dict(block) for block in live.blocks.values()],
+                                        live.seq, notify)
+            live.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            live = self._sessions.get(subscription.session_id)
+            if live is None:
+                return
+            live.subscribers.discard(subscription)
+            if not live.subscribers:
+                del self._sessions[subscription.session_id]
+
+    def publish(self, session_id, deltas):
+        """
+        Applies made-shot deltas ({BlockID: change}) to a watched session and
+        pushes the changed blocks to its subscribers. Sessions nobody watches
+        are skipped at the cost of one dict lookup.
+        """
+        with self._lock:
+            live = self._sessions.get(session_id)
+            if live is None:
+                return
+            updates = live.apply(deltas)
+            if not updates:
+                return
+            live.seq += 1
+            seq, subscribers = live.seq, list(live.subscribers)
+        for subscription in subscribers:
+            subscription.push(seq, updates)
+
+    def publish_updates(self, session_id, updates):
+        """
+        Pushes blocks whose counters were already computed elsewhere (the
+        active session store), replacing this hub's copy of them.
+        """
+        with self._lock:
+            live = self._sessions.get(session_id)
+            if live is None or not updates:
+                return
+            for update in updates:
+                block = live.blocks.get(update['BlockID'])
+                if block is not None:
+                    block['MadeShots'] = update['MadeShots']
+                    block['MissedShots'] = update['MissedShots']
+            live.seq += 1
+            seq, subscribers = live.seq, list(live.subscribers)
+        for subscription in subscribers:
+            subscription.push(seq, updates)
+
+    def end(self, session_id):
+        """Closes every stream of a session that has finished."""
+        with self._lock:
+            live = self._sessions.pop(session_id, None)
+        if live is not None:
+            for subscription in live.subscribers:
+                subscription.push(live.seq, [], closed=True)
+
+    def stats(self):
+        with self._lock:
+            return {'sessions': len(self._sessions),
+                    'subscribers': sum(len(live.subscribers) for live in self._sessions.values())}
+
+
+def get_live_hub():
+    """
+    Returns the process-wide live session hub.
+    """
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                # Imported here: accuaim_db publishes to this module
+                from api.accuaim_db import get_session_block_stats
+
+                def load(session_id):
+                    active = get_active_sessions().block_stats(session_id)
+                    return active[1] if active is not None else get_session_block_stats(session_id)
+
+                _hub = LiveSessionHub(load)
+    return _hub
+
+
+def publish_shots(session_id, block_ids, delta=1):
+    """
+    Call after shots for the given blocks were committed (delta=1) or
+    deleted (delta=-1). block_ids may repeat, once per shot. Moves the
+    active session counters and pushes the change to live subscribers.
+    """
+    counts = Counter(block_ids)
+    deltas = {block_id: count * delta for block_id, count in counts.items()}
+    updates = get_active_sessions().add_shots(session_id, deltas)
+    if updates is None:
+        get_live_hub().publish(session_id, deltas)
+    else:
+        get_live_hub().publish_updates(session_id, updates)
+
+
+def end_live_session(session_id):
+    """Call after a session was ended: evicts it and closes its streams."""
+    get_active_sessions().evict(session_id)
+    get_live_hub().end(session_id)
+
+
+def sse_event(event, data, event_id=None):
+    """
+    Formats one Server-Sent Events message.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
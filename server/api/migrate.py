@@ -0,0 +1,157 @@
+import hashlib
+import os
+import re
+from collections import namedtuple
+
+from api.db_utils import exec_commit, exec_get_all, exec_get_one, exec_sql_file, get_connection, transaction
+
+# Versioned schema changes. accuaim.sql is the baseline schema; every later
+# change is a file migrations/NNNN_description.sql, applied once, in version
+# order, each in its own transaction, and recorded in schema_migrations.
+# Files starting with NO_TRANSACTION run statement by statement outside a
+# transaction instead, for CREATE INDEX CONCURRENTLY and the like.
+
+MIGRATIONS_DIR = 'migrations'
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+# Advisory lock key so concurrent deploys apply migrations one at a time
+MIGRATION_LOCK_ID = 0x41636375
+NO_TRANSACTION = '-- migrate: no-transaction'
+
+Migration = namedtuple('Migration', 'version name path checksum transactional')
+
+RECORD_MIGRATION_SQL = """
+    INSERT INTO schema_migrations (Version, Name, Checksum) VALUES (%s, %s, %s);
+    """
+
+
+class MigrationError(Exception):
+    """Raised when an applied migration no longer matches its file."""
+
+
+def discover_migrations():
+    """
+    Lists the migration files in version order.
+
+    Returns:
+        list: Migration(version, name, path, checksum, transactional) tuples
+    """
+    directory = os.path.join(os.path.dirname(__file__), MIGRATIONS_DIR)
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), 'rb') as file:
+            content = file.read()
+        migrations.append(Migration(int(match.group(1)), match.group(2),
+                                    os.path.join(MIGRATIONS_DIR, filename),
+                                    hashlib.sha256(content).hexdigest(),
+                                    not content.startswith(NO_TRANSACTION.encode())))
+    return migrations
+
+
+def _ensure_migrations_table():
+    exec_commit("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        Version INT PRIMARY KEY,
+        Name VARCHAR(255) NOT NULL,
+        Checksum CHAR(64) NOT NULL,
+        AppliedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+
+def _is_applied(migration, recorded):
+    # recorded is the schema_migrations row of the migration, or None
+    if not recorded:
+        return False
+    if recorded[0] != migration.checksum:
+        raise MigrationError(f"Migration {migration.version} ({migration.name}) "
+                             "was changed after it was applied.")
+    return True
+
+
+def split_statements(sql):
+    """
+    Splits a NO_TRANSACTION migration into its statements, which end with a
+    ';' at the end of a line. Parts holding only comments are dropped.
+    """
+    statements = []
+    for part in re.split(r';[ \t]*(?:\n|$)', sql):
+        if any(line.strip() and not line.strip().startswith('--') for line in part.splitlines()):
+            statements.append(part.strip())
+    return statements
+
+
+def _apply_without_transaction(migration):
+    # Autocommit, one statement at a time, under the session form of the
+    # migration lock. A failed statement leaves the earlier ones applied, so
+    # these files must be safe to rerun (IF NOT EXISTS); a failed CREATE INDEX
+    # CONCURRENTLY leaves an INVALID index to drop before retrying.
+    with open(os.path.join(os.path.dirname(__file__), migration.path), 'r') as file:
+        statements = split_statements(file.read())
+    with get_connection() as conn:
+        conn.autocommit = True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                cur.execute("SELECT Checksum FROM schema_migrations WHERE Version = %s",
+                            (migration.version,))
+                if _is_applied(migration, cur.fetchone()):
+                    return False
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(RECORD_MIGRATION_SQL, (migration.version, migration.name, migration.checksum))
+                return True
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        finally:
+            conn.autocommit = False
+
+
+def migrate(target=None):
+    """
+    Applies every pending migration up to target (all of them by default).
+    Already applied migrations are skipped, so this is safe to run on every
+    deploy against a live database.
+
+    Args:
+        target (int): highest version to apply, or None for all
+
+    Returns:
+        list: the versions applied by this call
+
+    Raises:
+        MigrationError: if an applied migration's file has been edited since
+    """
+    _ensure_migrations_table()
+    applied = []
+    for migration in discover_migrations():
+        if target is not None and migration.version > target:
+            break
+        if not migration.transactional:
+            if _apply_without_transaction(migration):
+                applied.append(migration.version)
+            continue
+        with transaction():
+            exec_get_one("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            recorded = exec_get_one("SELECT Checksum FROM schema_migrations WHERE Version = %s",
+                                    (migration.version,))
+            if _is_applied(migration, recorded):
+                continue
+            exec_sql_file(migration.path)
+            exec_commit(RECORD_MIGRATION_SQL, (migration.version, migration.name, migration.checksum))
+        applied.append(migration.version)
+    return applied
+
+
+def migration_status():
+    """
+    Returns:
+        list: (version, name, applied_at) for every known migration, with
+        applied_at None for pending ones
+    """
+    _ensure_migrations_table()
+    applied = dict(exec_get_all("SELECT Version, AppliedAt FROM schema_migrations"))
+    return [(m.version, m.name, applied.get(m.version)) for m in discover_migrations()]
@@ -0,0 +1,18 @@
+-- migrate: no-transaction
+-- Built CONCURRENTLY so writes to shots, blocks and users carry on during the
+-- build on a live database; see migrate.NO_TRANSACTION.
+-- Indexes for the foreign-key and email lookups every request path uses.
+-- practice_sessions.UserID and (UserID, SessionStart) are already served by
+-- practice_sessions_user_start_idx from accuaim.sql.
+
+-- Shots of a block, in time order (made-shot counts, block/session shot lists)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS shots_block_time_idx ON shots (BlockID, ShotTime);
+
+-- Blocks of a session; covers the per-block aggregates so they never touch the heap
+CREATE INDEX CONCURRENTLY IF NOT EXISTS blocks_session_idx ON blocks (SessionID) INCLUDE (TargetArea, ShotsPlanned);
+
+-- Case-insensitive email lookups (login, create_user, update_user, get_user_by_email)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_lower_idx ON users (LOWER(Email));
+
+-- Leaderboard pages join user_stats to users for the names
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_id_name_idx ON users (UserID) INCLUDE (FullName);
@@ -0,0 +1,180 @@
+-- Range-partition shots by ShotTime (one partition per month, plus a default
+-- partition for rows outside them) and add the per-block summary table that
+-- archived partitions are rolled into.
+
+-- Move the existing table out of the way, keeping its ID sequence
+ALTER SEQUENCE shots_shotid_seq OWNED BY NONE;
+ALTER TABLE shots RENAME TO shots_legacy;
+ALTER TABLE shots_legacy RENAME CONSTRAINT shots_pkey TO shots_legacy_pkey;
+ALTER INDEX shots_block_time_idx RENAME TO shots_legacy_block_time_idx;
+
+-- The partition key has to be part of the primary key; ShotID stays unique
+-- because every row takes it from the same sequence
+CREATE TABLE shots (
+    ShotID INT NOT NULL DEFAULT nextval('shots_shotid_seq'),
+    BlockID INT NOT NULL,
+    ShotTime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ShotID, ShotTime),
+    FOREIGN KEY (BlockID) REFERENCES blocks(BlockID) ON DELETE CASCADE
+) PARTITION BY RANGE (ShotTime);
+
+CREATE TABLE shots_default PARTITION OF shots DEFAULT;
+
+-- Made shots of archived partitions, one row per block
+CREATE TABLE block_shot_summaries (
+    BlockID INT PRIMARY KEY,
+    MadeShots INT NOT NULL,
+    FirstShotTime TIMESTAMP NOT NULL,
+    LastShotTime TIMESTAMP NOT NULL,
+    FOREIGN KEY (BlockID) REFERENCES blocks(BlockID) ON DELETE CASCADE
+);
+
+-- Creates the monthly partitions shots_YYYY_MM from from_date's month through
+-- months_ahead months past the current one. Rows the default partition already
+-- holds for a new month are moved into it before it is attached.
+CREATE FUNCTION ensure_shot_partitions(from_date DATE, months_ahead INT) RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_date)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    month_end DATE;
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := 'shots_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE shots INCLUDING DEFAULTS)', partition_name);
+            EXECUTE format('WITH moved AS (DELETE FROM shots_default WHERE ShotTime >= %L AND ShotTime < %L RETURNING *)
+                            INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+            EXECUTE format('ALTER TABLE shots ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, month_start, month_end);
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rolls every monthly partition that ends on or before before_date into
+-- block_shot_summaries and drops it. user_stats totals are unaffected.
+CREATE FUNCTION archive_shot_partitions(before_date DATE) RETURNS INT AS $$
+DECLARE
+    part RECORD;
+    archived INT := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'shots'::regclass
+          AND c.relname ~ '^shots_[0-9]{4}_[0-9]{2}$'
+          AND to_date(substr(c.relname, 7), 'YYYY_MM') + INTERVAL '1 month' <= before_date
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('INSERT INTO block_shot_summaries AS bs (BlockID, MadeShots, FirstShotTime, LastShotTime)
+                        SELECT BlockID, COUNT(*), MIN(ShotTime), MAX(ShotTime) FROM %I GROUP BY BlockID
+                        ON CONFLICT (BlockID) DO UPDATE
+                        SET MadeShots = bs.MadeShots + EXCLUDED.MadeShots,
+                            FirstShotTime = LEAST(bs.FirstShotTime, EXCLUDED.FirstShotTime),
+                            LastShotTime = GREATEST(bs.LastShotTime, EXCLUDED.LastShotTime)', part.relname);
+        EXECUTE format('ALTER TABLE shots DETACH PARTITION %I', part.relname);
+        EXECUTE format('DROP TABLE %I', part.relname);
+        archived := archived + 1;
+    END LOOP;
+    RETURN archived;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for the months already holding shots through the next quarter,
+-- then copy the rows over (before the triggers exist, so user_stats is not
+-- counted twice)
+SELECT ensure_shot_partitions(COALESCE((SELECT MIN(ShotTime) FROM shots_legacy), CURRENT_TIMESTAMP)::date, 3);
+INSERT INTO shots (ShotID, BlockID, ShotTime)
+SELECT ShotID, BlockID, COALESCE(ShotTime, CURRENT_TIMESTAMP) FROM shots_legacy;
+
+DROP TABLE shots_legacy;
+ALTER SEQUENCE shots_shotid_seq OWNED BY shots.ShotID;
+
+CREATE INDEX shots_block_time_idx ON shots (BlockID, ShotTime);
+
+CREATE TRIGGER shots_stats_insert AFTER INSERT ON shots
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_on_shots_change();
+CREATE TRIGGER shots_stats_delete AFTER DELETE ON shots
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_stats_on_shots_change();
+
+-- Made-shot totals now also include archived shots
+CREATE OR REPLACE FUNCTION rebuild_user_stats() RETURNS void AS $$
+BEGIN
+    INSERT INTO user_stats (UserID)
+    SELECT UserID FROM users
+    ON CONFLICT (UserID) DO NOTHING;
+
+    UPDATE user_stats us
+    SET TotalPlanned = COALESCE((
+            SELECT SUM(b.ShotsPlanned)
+            FROM practice_sessions ps JOIN blocks b ON ps.SessionID = b.SessionID
+            WHERE ps.UserID = us.UserID), 0),
+        TotalMade = COALESCE((
+            SELECT COUNT(s.ShotID)
+            FROM practice_sessions ps
+            JOIN blocks b ON ps.SessionID = b.SessionID
+            JOIN shots s ON b.BlockID = s.BlockID
+            WHERE ps.UserID = us.UserID), 0) + COALESCE((
+            SELECT SUM(bs.MadeShots)
+            FROM practice_sessions ps
+            JOIN blocks b ON ps.SessionID = b.SessionID
+            JOIN block_shot_summaries bs ON b.BlockID = bs.BlockID
+            WHERE ps.UserID = us.UserID), 0),
+        CurrentStreak = 0,
+        LastPracticeDate = NULL,
+        LastSessionID = NULL,
+        LastSessionStart = NULL,
+        LastSessionPlanned = 0,
+        LastSessionMade = 0,
+        DataVersion = nextval('data_version_seq');
+
+    -- Streak: length of the run of consecutive days ending at the latest practice day
+    WITH PracticeDays AS (
+        SELECT DISTINCT UserID, SessionStart::date AS practice_date
+        FROM practice_sessions
+    ),
+    Runs AS (
+        SELECT UserID, practice_date,
+               practice_date - (ROW_NUMBER() OVER (PARTITION BY UserID ORDER BY practice_date))::int AS run_id
+        FROM PracticeDays
+    ),
+    LatestRun AS (
+        SELECT DISTINCT ON (UserID) UserID, MAX(practice_date) AS last_day, COUNT(*) AS streak
+        FROM Runs
+        GROUP BY UserID, run_id
+        ORDER BY UserID, MAX(practice_date) DESC
+    )
+    UPDATE user_stats us
+    SET CurrentStreak = lr.streak,
+        LastPracticeDate = lr.last_day
+    FROM LatestRun lr
+    WHERE us.UserID = lr.UserID;
+
+    WITH LastSession AS (
+        SELECT DISTINCT ON (UserID) UserID, SessionID, SessionStart
+        FROM practice_sessions
+        ORDER BY UserID, SessionStart DESC, SessionID DESC
+    )
+    UPDATE user_stats us
+    SET LastSessionID = ls.SessionID,
+        LastSessionStart = ls.SessionStart,
+        LastSessionPlanned = COALESCE((
+            SELECT SUM(b.ShotsPlanned) FROM blocks b WHERE b.SessionID = ls.SessionID), 0),
+        LastSessionMade = COALESCE((
+            SELECT COUNT(s.ShotID) FROM blocks b JOIN shots s ON b.BlockID = s.BlockID
+            WHERE b.SessionID = ls.SessionID), 0) + COALESCE((
+            SELECT SUM(bs.MadeShots) FROM blocks b JOIN block_shot_summaries bs ON b.BlockID = bs.BlockID
+            WHERE b.SessionID = ls.SessionID), 0)
+    FROM LastSession ls
+    WHERE us.UserID = ls.UserID;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,68 @@
+-- Where each made shot hit the target, as fractions of the target's width
+-- (0 = left edge) and height (0 = bottom edge). NULL when the client did not
+-- report a position.
+ALTER TABLE shots
+    ADD COLUMN ShotPositionX REAL CHECK (ShotPositionX BETWEEN 0 AND 1),
+    ADD COLUMN ShotPositionY REAL CHECK (ShotPositionY BETWEEN 0 AND 1);
+
+-- Heatmap grids of ended sessions, GridSize x GridSize shot counts with
+-- Bins[row][column], row 1 at the bottom. Written when a session ends and
+-- summed for all-time user heatmaps; dropped whenever the session's shots
+-- change so it is recomputed from the raw rows.
+CREATE TABLE session_heatmaps (
+    SessionID INT NOT NULL,
+    GridSize INT NOT NULL,
+    Bins INT[] NOT NULL,
+    ShotCount INT NOT NULL,
+    ComputedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (SessionID, GridSize),
+    FOREIGN KEY (SessionID) REFERENCES practice_sessions(SessionID) ON DELETE CASCADE
+);
+
+CREATE FUNCTION session_heatmaps_on_shots_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        DELETE FROM session_heatmaps h
+        USING new_rows nr JOIN blocks b ON nr.BlockID = b.BlockID
+        WHERE h.SessionID = b.SessionID;
+    ELSE
+        DELETE FROM session_heatmaps h
+        USING old_rows orw JOIN blocks b ON orw.BlockID = b.BlockID
+        WHERE h.SessionID = b.SessionID;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER shots_heatmap_insert AFTER INSERT ON shots
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION session_heatmaps_on_shots_change();
+CREATE TRIGGER shots_heatmap_delete AFTER DELETE ON shots
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION session_heatmaps_on_shots_change();
+
+-- Partitions must carry the parent's CHECK constraints to be attached
+CREATE OR REPLACE FUNCTION ensure_shot_partitions(from_date DATE, months_ahead INT) RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_date)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    month_end DATE;
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := 'shots_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE shots INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+            EXECUTE format('WITH moved AS (DELETE FROM shots_default WHERE ShotTime >= %L AND ShotTime < %L RETURNING *)
+                            INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+            EXECUTE format('ALTER TABLE shots ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, month_start, month_end);
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
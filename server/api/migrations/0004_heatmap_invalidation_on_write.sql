@@ -0,0 +1,16 @@
+-- Stored heatmap grids only exist for ended sessions, yet the statement
+-- trigger from 0003 ran a DELETE against session_heatmaps on every shot
+-- insert. Inserts now drop the grids of their sessions themselves, in the
+-- same statement and only on the paths that can reach an ended session
+-- (accuaim_db.RECORD_SHOT_SQL, record_new_shots, the shot buffer); the
+-- active-session insert skips it. Deleting shots is rare and keeps the trigger.
+DROP TRIGGER IF EXISTS shots_heatmap_insert ON shots;
+
+CREATE OR REPLACE FUNCTION session_heatmaps_on_shots_change() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM session_heatmaps h
+    USING old_rows orw JOIN blocks b ON orw.BlockID = b.BlockID
+    WHERE h.SessionID = b.SessionID;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,46 @@
+-- The partitioned shots table can only be unique on (ShotID, ShotTime), so
+-- ShotID uniqueness rests on every ID coming from shots_shotid_seq
+-- (reorder_shots renumbers from it too). Each partition also gets a unique
+-- index on ShotID, so a duplicate within a month fails instead of making
+-- remove_shot delete several rows.
+DO $$
+DECLARE
+    part RECORD;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'shots'::regclass
+    LOOP
+        EXECUTE format('CREATE UNIQUE INDEX IF NOT EXISTS %I ON %I (ShotID)',
+                       part.relname || '_shotid_key', part.relname);
+    END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION ensure_shot_partitions(from_date DATE, months_ahead INT) RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_date)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    month_end DATE;
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := 'shots_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE shots INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+            EXECUTE format('CREATE UNIQUE INDEX %I ON %I (ShotID)', partition_name || '_shotid_key', partition_name);
+            EXECUTE format('WITH moved AS (DELETE FROM shots_default WHERE ShotTime >= %L AND ShotTime < %L RETURNING *)
+                            INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+            EXECUTE format('ALTER TABLE shots ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, month_start, month_end);
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
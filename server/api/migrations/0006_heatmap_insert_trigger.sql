@@ -0,0 +1,25 @@
+-- Back to invalidating stored heatmap grids in the database on every write
+-- path, as user_stats is maintained: 0004 moved the insert side into the
+-- INSERT statements of accuaim_db and the shot buffer, which missed inserts
+-- made elsewhere. The statement trigger reads the inserted rows from its
+-- transition table, so a statement costs one index probe per session it
+-- touched, whatever the number of rows.
+CREATE OR REPLACE FUNCTION session_heatmaps_on_shots_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        DELETE FROM session_heatmaps h
+        WHERE h.SessionID IN (
+            SELECT DISTINCT b.SessionID FROM new_rows nr JOIN blocks b ON nr.BlockID = b.BlockID);
+    ELSE
+        DELETE FROM session_heatmaps h
+        WHERE h.SessionID IN (
+            SELECT DISTINCT b.SessionID FROM old_rows orw JOIN blocks b ON orw.BlockID = b.BlockID);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS shots_heatmap_insert ON shots;
+CREATE TRIGGER shots_heatmap_insert AFTER INSERT ON shots
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION session_heatmaps_on_shots_change();
@@ -0,0 +1,163 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from api.db_utils import load_config
+
+PASSWORD_DEFAULTS = {
+    'bcrypt_rounds': 12,
+    'workers': 2,          # processes doing bcrypt work; 0 runs it inline
+    'max_pending': 32,     # requests allowed to wait for a worker
+    'queue_timeout': 5.0,  # seconds a request waits for a queue slot
+}
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+class PasswordQueueFullError(Exception):
+    """Raised when too many password operations are already waiting."""
+
+
+def _hash_in_worker(password, rounds):
+    started = time.time()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return hashed, started, time.time() - started
+
+
+def _check_in_worker(password, hashed):
+    started = time.time()
+    matches = bcrypt.checkpw(password, hashed)
+    return matches, started, time.time() - started
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a pool of worker processes so the
+    ~250ms of CPU per call does not stall request threads.
+
+    At most workers operations run at once and at most max_pending more wait
+    for a worker; beyond that callers wait up to queue_timeout seconds for a
+    slot and then get PasswordQueueFullError.
+
+    Args:
+        rounds (int): bcrypt cost factor for new hashes
+        workers (int): worker processes; 0 hashes inline on the calling thread
+        max_pending (int): queued operations allowed beyond the running ones
+        queue_timeout (float): seconds to wait for a queue slot
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=32, queue_timeout=5.0):
+        self.rounds = rounds
+        self.queue_timeout = queue_timeout
+        self._executor = None
+        if workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + max_pending)
+        self._lock = threading.Lock()
+        self._stats = {
+            'operations': 0,
+            'rejected': 0,
+            'queue_wait_seconds_total': 0.0,
+            'queue_wait_seconds_max': 0.0,
+            'hash_seconds_total': 0.0,
+            'hash_seconds_max': 0.0,
+        }
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise PasswordQueueFullError("Too many password operations in progress.")
+        try:
+            submitted = time.time()
+            if self._executor is None:
+                result, started, elapsed = func(*args)
+            else:
+                result, started, elapsed = self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+        waited = max(0.0, started - submitted)
+        with self._lock:
+            self._stats['operations'] += 1
+            self._stats['queue_wait_seconds_total'] += waited
+            self._stats['queue_wait_seconds_max'] = max(self._stats['queue_wait_seconds_max'], waited)
+            self._stats['hash_seconds_total'] += elapsed
+            self._stats['hash_seconds_max'] = max(self._stats['hash_seconds_max'], elapsed)
+        return result
+
+    def hash(self, password):
+        """
+        Hashes a password with the configured cost factor.
+
+        Returns:
+            str: the bcrypt hash
+        """
+        hashed = self._run(_hash_in_worker, password.encode('utf-8'), self.rounds)
+        return hashed.decode('utf-8')
+
+    def check(self, password, hashed):
+        """
+        Returns True if the password matches the stored bcrypt hash.
+        """
+        return self._run(_check_in_worker, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """
+        Returns True if the stored hash was made with a different cost factor.
+        """
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_hasher():
+    """
+    Returns the process-wide PasswordHasher configured by the 'passwords'
+    section of db.yml.
+    """
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                config = dict(PASSWORD_DEFAULTS)
+                config.update(load_config().get('passwords') or {})
+                _hasher = PasswordHasher(config['bcrypt_rounds'], config['workers'],
+                                         config['max_pending'], config['queue_timeout'])
+    return _hasher
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def check_password(password, hashed):
+    return get_hasher().check(password, hashed)
+
+
+def password_needs_rehash(hashed):
+    return get_hasher().needs_rehash(hashed)
+
+
+def password_stats():
+    """
+    Returns counters for password work: operations, rejections, time spent
+    waiting for a worker and time spent hashing.
+    """
+    if _hasher is None:
+        return {}
+    return _hasher.stats()
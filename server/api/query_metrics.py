@@ -0,0 +1,215 @@
+import hmac
+import logging
+import threading
+from bisect import bisect_left
+
+# Aggregates of the statements run through db_utils and async_db, tagged with
+# the accuaim_db / accuaim_async function they ran for. db_utils owns the
+# process-wide instance (get_query_metrics) and feeds it.
+
+logger = logging.getLogger('accuaim.queries')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_LOGGED_SQL_CHARS = 500
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with Prometheus semantics: a value is counted in
+    the first bucket whose upper bound is >= the value.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        Returns:
+            list: (upper bound label, values <= bound) pairs, ending with '+Inf'
+        """
+        buckets, total = [], 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            buckets.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return buckets
+
+    def snapshot(self):
+        return {'buckets': dict(self.cumulative()), 'count': self.count, 'sum': self.sum}
+
+
+class _FunctionStats:
+    __slots__ = ('latency', 'rows', 'errors', 'slow', 'wait_seconds', 'waits')
+
+    def __init__(self, bounds):
+        self.latency = Histogram(bounds)
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+        self.wait_seconds = 0.0
+        self.waits = 0
+
+
+def redact(args):
+    """
+    Describes query parameters by type only, so the slow query log never
+    holds emails, password hashes or other user data.
+    """
+    if isinstance(args, dict):
+        return {key: type(value).__name__ for key, value in args.items()}
+    if isinstance(args, (list, tuple)):
+        if len(args) > 10:
+            return f"<{len(args)} values>"
+        return [type(value).__name__ for value in args]
+    return type(args).__name__
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class QueryMetrics:
+    """
+    Per-function statement latency histograms, row counts, errors and slow
+    statement counts, plus the time spent waiting for a pooled connection.
+    Statements slower than slow_query_ms are logged to the 'accuaim.queries'
+    logger with their parameters redacted.
+
+    Args:
+        slow_query_ms (float): latency from which a statement is logged, or None
+            to log nothing
+        buckets (tuple): histogram upper bounds in seconds
+    """
+
+    def __init__(self, slow_query_ms=200, buckets=LATENCY_BUCKETS):
+        self.slow_query_ms = slow_query_ms
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._functions = {}
+        self._acquire = Histogram(self.buckets)
+
+    def _function(self, name):
+        stats = self._functions.get(name)
+        if stats is None:
+            stats = self._functions[name] = _FunctionStats(self.buckets)
+        return stats
+
+    def record(self, function, sql, args, seconds, rows, failed=False):
+        """
+        Adds one statement run for function that took seconds (including its
+        commit) and returned or affected rows rows (-1 when unknown).
+        """
+        slow = self.slow_query_ms is not None and seconds * 1000.0 >= self.slow_query_ms
+        with self._lock:
+            stats = self._function(function)
+            stats.latency.observe(seconds)
+            if rows > 0:
+                stats.rows += rows
+            if failed:
+                stats.errors += 1
+            if slow:
+                stats.slow += 1
+        if slow:
+            logger.warning("slow query in %s: %.1f ms, %s rows%s: %s params=%s",
+                           function, seconds * 1000.0, rows, " (failed)" if failed else "",
+                           " ".join(sql.split())[:_LOGGED_SQL_CHARS], redact(args))
+
+    def record_wait(self, function, seconds):
+        """Adds the time function waited to borrow a pooled connection."""
+        with self._lock:
+            self._acquire.observe(seconds)
+            stats = self._function(function)
+            stats.waits += 1
+            stats.wait_seconds += seconds
+
+    def reset(self):
+        with self._lock:
+            self._functions.clear()
+            self._acquire = Histogram(self.buckets)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: 'functions' (name -> calls, latency histogram in seconds,
+                rows, errors, slow, connection waits) and the overall
+                'connection_acquire' histogram
+        """
+        with self._lock:
+            functions = {
+                name: {
+                    'calls': stats.latency.count,
+                    'seconds_total': stats.latency.sum,
+                    'avg_ms': stats.latency.sum * 1000.0 / stats.latency.count if stats.latency.count else 0.0,
+                    'latency': stats.latency.snapshot(),
+                    'rows': stats.rows,
+                    'errors': stats.errors,
+                    'slow': stats.slow,
+                    'connection_waits': stats.waits,
+                    'connection_wait_seconds': stats.wait_seconds,
+                }
+                for name, stats in self._functions.items()
+            }
+            return {'functions': functions, 'connection_acquire': self._acquire.snapshot(),
+                    'slow_query_ms': self.slow_query_ms}
+
+    def prometheus(self, prefix='accuaim_db'):
+        """
+        Returns:
+            str: the aggregates in the Prometheus text exposition format
+        """
+        with self._lock:
+            functions = sorted(self._functions.items())
+            lines = [
+                f"# HELP {prefix}_query_duration_seconds Statement latency including commit, by calling function.",
+                f"# TYPE {prefix}_query_duration_seconds histogram",
+            ]
+            for name, stats in functions:
+                if not stats.latency.count:
+                    continue
+                label = f'function="{_label(name)}"'
+                for bound, count in stats.latency.cumulative():
+                    lines.append(f'{prefix}_query_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f"{prefix}_query_duration_seconds_sum{{{label}}} {stats.latency.sum!r}")
+                lines.append(f"{prefix}_query_duration_seconds_count{{{label}}} {stats.latency.count}")
+
+            for metric, attribute, help_text in (
+                    ('query_rows_total', 'rows', 'Rows returned or affected, by calling function.'),
+                    ('query_errors_total', 'errors', 'Statements that raised, by calling function.'),
+                    ('query_slow_total', 'slow', 'Statements over the slow query threshold, by calling function.'),
+                    ('connection_wait_seconds_total', 'wait_seconds',
+                     'Time spent waiting for a pooled connection, by calling function.')):
+                lines.append(f"# HELP {prefix}_{metric} {help_text}")
+                lines.append(f"# TYPE {prefix}_{metric} counter")
+                for name, stats in functions:
+                    lines.append(f'{prefix}_{metric}{{function="{_label(name)}"}} {getattr(stats, attribute)!r}')
+
+            lines.append(f"# HELP {prefix}_connection_acquire_seconds Time to borrow a pooled connection.")
+            lines.append(f"# TYPE {prefix}_connection_acquire_seconds histogram")
+            for bound, count in self._acquire.cumulative():
+                lines.append(f'{prefix}_connection_acquire_seconds_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{prefix}_connection_acquire_seconds_sum {self._acquire.sum!r}")
+            lines.append(f"{prefix}_connection_acquire_seconds_count {self._acquire.count}")
+        return "\n".join(lines) + "\n"
+
+
+def metrics_access_allowed(authorization, token=None):
+    """
+    Decides whether a request may read the query metrics: it must send
+    "Authorization: Bearer <token>" with the configured token. Without a
+    token nobody may; the client address proves nothing behind a proxy.
+    """
+    if not token:
+        return False
+    scheme, _, sent = (authorization or '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(sent.strip().encode(), str(token).encode())
@@ -0,0 +1,67 @@
+import json
+
+from api import accuaim_db as db
+from api.db_utils import exec_commit, exec_get_one, transaction
+
+# Hot queries that must stay index-backed as the tables grow: the statements
+# accuaim_db actually runs, with sample arguments.
+HOT_QUERIES = {
+    'login_by_email': (db.LOGIN_SQL, ('john@example.com',)),
+    'user_sessions': (db.USER_SESSIONS_SQL, (1,)),
+    'user_sessions_page': tuple(db._sessions_page_query(1, None, db.SESSIONS_PAGE_SIZE)[key]
+                                for key in ('sql', 'args')),
+    'session_blocks': (db.SESSION_BLOCKS_SQL, (1,)),
+    'session_block_stats': (db.SESSION_BLOCK_STATS_SQL, (1,)),
+    'session_data': (db.SESSION_DATA_SQL, {'session_id': 1, 'user_id': 1}),
+    'block_shots': (db.BLOCK_MADE_SHOTS_SQL, (1,)),
+    'dashboard_stats': (db.DASHBOARD_SQL, {'user_id': 1}),
+    'leaderboard': tuple(db._leaderboard_query('accuracy', None, db.LEADERBOARD_PAGE_SIZE)[key]
+                         for key in ('sql', 'args')),
+}
+
+
+def _seq_scans(plan):
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', ()):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def explain(sql, args=()):
+    """
+    Returns the JSON plan the planner picks for sql when sequential scans are
+    priced out, i.e. the plan it falls back to only if no index can be used.
+    """
+    with transaction():
+        exec_commit("SET LOCAL enable_seqscan = off")
+        plan = exec_get_one("EXPLAIN (FORMAT JSON) " + sql, args)[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def check_hot_queries(queries=None):
+    """
+    Explains every registered hot query and reports the ones that still need
+    a sequential scan.
+
+    Returns:
+        dict: query name -> list of tables read by Seq Scan (empty when all
+        queries are index-backed)
+    """
+    failures = {}
+    for name, (sql, args) in (queries or HOT_QUERIES).items():
+        tables = _seq_scans(explain(sql, args))
+        if tables:
+            failures[name] = tables
+    return failures
+
+
+if __name__ == "__main__":
+    import sys
+    failures = check_hot_queries()
+    for name, tables in failures.items():
+        print(f"{name}: sequential scan on {', '.join(tables)}")
+    sys.exit(1 if failures else 0)
@@ -1,6 +1,6 @@
 from flask import request
 from flask_restful import Resource, reqparse
-from api.accuaim_db import record_new_shot, update_session_end_time
+from api.accuaim_db import record_new_shot, record_new_shots, update_session_end_time
 
 # This resource handles actions performed on a session that is currently "active".
 # It's mapped to /user/<int:UserID>/sessions/<int:SessionID>/active-session in your app.py
@@ -13,12 +13,18 @@ class ActiveSession(Resource):
         """
         parser = reqparse.RequestParser()
         parser.add_argument('block_id', type=int, required=True, help='Block ID is required to record a shot')
+        parser.add_argument('position_x', type=float, default=None, help='Horizontal hit position (0-1)')
+        parser.add_argument('position_y', type=float, default=None, help='Vertical hit position (0-1)')
         args = parser.parse_args()
 
+        for key in ('position_x', 'position_y'):
+            if args[key] is not None and not 0 <= args[key] <= 1:
+                return {'message': f'Error: {key} must be between 0 and 1.'}, 400
+
         # Optional: For added security, you could verify here that the
         # block_id belongs to the session_id and user_id.
 
-        result = record_new_shot(args['block_id'])
+        result = record_new_shot(args['block_id'], args['position_x'], args['position_y'])
 
         if "successfully" in result:
             # Return the latest stats for the session after the shot is recorded.
@@ -34,4 +40,26 @@ class ActiveSession(Resource):
         if "correctly" in result:
             return {'message': f'Session {SessionID} finished successfully.'}, 200
         else:
-            return {'message': f'Failed to end session: {result}'}, 500
\ No newline at end of file
+            return {'message': f'Failed to end session: {result}'}, 500
+
+# Mapped to /user/<int:UserID>/sessions/<int:SessionID>/active-session/shots.
+# Lets a client (e.g. the sensor prototype) send many shots in one request.
+
+class ActiveSessionShots(Resource):
+
+    def post(self, UserID, SessionID):
+        """
+        Records a batch of shots for the active session.
+        Body: {"shots": [{"block_id": 1, "timestamp": "...", "position_x": 0.4, "position_y": 0.7}, ...]}
+        """
+        data = request.get_json(silent=True) or {}
+        result = record_new_shots(UserID, SessionID, data.get('shots'))
+
+        if "error" in result:
+            if result["error"].startswith("Error:"):
+                return {'message': result["error"]}, 400
+            if result["error"].startswith("An error occurred"):
+                return {'message': result["error"]}, 500
+            return {'message': result["error"]}, 404
+
+        return result, 201
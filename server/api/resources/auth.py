@@ -0,0 +1,21 @@
+from flask import request
+
+from api.auth_tokens import verify_token
+
+# Access-token helpers for the resources in this package.
+
+def bearer_token():
+    """
+    Returns the token from an "Authorization: Bearer <token>" header, or None.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+def token_user_id():
+    """
+    Returns the UserID of a valid bearer token sent with this request, or None.
+    """
+    token = bearer_token()
+    return verify_token(token) if token else None
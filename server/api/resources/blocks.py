@@ -3,7 +3,17 @@ from flask_restful import Resource, request
 
 from api.accuaim_db import *
 from api.db_utils import *
+from api.resources.responses import conditional_json, make_etag, stream_json_array
 
 class Blocks(Resource):
     def get(self):
-        return jsonify(get_all_blocks())
\ No newline at end of file
+        """
+        Streams blocks as a JSON array. Optional filters: session_id,
+        target_area; pagination: after_id (last BlockID seen), limit.
+        """
+        filters = (request.args.get('session_id', type=int),
+                   request.args.get('target_area'),
+                   request.args.get('after_id', type=int),
+                   request.args.get('limit', type=int))
+        etag = make_etag('blocks', get_global_data_version(), *filters)
+        return conditional_json(etag, lambda: stream_json_array(stream_all_blocks(*filters)))
@@ -1,20 +1,28 @@
 from flask import jsonify
 from flask_restful import Resource
 from flask_restful import request
-from ..accuaim_db import change_password
+from ..accuaim_db import change_password, PASSWORD_BUSY_MESSAGE
+from ..auth_tokens import issue_token
+from .auth import token_user_id
 
 class ChangePassword(Resource):
     def put(self, UserID):
         data = request.get_json()
+        # A valid bearer token for this user stands in for the current password
+        authenticated = token_user_id() == UserID
         
         # --- Validation: Return JSON and a 400 status code for bad requests ---
-        if not data or "current_password" not in data or "new_password" not in data:
+        if not data or "new_password" not in data or (not authenticated and "current_password" not in data):
             # Use a dictionary and a status code. flask_restful handles it correctly.
             return {"message": "Error: Missing required password fields."}, 400
         
         # Call your database function, which returns a plain string
-        result_message = change_password(UserID, data['current_password'], data['new_password'])
+        result_message = change_password(UserID, data.get('current_password'), data['new_password'],
+                                         authenticated=authenticated)
         
+        if result_message == PASSWORD_BUSY_MESSAGE:
+            return {"message": result_message}, 503
+
         # --- THE FIX: Check the result and format the response ---
         # Check if the string indicates an error
         if "Error:" in result_message:
@@ -24,4 +32,5 @@ class ChangePassword(Resource):
         else:
             # If it's a success, return a JSON object with the message and a 200 status code
             # This will make `response.ok` TRUE on the frontend.
-            return {"message": result_message}, 200
\ No newline at end of file
+            # Older tokens were revoked by the change, so hand out a fresh one.
+            return {"message": result_message, "token": issue_token(UserID)}, 200
\ No newline at end of file
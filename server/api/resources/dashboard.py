@@ -3,9 +3,11 @@ from flask_restful import Resource
 
 from api.accuaim_db import *
 from api.db_utils import *
+from api.resources.responses import conditional_json, make_etag
 
 class Dashboard(Resource):
     def get(self, UserID):
-        result = get_user_dashboard_stats(UserID)
-        return jsonify(result)
-        
\ No newline at end of file
+        version = get_user_data_version(UserID)
+        etag = make_etag('dashboard', version, UserID) if version is not None else None
+        return conditional_json(etag, lambda: get_user_dashboard_stats(UserID, version))
+        
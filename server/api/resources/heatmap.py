@@ -0,0 +1,49 @@
+from flask_restful import Resource, reqparse
+from api.accuaim_db import get_heatmap, get_user_data_version
+from api.resources.responses import conditional_json, make_etag
+
+parser = reqparse.RequestParser()
+
+parser.add_argument(
+    'session_id',
+    type=int,
+    default=None,
+    help='Only shots of this session',
+    location='args'
+)
+parser.add_argument(
+    'block_id',
+    type=int,
+    default=None,
+    help='Only shots of this block',
+    location='args'
+)
+parser.add_argument(
+    'grid',
+    type=int,
+    default=None,
+    help='Cells per side of the heatmap grid',
+    location='args'
+)
+
+class Heatmap(Resource):
+    def get(self, UserID):
+        """
+        Handles GET requests for a user's shot heatmap: all-time by default,
+        or for one session or block. The body's bins are rows of shot counts,
+        bottom row first.
+        """
+        args = parser.parse_args()
+        version = get_user_data_version(UserID)
+        etag = make_etag('heatmap', version, UserID, args['session_id'], args['block_id'],
+                         args['grid']) if version is not None else None
+
+        def load():
+            heatmap = get_heatmap(UserID, session_id=args['session_id'], block_id=args['block_id'],
+                                  grid_size=args['grid'])
+            if "error" in heatmap:
+                status = 400 if heatmap["error"].startswith("Error:") else 404
+                return {"message": heatmap["error"]}, status
+            return heatmap
+
+        return conditional_json(etag, load)
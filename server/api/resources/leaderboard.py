@@ -1,28 +1,53 @@
 from flask_restful import Resource, reqparse
-from api.accuaim_db import get_leaderboard_stats
+from api.accuaim_db import get_leaderboard_page, get_global_data_version, LEADERBOARD_PAGE_SIZE
+from api.resources.responses import conditional_json, make_etag
 
 parser = reqparse.RequestParser()
 
 parser.add_argument(
-    'sort_by', 
-    type=str, 
-    default='accuracy', 
-    help='Sort leaderboard by a specific metric (accuracy, made, planned)', 
-    location='args'  
+    'sort_by',
+    type=str,
+    default='accuracy',
+    help='Sort leaderboard by a specific metric (accuracy, made, planned)',
+    location='args'
+)
+parser.add_argument(
+    'after',
+    type=str,
+    default=None,
+    help='Cursor from the X-Next-Cursor header of the previous page',
+    location='args'
+)
+parser.add_argument(
+    'limit',
+    type=int,
+    default=LEADERBOARD_PAGE_SIZE,
+    help='Page size (at most %d)' % LEADERBOARD_PAGE_SIZE,
+    location='args'
 )
 
 class Leaderboard(Resource):
     def get(self):
         """
         Handles GET requests for the leaderboard and supports sorting.
+        The body is the list of entries; when more entries follow, the cursor
+        for the next page is returned in the X-Next-Cursor header.
         """
         args = parser.parse_args()
-        
-        sort_option = args['sort_by']
-        
-        stats = get_leaderboard_stats(sort_by=sort_option)
-        
-        if stats:
-            return stats, 200
-        else:
-            return [], 200
\ No newline at end of file
+        version = get_global_data_version()
+        etag = make_etag('leaderboard', version, args['sort_by'], args['after'], args['limit'])
+
+        def load():
+            page = get_leaderboard_page(sort_by=args['sort_by'], after=args['after'], limit=args['limit'],
+                                        version=version)
+
+            if "error" in page:
+                return {"message": page["error"]}, 400
+
+            headers = {}
+            if page['next_cursor']:
+                headers['X-Next-Cursor'] = page['next_cursor']
+
+            return page['entries'], 200, headers
+
+        return conditional_json(etag, load)
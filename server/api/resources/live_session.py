@@ -0,0 +1,79 @@
+import threading
+import time
+
+from flask import Response, stream_with_context
+from flask_restful import Resource
+
+from api.accuaim_db import SESSION_OWNER_SQL, SESSION_NOT_FOUND, _session_summary
+from api.db_utils import exec_get_one
+from api.live_sessions import get_live_hub, live_config, sse_event
+
+# Mapped to /user/<int:UserID>/sessions/<int:SessionID>/live.
+# Lets the active session screen follow its counters without polling.
+# Each open stream holds a worker thread here; see LIVE_DEFAULTS for the cap
+# and prefer the ASGI app (server/asgi.py) for many watchers.
+
+_streams = None
+_streams_lock = threading.Lock()
+
+def _stream_slots():
+    global _streams
+    if _streams is None:
+        with _streams_lock:
+            if _streams is None:
+                _streams = threading.BoundedSemaphore(live_config()['flask_max_streams'])
+    return _streams
+
+class LiveSessionEvents(Resource):
+    def get(self, UserID, SessionID):
+        """
+        Streams the session as Server-Sent Events: one 'snapshot' event with
+        the same body as SessionDetails, then a 'blocks' event with the
+        changed blocks (their MadeShots, MissedShots and the delta) after
+        every recorded or removed shot, and 'end' once the session is ended.
+        Streams close after live.flask_stream_seconds (clients reconnect) and
+        answer 503 while live.flask_max_streams are already open.
+        """
+        if not exec_get_one(SESSION_OWNER_SQL, (SessionID, UserID)):
+            return {"message": SESSION_NOT_FOUND}, 404
+
+        config = live_config()
+        slots = _stream_slots()
+        if not slots.acquire(blocking=False):
+            return ({"message": "Error: Too many live streams, please try again shortly."}, 503,
+                    {'Retry-After': str(config['heartbeat_seconds'])})
+
+        hub = get_live_hub()
+        try:
+            subscription = hub.subscribe(SessionID)
+        except Exception:
+            slots.release()
+            raise
+        heartbeat = config['heartbeat_seconds']
+        closes_at = time.monotonic() + config['flask_stream_seconds']
+
+        def generate():
+            yield sse_event('snapshot', _session_summary(SessionID, subscription.snapshot),
+                            subscription.seq)
+            while True:
+                seq, updates = subscription.wait(min(heartbeat, max(closes_at - time.monotonic(), 0)))
+                if updates:
+                    yield sse_event('blocks', updates, seq)
+                if subscription.closed:
+                    yield sse_event('end', {'session_id': SessionID}, seq)
+                    return
+                if time.monotonic() >= closes_at:
+                    # Frees the thread; the client reconnects and gets a new snapshot
+                    return
+                if not updates:
+                    yield ": keepalive\n\n"
+
+        def close():
+            # Runs when the response is closed, even if it was never iterated
+            hub.unsubscribe(subscription)
+            slots.release()
+
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response.call_on_close(close)
+        return response
@@ -3,6 +3,8 @@ from flask_restful import Resource, request
 
 from api.accuaim_db import *
 from api.db_utils import *
+from api.auth_tokens import issue_token, revoke_token
+from api.resources.auth import bearer_token
 
 class Login(Resource):
     def post(self):
@@ -13,6 +15,20 @@ class Login(Resource):
         if not data["password"]:
             return jsonify({"message": "Password is required"})
         
-        user = login(data["email"],data["password"])
-        
-        return user
\ No newline at end of file
+        try:
+            user = login(data["email"],data["password"])
+        except PasswordQueueFullError:
+            return {"message": PASSWORD_BUSY_MESSAGE}, 503
+
+        if user:
+            # Send this back as "Authorization: Bearer <token>" instead of the password
+            user["token"] = issue_token(user["UserID"])
+        return user
+
+class Logout(Resource):
+    def post(self):
+        token = bearer_token()
+        if not token:
+            return {"message": "Error: Missing bearer token."}, 401
+        revoke_token(token)
+        return {"message": "Logged out."}, 200
@@ -0,0 +1,26 @@
+from flask import Response, request
+from flask_restful import Resource
+
+from api.db_utils import prometheus_text, query_metrics_config, query_report
+from api.query_metrics import PROMETHEUS_CONTENT_TYPE, metrics_access_allowed
+
+# Mapped to /admin/queries. Aggregates are per process: with several workers,
+# scrape each one.
+
+class QueryStats(Resource):
+    def get(self):
+        """
+        Returns the database query metrics of this process: latency
+        histograms, rows, errors, slow statements and connection waits per
+        accuaim_db function, prepared statement timings and pool counters.
+        ?format=prometheus answers in the Prometheus text format instead.
+        Requires the query_metrics.token bearer token; without a configured
+        token the endpoint is closed.
+        """
+        if not metrics_access_allowed(request.headers.get('Authorization'),
+                                      query_metrics_config()['token']):
+            return {"message": "Error: Not allowed to read query metrics."}, 403
+
+        if request.args.get('format') == 'prometheus':
+            return Response(prometheus_text(), content_type=PROMETHEUS_CONTENT_TYPE)
+        return query_report()
@@ -0,0 +1,109 @@
+from flask import Response, current_app, jsonify, make_response, request, stream_with_context
+
+try:
+    import orjson
+except ImportError:  # optional: fast_json falls back to Flask's encoder
+    orjson = None
+
+# Shared response helpers for the resources in this package.
+
+COLUMNAR_MIMETYPE = 'application/vnd.accuaim.columnar+json'
+
+def make_etag(name, version, *params):
+    """
+    Builds a strong ETag value from a resource name, a data version counter
+    and whatever request parameters change the response body.
+    """
+    parts = [name, str(version)] + [str(param) for param in params]
+    return "-".join(parts)
+
+def conditional_json(etag, producer):
+    """
+    Answers If-None-Match with 304 when the client already has this version;
+    otherwise calls producer() and returns its result as JSON with the ETag.
+    producer() is not called at all on a 304, so the heavy queries are skipped.
+
+    Args:
+        etag (str): ETag value (unquoted), or None to disable validation
+        producer (callable): returns the body, a (body, status) or
+            (body, status, headers) tuple like a flask_restful handler, or a
+            ready-made Response (e.g. a streamed one)
+    """
+    if etag is not None and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        result = producer()
+        if not isinstance(result, tuple):
+            result = (result,)
+        body = result[0]
+        status = result[1] if len(result) > 1 else 200
+        headers = result[2] if len(result) > 2 else {}
+        response = body if isinstance(body, Response) else jsonify(body)
+        response.status_code = status
+        for key, value in headers.items():
+            response.headers[key] = value
+        if status >= 400:
+            return response
+
+    if etag is not None:
+        response.set_etag(etag)
+        # Let clients keep the body but always revalidate it
+        response.cache_control.no_cache = True
+    return response
+
+def wants_columnar():
+    """
+    True when the client asked for the column-oriented payload, either with
+    ?format=columnar or by accepting application/vnd.accuaim.columnar+json.
+    """
+    if request.args.get('format') == 'columnar':
+        return True
+    return request.accept_mimetypes[COLUMNAR_MIMETYPE] > request.accept_mimetypes['application/json']
+
+def to_columns(rows, keys=None):
+    """
+    Turns a list of dicts into one dict of parallel lists, so each field name
+    is sent once instead of once per row.
+    """
+    if keys is None:
+        keys = list(rows[0]) if rows else []
+    return {key: [row[key] for row in rows] for key in keys}
+
+def fast_json(body, mimetype='application/json'):
+    """
+    Serializes body with orjson when it is installed, otherwise with Flask's
+    encoder. Values orjson does not handle itself (datetimes, Decimals, ...)
+    go through Flask's default hook, so the output is the same either way.
+    """
+    if orjson is None:
+        response = jsonify(body)
+        response.mimetype = mimetype
+        return response
+    data = orjson.dumps(body, default=current_app.json.default,
+                        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    return Response(data, mimetype=mimetype)
+
+def stream_ndjson(rows):
+    """
+    Streams an iterable of rows as newline-delimited JSON, one row per line,
+    serializing each row as it is produced instead of building the whole body.
+    """
+    def generate():
+        for row in rows:
+            yield current_app.json.dumps(row) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def stream_json_array(rows):
+    """
+    Streams an iterable of rows as one JSON array, written element by element,
+    so the response has the same shape as jsonify(list) without building it.
+    """
+    def generate():
+        dumps = current_app.json.dumps
+        yield "["
+        for index, row in enumerate(rows):
+            yield ("," if index else "") + dumps(row)
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -4,9 +4,52 @@ from flask_restful import request
 
 from api.accuaim_db import *
 from api.db_utils import *
+from api.resources.responses import (conditional_json, make_etag, wants_columnar, to_columns,
+                                     fast_json, COLUMNAR_MIMETYPE)
 
 class SessionDetails(Resource):
     def get(self, UserID, SessionID):
-        result = get_session_data(UserID,SessionID)
-        return jsonify(result)
-        
\ No newline at end of file
+        """
+        Returns the session summary. With ?format=columnar (or an Accept of
+        application/vnd.accuaim.columnar+json) block_stats is sent as parallel
+        arrays, one per field.
+        """
+        columnar = wants_columnar()
+        version = get_user_data_version(UserID)
+        etag = make_etag('session', version, UserID, SessionID,
+                         'columnar' if columnar else 'rows') if version is not None else None
+
+        def load():
+            data = get_session_data(UserID, SessionID, version)
+            if columnar and 'block_stats' in data:
+                data = dict(data, block_stats=to_columns(data['block_stats']))
+                return fast_json(data, COLUMNAR_MIMETYPE)
+            return fast_json(data)
+
+        response = conditional_json(etag, load)
+        response.vary.add('Accept')
+        return response
+
+class SessionShots(Resource):
+    def get(self, UserID, SessionID):
+        """
+        Lists the made shots of a session, ShotTime as epoch milliseconds.
+        The default body is one object per shot; the columnar format (see
+        SessionDetails) sends {"ShotID": [...], "BlockID": [...], ...} instead.
+        """
+        columnar = wants_columnar()
+        version = get_user_data_version(UserID)
+        etag = make_etag('shots', version, UserID, SessionID,
+                         'columnar' if columnar else 'rows') if version is not None else None
+
+        def load():
+            columns = get_session_shot_columns(SessionID, UserID)
+            if columns is None:
+                return {"message": "This session does not belong to the user or does not exist."}, 404
+            if columnar:
+                return fast_json(columns, COLUMNAR_MIMETYPE)
+            return fast_json([dict(zip(columns, values)) for values in zip(*columns.values())])
+
+        response = conditional_json(etag, load)
+        response.vary.add('Accept')
+        return response
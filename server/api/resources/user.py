@@ -4,6 +4,7 @@ from flask_restful import request
 
 from api.accuaim_db import *
 from api.db_utils import *
+from api.resources.auth import token_user_id
 
 class User(Resource):
     def get(self,UserID):
@@ -16,7 +17,10 @@ class User(Resource):
         return jsonify(result)
     
     def delete(self, UserID):
-        data = request.get_json()
-        result = remove_user(UserID,data["password"])
+        if token_user_id() == UserID:
+            result = remove_user(UserID, authenticated=True)
+        else:
+            data = request.get_json()
+            result = remove_user(UserID,data["password"])
         return jsonify(result)
         
\ No newline at end of file
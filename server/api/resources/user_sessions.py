@@ -2,11 +2,37 @@ from flask import jsonify, request
 from flask_restful import Resource
 from api.accuaim_db import *
 from api.db_utils import *
+from api.resources.responses import conditional_json, make_etag, stream_ndjson
 
 class UserSessions(Resource):
     def get(self, UserID):
-        result = get_user_sessions(UserID)
-        return jsonify(result)
+        """
+        Without parameters returns every session (original behaviour).
+        ?limit=N[&before=cursor] returns one page, newest first, with the next
+        page's cursor in the X-Next-Cursor header.
+        ?format=ndjson streams the full history, one session per line.
+        """
+        if request.args.get('format') == 'ndjson':
+            return stream_ndjson(stream_user_sessions(UserID))
+
+        version = get_user_data_version(UserID)
+
+        if 'limit' not in request.args and 'before' not in request.args:
+            etag = make_etag('sessions', version, UserID) if version is not None else None
+            return conditional_json(etag, lambda: get_user_sessions(UserID, version))
+
+        limit = request.args.get('limit', SESSIONS_PAGE_SIZE, type=int)
+        before = request.args.get('before')
+        etag = make_etag('sessions', version, UserID, before, limit) if version is not None else None
+
+        def load():
+            page = get_user_sessions_page(UserID, before=before, limit=limit, version=version)
+            if "error" in page:
+                return {"message": page["error"]}, 400
+            headers = {'X-Next-Cursor': page['next_cursor']} if page['next_cursor'] else {}
+            return page['sessions'], 200, headers
+
+        return conditional_json(etag, load)
     
     def put(self, UserID):
         # Retrieve the data from the request body
@@ -1,16 +1,35 @@
+from datetime import datetime
+
 from flask import jsonify
 from flask_restful import Resource
 from flask_restful import request
 
 from api.accuaim_db import *
 from api.db_utils import *
+from api.resources.responses import conditional_json, make_etag, stream_json_array
 
 class Users(Resource):
     def get(self):
-        users = get_all_users()
-        return jsonify(users)
+        """
+        Streams users as a JSON array. Optional filters: email (substring),
+        created_after (ISO 8601); pagination: after_id (last UserID seen),
+        limit (at most MAX_USERS_PAGE_SIZE, also the default).
+        """
+        email = request.args.get('email')
+        created_after = request.args.get('created_after')
+        after_id = request.args.get('after_id', type=int)
+        limit = request.args.get('limit', type=int)
+        etag = make_etag('users', get_global_data_version(), email, created_after, after_id, limit)
+        if created_after:
+            try:
+                created_after = datetime.fromisoformat(created_after)
+            except ValueError:
+                return {"message": "Error: created_after must be an ISO 8601 date."}, 400
+
+        return conditional_json(etag, lambda: stream_json_array(stream_all_users(
+            email_contains=email, created_after=created_after or None, after_id=after_id, limit=limit)))
     
     def post(self):
         data = request.get_json()
         result = create_user(data["email"], data["name"], data["password"])
-        return jsonify(result)
\ No newline at end of file
+        return jsonify(result)
@@ -0,0 +1,208 @@
+import atexit
+import threading
+import time
+
+from api.db_utils import exec_insert_many, load_config
+from api.cache import invalidate_shots
+from api.live_sessions import publish_shots
+
+SHOT_BUFFER_DEFAULTS = {
+    'mode': 'sync',            # 'sync' writes each shot immediately, 'buffered' group-commits
+    'flush_interval_ms': 50,
+    'max_batch_rows': 500,
+}
+
+_buffer = None
+_mode = None
+_buffer_lock = threading.Lock()
+
+
+def _insert_shots(rows):
+    """
+    Writes buffered shots in one multi-row INSERT. Each row carries how long
+    the shot waited in the buffer so ShotTime reflects when it was recorded,
+    using the database clock like the column default does.
+    """
+    sql = """
+    WITH new_shots AS (
+        INSERT INTO shots (BlockID, ShotTime, ShotPositionX, ShotPositionY) VALUES %s
+        RETURNING BlockID
+    )
+    SELECT ps.UserID, ps.SessionID, ns.BlockID
+    FROM new_shots ns
+    JOIN blocks b ON ns.BlockID = b.BlockID
+    JOIN practice_sessions ps ON b.SessionID = ps.SessionID
+    """
+    inserted = exec_insert_many(sql, rows, template="(%s, CURRENT_TIMESTAMP - %s * INTERVAL '1 millisecond', %s, %s)")
+    sessions = {}
+    for user_id, session_id, block_id in inserted:
+        sessions.setdefault((user_id, session_id), []).append(block_id)
+    for (user_id, session_id), block_ids in sessions.items():
+        invalidate_shots(user_id, session_id)
+        publish_shots(session_id, block_ids)
+
+
+class ShotBuffer:
+    """
+    Write-behind buffer for made shots.
+
+    Shots from every session are queued in memory and written by a background
+    thread with one group commit every flush_interval_ms, or as soon as
+    max_batch_rows are waiting. If a batch fails (e.g. a block was deleted
+    meanwhile) its rows are retried one by one and the bad ones are dropped.
+
+    Args:
+        flush_interval_ms (int): longest time a shot waits before being written
+        max_batch_rows (int): queue depth that triggers an immediate flush
+        writer (callable): writes a list of (BlockID, age_ms, ShotPositionX,
+            ShotPositionY) rows
+    """
+
+    def __init__(self, flush_interval_ms=50, max_batch_rows=500, writer=_insert_shots):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch_rows = max_batch_rows
+        self.writer = writer
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._pending = []       # list of (BlockID, enqueued_at, ShotPositionX, ShotPositionY)
+        self._closed = False
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'max_queue_depth': 0,
+            'last_flush_ms': 0.0,
+            'flush_ms_total': 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name='shot-buffer', daemon=True)
+        self._thread.start()
+
+    def add(self, block_id, position_x=None, position_y=None):
+        """
+        Queues a made shot for the given block, optionally with its position.
+        """
+        with self._wakeup:
+            if self._closed:
+                raise RuntimeError("Shot buffer is closed.")
+            self._pending.append((block_id, time.monotonic(), position_x, position_y))
+            self._stats['enqueued'] += 1
+            depth = len(self._pending)
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], depth)
+            if depth >= self.max_batch_rows:
+                self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                if not self._closed and len(self._pending) < self.max_batch_rows:
+                    self._wakeup.wait(self.flush_interval)
+                if self._closed and not self._pending:
+                    return
+            self.flush()
+
+    def flush(self):
+        """
+        Writes everything queued so far. Safe to call from any thread.
+
+        Returns:
+            int: number of shots written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            now = time.monotonic()
+            rows = [(block_id, (now - enqueued_at) * 1000.0, x, y) for block_id, enqueued_at, x, y in batch]
+
+            started = time.perf_counter()
+            written = dropped = 0
+            failed = False
+            try:
+                self.writer(rows)
+                written = len(rows)
+            except Exception:
+                failed = True
+                for row in rows:
+                    try:
+                        self.writer([row])
+                        written += 1
+                    except Exception:
+                        dropped += 1
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['flush_errors'] += failed
+                self._stats['dropped'] += dropped
+                self._stats['flushed'] += written
+                self._stats['last_flush_ms'] = elapsed_ms
+                self._stats['flush_ms_total'] += elapsed_ms
+            return written
+
+    def close(self):
+        """
+        Stops accepting shots, flushes what is queued and stops the worker.
+        """
+        with self._wakeup:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+        self.flush()
+
+    def stats(self):
+        """
+        Returns buffer metrics.
+
+        Returns:
+            dict: current queue depth plus cumulative counters and flush latency
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['queue_depth'] = len(self._pending)
+        return snapshot
+
+
+def shot_buffer_config():
+    """
+    Returns the 'shot_buffer' section of db.yml merged over the defaults.
+    """
+    config = dict(SHOT_BUFFER_DEFAULTS)
+    config.update(load_config().get('shot_buffer') or {})
+    if config['mode'] not in ('sync', 'buffered'):
+        raise ValueError("shot_buffer.mode must be 'sync' or 'buffered', got %r" % config['mode'])
+    return config
+
+
+def get_shot_buffer():
+    """
+    Returns the process-wide shot buffer, or None when running in sync mode.
+    The buffer is flushed automatically at interpreter shutdown.
+    """
+    global _buffer, _mode
+    if _mode is None:
+        with _buffer_lock:
+            if _mode is None:
+                config = shot_buffer_config()
+                if config['mode'] == 'buffered':
+                    _buffer = ShotBuffer(config['flush_interval_ms'], config['max_batch_rows'])
+                    atexit.register(_buffer.close)
+                _mode = config['mode']
+    return _buffer
+
+
+def shot_buffer_stats():
+    """
+    Returns the shot buffer metrics, or an empty dict in sync mode.
+    """
+    if _buffer is None:
+        return {}
+    return _buffer.stats()
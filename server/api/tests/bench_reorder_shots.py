@@ -0,0 +1,62 @@
+import sys
+import os
+import time
+
+# Benchmark for reorder_shots: the set-based version against the previous
+# one-UPDATE-per-shot loop, on a session with 10,000 shots.
+# Run from the 'tests' directory against a scratch database:
+#     python bench_reorder_shots.py [shots]
+# It rebuilds the tables, like the integration tests do.
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import api.accuaim_db as db
+from api.db_utils import exec_get_all, exec_commit, exec_insert_many
+
+SESSION_ID = 1
+BLOCK_ID = 1
+
+
+def seed_shots(count):
+    """Gives session 1 count extra shots with gaps in their IDs."""
+    db.rebuild_tables()
+    exec_commit("SELECT setval('shots_shotid_seq', 1000)")
+    exec_insert_many("INSERT INTO shots (BlockID) VALUES %s", [(BLOCK_ID,)] * count)
+    # Leave every other ID free so the renumbering has real work to do
+    exec_commit("""
+    DELETE FROM shots WHERE ShotID IN (
+        SELECT s.ShotID FROM shots s JOIN blocks b ON s.BlockID = b.BlockID
+        WHERE b.SessionID = %s AND s.ShotID %% 2 = 0);
+    """, (SESSION_ID,))
+
+
+def reorder_shots_per_row(session_id):
+    """The previous implementation: one UPDATE and commit per shot."""
+    shots = exec_get_all("""
+        SELECT s.ShotID FROM shots s
+        JOIN blocks b ON s.BlockID = b.BlockID
+        WHERE b.SessionID = %s
+        ORDER BY s.ShotID;
+        """, (session_id,))
+    for index, shot in enumerate(shots, start=1):
+        exec_commit("UPDATE shots SET ShotID = %s WHERE ShotID = %s", (index, shot[0]))
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<12} {elapsed * 1000:10.1f} ms")
+    return elapsed
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    seed_shots(count)
+    per_row = timed("per-row", reorder_shots_per_row, SESSION_ID)
+
+    seed_shots(count)
+    set_based = timed("set-based", db.reorder_shots, SESSION_ID)
+
+    print(f"speedup      {per_row / set_based:10.1f}x")
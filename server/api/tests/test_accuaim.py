@@ -1,14 +1,32 @@
 import sys
 import os
 import unittest
+from unittest import mock
 
-# Add the parent directory to the path to allow direct import of modules
-# This allows running the test script from the 'tests' directory
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Add the server directory to the path so the modules import as the api
+# package, the way accuaim_db imports its siblings. Importing them by their
+# bare names as well would load second copies with their own pool, caches
+# and stores. This allows running the test script from the 'tests' directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 # Assuming your functions are in 'app_functions.py'
-import accuaim_db as db
-from db_utils import exec_get_one, exec_get_all
+import api.accuaim_db as db
+from api.db_utils import exec_get_one, exec_get_all, exec_commit, transaction
+from api.db_utils import convert_placeholders, prepared_statement_stats, reset_prepared_statements
+from api.db_utils import get_query_metrics, prometheus_text
+from api.shot_buffer import ShotBuffer
+from api.cache import LRUCache
+from api.passwords import PasswordHasher
+from api.auth_tokens import TokenService
+from api.migrate import discover_migrations, migrate, migration_status, split_statements
+from api.query_plans import check_hot_queries
+from api.heatmaps import bin_positions
+from api.async_db import close_async_pool
+from api import accuaim_async
+from api.live_sessions import LiveSessionHub, get_live_hub
+from api.active_sessions import MemorySessionStore, get_active_sessions
+import asyncio
+from datetime import datetime
 
 class TestAccuaimIntegration(unittest.TestCase):
     """
@@ -92,6 +110,18 @@ class TestAccuaimIntegration(unittest.TestCase):
         result = db.remove_shot(user_id=2, shot_id=1)
         self.assertEqual("Error: Shot not found or you don't have permission to remove it.", result)
         
+    def test_session_data_checks_ownership_and_totals(self):
+        """
+        Tests that the single-query session details match the per-block
+        stats, total them, and refuse sessions of other users.
+        """
+        data = db.get_session_data(1, 1)
+        self.assertEqual(db.get_session_block_stats(1), data['block_stats'])
+        self.assertEqual(sum(block['MadeShots'] for block in data['block_stats']), data['made_shots'])
+        self.assertEqual(sum(block['ShotsPlanned'] for block in data['block_stats']), data['total_shots'])
+        self.assertEqual({"error": "This session does not belong to the user or does not exist."},
+                         db.get_session_data(2, 1))
+
     # --- User & Session Function Tests ---
     
     def test_get_user_sessions(self):
@@ -222,6 +252,598 @@ class TestAccuaimIntegration(unittest.TestCase):
         self.assertIsNone(exec_get_one("SELECT * FROM blocks WHERE BlockID = %s", (block_id,)))
         self.assertEqual([], exec_get_all("SELECT * FROM shots WHERE BlockID = %s", (block_id,)))
 
+    def test_create_session_returns_blocks(self):
+        """
+        Tests that create_session returns the new session together with its
+        blocks, in the order they were given.
+        """
+        blocks = [{'targetArea': 'Top Left', 'shotsPlanned': 10},
+                  {'targetArea': 'Bar Down', 'shotsPlanned': 5}]
+        session = db.create_session(2, blocks)
+
+        self.assertEqual(2, session[1])
+        self.assertEqual(['Top Left', 'Bar Down'], [block[2] for block in session[4]])
+        self.assertEqual([10, 5], [block[3] for block in session[4]])
+        self.assertTrue(all(block[1] == session[0] for block in session[4]))
+
+        self.assertEqual("User does not exist", db.create_session(999, blocks))
+
+    def test_record_new_shots_batch(self):
+        """
+        Tests batch shot ingestion: valid shots are inserted together and
+        shots for blocks outside the session are rejected individually.
+        Session 6 (user 3) contains blocks 9 and 10.
+        """
+        result = db.record_new_shots(3, 6, [
+            {'block_id': 9},
+            {'block_id': 10, 'timestamp': '2024-01-01T10:00:00+02:00'},
+            {'block_id': 1},
+            {'block_id': 'nine'},
+        ])
+
+        self.assertEqual(2, result['accepted'])
+        self.assertEqual(2, result['rejected'])
+        self.assertEqual([True, True, False, False], [r['accepted'] for r in result['results']])
+        self.assertIn('ShotID', result['results'][0])
+        self.assertEqual(9, len(db.get_block_shots(9)))
+        shot_time = exec_get_one("SELECT ShotTime FROM shots WHERE ShotID = %s",
+                                 (result['results'][1]['ShotID'],))[0]
+        self.assertEqual(datetime(2024, 1, 1, 8, 0), shot_time)
+
+        denied = db.record_new_shots(1, 6, [{'block_id': 9}])
+        self.assertIn('error', denied)
+
+    def test_shot_buffer_group_commit(self):
+        """
+        Tests that the write-behind buffer writes queued shots in one batch
+        and flushes whatever is left when closed.
+        """
+        batches = []
+        buffer = ShotBuffer(flush_interval_ms=60000, max_batch_rows=3, writer=batches.append)
+
+        buffer.add(1)
+        buffer.add(2)
+        buffer.close()
+
+        self.assertEqual(1, len(batches))
+        self.assertEqual([1, 2], [row[0] for row in batches[0]])
+        self.assertEqual(0, buffer.stats()['queue_depth'])
+        self.assertEqual(2, buffer.stats()['flushed'])
+
+    def test_leaderboard_stats_maintained(self):
+        """
+        Tests that the leaderboard totals follow shot inserts and deletes and
+        match a full rebuild.
+        Sample data: Alex Ryan (user 3) has 40 planned and 14 made.
+        """
+        def alex():
+            return next(row for row in db.get_leaderboard_stats('made') if row['UserID'] == 3)
+
+        self.assertEqual((14, 40), (alex()['TotalMade'], alex()['TotalPlanned']))
+
+        db.record_new_shot(9)
+        self.assertEqual(15, alex()['TotalMade'])
+
+        db.remove_shot(user_id=3, shot_id=db.get_block_shots(9)[0]['ShotID'])
+        self.assertEqual(14, alex()['TotalMade'])
+
+        before = db.get_leaderboard_stats()
+        db.rebuild_user_stats()
+        self.assertEqual(before, db.get_leaderboard_stats())
+
+    def test_leaderboard_keyset_pagination(self):
+        """
+        Tests that walking the leaderboard one entry per page with cursors
+        returns the same order as a single full page, for every sort key.
+        """
+        for sort_by in ('accuracy', 'made', 'planned'):
+            full = db.get_leaderboard_page(sort_by)['entries']
+
+            walked = []
+            page = db.get_leaderboard_page(sort_by, limit=1)
+            while True:
+                walked.extend(page['entries'])
+                if not page['next_cursor']:
+                    break
+                page = db.get_leaderboard_page(sort_by, after=page['next_cursor'], limit=1)
+
+            self.assertEqual(full, walked)
+
+        self.assertIn('error', db.get_leaderboard_page('made', after='not-a-cursor'))
+
+    def test_dashboard_stats_maintained(self):
+        """
+        Tests the maintained dashboard stats against the sample data and after
+        new activity. John Doe (user 1) practiced the last 3 days; his last
+        session (3) has 55 planned and 17 made. Jane's streak is broken.
+        """
+        john = db.get_user_dashboard_stats(1)
+        self.assertEqual(3, john['streak'])
+        self.assertEqual(22, john['totalMade'])
+        self.assertEqual(90, john['totalPlanned'])
+        self.assertEqual("30.9%", john['lastSessionAccuracy'])
+        self.assertEqual(0, db.get_user_dashboard_stats(2)['streak'])
+
+        session = db.create_session(1, [{'targetArea': 'Top Left', 'shotsPlanned': 4}])
+        db.record_new_shot(session[4][0][0])
+        john = db.get_user_dashboard_stats(1)
+        self.assertEqual(3, john['streak'])
+        self.assertEqual("25.0%", john['lastSessionAccuracy'])
+        self.assertEqual(94, john['totalPlanned'])
+
+        db.rebuild_user_stats()
+        self.assertEqual(john, db.get_user_dashboard_stats(1))
+
+    def test_lru_cache_eviction_and_tags(self):
+        """
+        Tests LRU eviction order, tag invalidation and the hit/miss counters.
+        """
+        cache = LRUCache(max_entries=2, ttl_seconds=60)
+        cache.set("a", 1, tags=["user:1"])
+        cache.set("b", 2, tags=["user:2"])
+        cache.get("a")
+        cache.set("c", 3, tags=["user:1"])
+
+        self.assertEqual((False, None), cache.get("b"))
+        cache.invalidate_tag("user:1")
+        self.assertEqual((False, None), cache.get("a"))
+        self.assertEqual((False, None), cache.get("c"))
+
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(3, stats['misses'])
+        self.assertEqual(1, stats['evictions'])
+
+    def test_cached_reads_invalidated_by_writes(self):
+        """
+        Tests that cached session details and dashboards are refreshed after a
+        shot is recorded in the session.
+        """
+        before = db.get_session_data(3, 6)
+        copy = db.get_session_data(3, 6)
+        self.assertEqual(before, copy)
+        copy['made_shots'] = -1
+        self.assertEqual(before, db.get_session_data(3, 6))
+
+        db.record_new_shot(9)
+        after = db.get_session_data(3, 6)
+        self.assertEqual(before['made_shots'] + 1, after['made_shots'])
+
+    def test_cached_reads_keyed_by_data_version(self):
+        """
+        Tests that a cached body is only served for the data version it was
+        read at, even when no invalidation reached this process.
+        """
+        version = db.get_user_data_version(1)
+        stale = dict(db.get_user_dashboard_stats(1, version), totalMade=-1)
+        db.get_cache().set(f"dashboard:1:v{version + 1}", stale)
+        self.assertNotEqual(stale, db.get_user_dashboard_stats(1, version))
+        self.assertEqual(stale, db.get_user_dashboard_stats(1, version + 1))
+
+    def test_data_versions_change_on_writes(self):
+        """
+        Tests that the per-user and global version counters used for ETags
+        move on every write a client could observe.
+        """
+        user_version = db.get_user_data_version(3)
+        global_version = db.get_global_data_version()
+
+        db.record_new_shot(9)
+        self.assertGreater(db.get_user_data_version(3), user_version)
+        self.assertGreater(db.get_global_data_version(), global_version)
+
+        user_version = db.get_user_data_version(3)
+        db.update_session_end_time(6)
+        self.assertGreater(db.get_user_data_version(3), user_version)
+
+        global_version = db.get_global_data_version()
+        db.create_user("temp@example.com", "Temp User", "password")
+        db.remove_user(db.get_user_id("temp@example.com"), "password")
+        self.assertGreater(db.get_global_data_version(), global_version)
+        self.assertIsNone(db.get_user_data_version(999))
+
+    def test_user_sessions_pagination_and_stream(self):
+        """
+        Tests that paging through a user's sessions newest first with cursors
+        matches the streamed history. User 1 has sessions 3, 2, 1 (newest first).
+        """
+        walked = []
+        page = db.get_user_sessions_page(1, limit=2)
+        while True:
+            walked.extend(page['sessions'])
+            if not page['next_cursor']:
+                break
+            page = db.get_user_sessions_page(1, before=page['next_cursor'], limit=2)
+
+        self.assertEqual([3, 2, 1], [session[0] for session in walked])
+        self.assertEqual(walked, list(db.stream_user_sessions(1)))
+        self.assertIn('error', db.get_user_sessions_page(1, before='bogus'))
+
+    def test_stream_all_users_and_blocks(self):
+        """
+        Tests the filtered, paginated streams behind the admin endpoints.
+        """
+        self.assertEqual([1, 2, 3], [user[0] for user in db.stream_all_users()])
+        self.assertEqual([2], [user[0] for user in db.stream_all_users(email_contains="JANE")])
+        self.assertEqual([2], [user[0] for user in db.stream_all_users(after_id=1, limit=1)])
+        self.assertEqual([], list(db.stream_all_users(email_contains="%")))
+        self.assertEqual([1], [user[0] for user in db.stream_all_users(limit=0)])
+        with mock.patch.object(db, 'MAX_USERS_PAGE_SIZE', 2):
+            self.assertEqual([1, 2], [user[0] for user in db.stream_all_users(limit=10)])
+
+        self.assertEqual([3, 4, 5], [block[0] for block in db.stream_all_blocks(session_id=3)])
+        self.assertEqual([5, 10], [block[0] for block in db.stream_all_blocks(target_area='Bar Down')])
+        self.assertEqual([9, 10], [block[0] for block in db.stream_all_blocks(after_id=8)])
+
+    def test_password_hasher(self):
+        """
+        Tests hashing, verification, cost-change detection and the counters
+        of the password hasher (inline mode, low cost to keep the test fast).
+        """
+        hasher = PasswordHasher(rounds=4, workers=0)
+        hashed = hasher.hash("s3cret")
+
+        self.assertTrue(hasher.check("s3cret", hashed))
+        self.assertFalse(hasher.check("wrong", hashed))
+        self.assertFalse(hasher.needs_rehash(hashed))
+        self.assertTrue(PasswordHasher(rounds=5, workers=0).needs_rehash(hashed))
+        self.assertEqual(3, hasher.stats()['operations'])
+
+    def test_access_tokens(self):
+        """
+        Tests issuing and verifying access tokens, rejection of tampered
+        tokens, single-token revocation and per-user revocation.
+        """
+        tokens = TokenService(b"test-secret", ttl_seconds=60)
+        token = tokens.issue(1)
+        self.assertEqual(1, tokens.verify(token))
+        self.assertIsNone(tokens.verify(token[:-2] + "xx"))
+        self.assertIsNone(TokenService(b"other-secret", ttl_seconds=60).verify(token))
+
+        tokens.revoke(token)
+        self.assertIsNone(tokens.verify(token))
+        self.assertEqual(1, exec_get_one("SELECT COUNT(*) FROM revoked_tokens")[0])
+
+        other = tokens.issue(2)
+        tokens.revoke_user(2)
+        self.assertIsNone(tokens.verify(other))
+        self.assertEqual(2, tokens.verify(tokens.issue(2)))
+
+    def test_migrations_applied_once(self):
+        """
+        Tests that rebuild_tables() applies every migration and that running
+        migrate() again is a no-op.
+        """
+        status = migration_status()
+        self.assertTrue(status)
+        self.assertTrue(all(applied_at is not None for _, _, applied_at in status))
+        self.assertEqual([], migrate())
+
+    def test_split_statements(self):
+        """
+        Tests that a no-transaction migration is split at line-ending
+        semicolons and that comment-only parts are dropped.
+        """
+        sql = "-- a\nCREATE INDEX a ON t (x);\n\nCREATE INDEX b\n  ON t (y);  \n-- done\n"
+        self.assertEqual(["-- a\nCREATE INDEX a ON t (x)", "CREATE INDEX b\n  ON t (y)"],
+                         split_statements(sql))
+        self.assertFalse(discover_migrations()[0].transactional)
+
+    def test_hot_queries_use_indexes(self):
+        """
+        Tests that none of the registered hot queries needs a sequential scan.
+        """
+        self.assertEqual({}, check_hot_queries())
+
+    def test_shot_partitions_archived_into_summaries(self):
+        """
+        Tests that an old shot parked in the default partition moves into its
+        month's partition, and that archiving that partition keeps the made
+        shot counts through block_shot_summaries.
+        """
+        exec_commit("INSERT INTO shots (BlockID, ShotTime) VALUES (1, CURRENT_TIMESTAMP - INTERVAL '2 years')")
+        self.assertEqual(1, exec_get_one("SELECT COUNT(*) FROM shots_default")[0])
+
+        exec_commit("SELECT ensure_shot_partitions((CURRENT_DATE - INTERVAL '2 years')::date, 0)")
+        self.assertEqual(0, exec_get_one("SELECT COUNT(*) FROM shots_default")[0])
+
+        made_before = [b['MadeShots'] for b in db.get_session_block_stats(1)]
+        shots_before = exec_get_one("SELECT COUNT(*) FROM shots")[0]
+
+        self.assertGreaterEqual(db.archive_shot_partitions(retain_months=12), 1)
+        self.assertEqual(shots_before - 1, exec_get_one("SELECT COUNT(*) FROM shots")[0])
+        self.assertEqual(1, exec_get_one("SELECT MadeShots FROM block_shot_summaries WHERE BlockID = 1")[0])
+        self.assertEqual(made_before, [b['MadeShots'] for b in db.get_session_block_stats(1)])
+
+        totals = db.get_user_dashboard_stats(1)
+        db.rebuild_user_stats()
+        self.assertEqual(totals, db.get_user_dashboard_stats(1))
+
+    def test_reorder_shots(self):
+        """
+        Tests that reordering gives a session's shots consecutive new IDs in
+        their original order.
+        """
+        exec_commit("UPDATE shots SET ShotID = 1000 WHERE ShotID = 1")
+        exec_commit("DELETE FROM shots WHERE ShotID = 3")
+        before = exec_get_all("""
+            SELECT s.BlockID, s.ShotTime FROM shots s JOIN blocks b ON s.BlockID = b.BlockID
+            WHERE b.SessionID = 1 ORDER BY s.ShotID""")
+
+        self.assertEqual("Shots reordered successfully.", db.reorder_shots(1))
+
+        after = exec_get_all("""
+            SELECT s.ShotID, s.BlockID, s.ShotTime FROM shots s JOIN blocks b ON s.BlockID = b.BlockID
+            WHERE b.SessionID = 1 ORDER BY s.ShotID""")
+        first = after[0][0]
+        self.assertEqual(list(range(first, first + len(before))), [row[0] for row in after])
+        self.assertEqual(before, [row[1:] for row in after])
+        self.assertEqual("No shots found in this session.", db.reorder_shots(999))
+
+    def test_reorder_shots_keeps_ids_unique_across_sessions(self):
+        """
+        Tests that reordering two sessions of the same user leaves every
+        ShotID unique, so removing a shot deletes exactly that one.
+        """
+        first = db.create_session(2, [{"targetArea": "Top Left", "shotsPlanned": 3}])
+        second = db.create_session(2, [{"targetArea": "Top Right", "shotsPlanned": 3}])
+        for _ in range(3):
+            db.record_new_shot(first[4][0][0])
+            db.record_new_shot(second[4][0][0])
+
+        db.reorder_shots(first[0])
+        db.reorder_shots(second[0])
+
+        self.assertEqual(*exec_get_one("SELECT COUNT(*), COUNT(DISTINCT ShotID) FROM shots"))
+        shot_id = exec_get_one("SELECT MIN(ShotID) FROM shots WHERE BlockID = %s", (second[4][0][0],))[0]
+        total = exec_get_one("SELECT COUNT(*) FROM shots")[0]
+        db.remove_shot(2, shot_id)
+        self.assertEqual(total - 1, exec_get_one("SELECT COUNT(*) FROM shots")[0])
+        self.assertEqual(3, exec_get_one("SELECT COUNT(*) FROM shots WHERE BlockID = %s",
+                                         (first[4][0][0],))[0])
+
+    def test_session_shot_columns(self):
+        """
+        Tests the column-oriented shot listing: parallel lists of equal
+        length, epoch-millisecond timestamps and the ownership check.
+        """
+        columns = db.get_session_shot_columns(1, user_id=1)
+        shots = db.get_session_shots(1)
+
+        self.assertEqual(['ShotID', 'BlockID', 'ShotTime', 'TargetArea', 'ShotPositionX', 'ShotPositionY'],
+                         list(columns))
+        self.assertEqual([shot['ShotID'] for shot in shots], columns['ShotID'])
+        self.assertTrue(all(isinstance(ms, int) for ms in columns['ShotTime']))
+        self.assertIsNone(db.get_session_shot_columns(1, user_id=2))
+
+        session = db.create_session(2, [{"targetArea": "Top Left", "shotsPlanned": 5}])
+        self.assertEqual([], db.get_session_shot_columns(session[0], user_id=2)['ShotID'])
+
+    def test_bin_positions(self):
+        """
+        Tests that positions land in the right grid cells, bottom row first,
+        with the top and right edges counted in the last cells.
+        """
+        grid = bin_positions([0.1, 0.9, 1.0, 0.6], [0.1, 0.1, 1.0, 0.6], 2)
+        self.assertEqual([[1, 1], [0, 2]], grid.tolist())
+
+    def test_heatmaps_use_stored_session_grids(self):
+        """
+        Tests that ending a session stores its grid, that the all-time user
+        heatmap merges stored grids with raw shots of other sessions, and
+        that new shots in an ended session drop its stored grid.
+        """
+        session = db.create_session(2, [{"targetArea": "Top Left", "shotsPlanned": 5}])
+        block_id = session[4][0][0]
+        db.record_new_shots(2, session[0], [
+            {"block_id": block_id, "position_x": 0.05, "position_y": 0.05},
+            {"block_id": block_id, "position_x": 0.95, "position_y": 0.95},
+        ])
+        db.update_session_end_time(session[0])
+        self.assertEqual(1, exec_get_one("SELECT COUNT(*) FROM session_heatmaps WHERE SessionID = %s",
+                                         (session[0],))[0])
+
+        other = db.create_session(2, [{"targetArea": "Top Right", "shotsPlanned": 5}])
+        db.record_new_shot(other[4][0][0], 0.05, 0.05)
+
+        heatmap = db.get_heatmap(2, grid_size=10)
+        self.assertEqual(3, heatmap['shots'])
+        self.assertEqual(2, heatmap['bins'][0][0])
+        self.assertEqual(1, heatmap['bins'][9][9])
+        self.assertEqual(2, db.get_heatmap(2, session_id=session[0], grid_size=10)['shots'])
+        self.assertIn("error", db.get_heatmap(1, session_id=session[0]))
+
+        db.record_new_shot(block_id, 0.5, 0.5)
+        self.assertEqual(0, exec_get_one("SELECT COUNT(*) FROM session_heatmaps WHERE SessionID = %s",
+                                         (session[0],))[0])
+        self.assertEqual(4, db.get_heatmap(2, grid_size=10)['shots'])
+
+        # The trigger covers any insert, not only those made by accuaim_db,
+        # and leaves the grids of other sessions alone
+        db.update_session_end_time(session[0])
+        db.update_session_end_time(other[0])
+        exec_commit("INSERT INTO shots (BlockID) VALUES (%s)", (block_id,))
+        self.assertEqual(0, exec_get_one("SELECT COUNT(*) FROM session_heatmaps WHERE SessionID = %s",
+                                         (session[0],))[0])
+        self.assertEqual(1, exec_get_one("SELECT COUNT(*) FROM session_heatmaps WHERE SessionID = %s",
+                                         (other[0],))[0])
+
+    def test_transaction_rolls_back_on_error(self):
+        """
+        Tests that statements run inside transaction() are discarded together
+        when the block raises.
+        """
+        with self.assertRaises(ValueError):
+            with transaction():
+                exec_commit("INSERT INTO practice_sessions (UserID, SessionStart) VALUES (%s, CURRENT_TIMESTAMP)", (1,))
+                raise ValueError("abort")
+
+        self.assertEqual(3, len(db.get_user_sessions(1)))
+
+    def test_prepared_statements_match_plain_sql(self):
+        """
+        Tests that a registered statement runs prepared, returns the same rows
+        as its unregistered text, and is prepared again after a reset.
+        """
+        args = {'session_id': 1, 'user_id': 1}
+        plain = exec_get_all(db.SESSION_DATA_SQL.strip(), args)
+        before = prepared_statement_stats()['session_data']
+        self.assertEqual(plain, exec_get_all(db.SESSION_DATA_SQL, args))
+        self.assertEqual(plain, exec_get_all(db.SESSION_DATA_SQL, args))
+
+        reset_prepared_statements()
+        self.assertEqual(plain, exec_get_all(db.SESSION_DATA_SQL, args))
+        after = prepared_statement_stats()['session_data']
+        self.assertEqual(before['executions'] + 3, after['executions'])
+        self.assertGreater(after['prepares'], before['prepares'])
+
+    def test_query_metrics_tag_calling_function(self):
+        """
+        Tests that a statement run by a cache loader is recorded under the
+        accuaim_db function that asked for it, with its row count, and is
+        exported in the Prometheus text.
+        """
+        version = db.get_user_data_version(1)
+        get_query_metrics().reset()
+        db.get_cache().clear()
+        db.get_user_dashboard_stats(1, version)
+
+        stats = get_query_metrics().snapshot()['functions']['get_user_dashboard_stats']
+        self.assertEqual(1, stats['calls'])
+        self.assertEqual(1, stats['rows'])
+        self.assertEqual(0, stats['errors'])
+        self.assertIn('accuaim_db_query_duration_seconds_count{function="get_user_dashboard_stats"} 1',
+                      prometheus_text())
+
+    def test_convert_placeholders(self):
+        """
+        Tests that psycopg2-style statements are rewritten for asyncpg, with
+        tuples expanded into row parameters and %% unescaped.
+        """
+        sql, params = convert_placeholders(
+            "SELECT %(a)s, %(a)s WHERE (x, y) < %(after)s AND z %% 2 = 0", {'a': 1, 'after': (2, 3)})
+        self.assertEqual("SELECT $1, $2 WHERE (x, y) < ($3, $4) AND z % 2 = 0", sql)
+        self.assertEqual([1, 1, 2, 3], params)
+        self.assertEqual(("VALUES ($1, $2)", ['a', 'b']), convert_placeholders("VALUES (%s, %s)", ('a', 'b')))
+
+    def test_async_functions_match_sync(self):
+        """
+        Tests that the asyncpg versions behind the ASGI app return the same
+        values as accuaim_db for the same data.
+        """
+        expected = (db.get_user_dashboard_stats(1), db.get_session_data(1, 1),
+                    db.get_leaderboard_page(limit=2), db.get_user_data_version(1))
+        db.get_cache().clear()
+
+        async def run():
+            try:
+                return (await accuaim_async.get_user_dashboard_stats(1),
+                        await accuaim_async.get_session_data(1, 1),
+                        await accuaim_async.get_leaderboard_page(limit=2),
+                        await accuaim_async.get_user_data_version(1))
+            finally:
+                await close_async_pool()
+
+        self.assertEqual(expected, asyncio.run(run()))
+
+    def test_live_session_hub_pushes_block_deltas(self):
+        """
+        Tests that subscribers get coalesced per-block deltas with absolute
+        counters, that unwatched sessions are ignored and that ending a
+        session closes its streams.
+        """
+        loads = []
+
+        def loader(session_id):
+            loads.append(session_id)
+            return [{'BlockID': 1, 'TargetArea': 'Top Left', 'ShotsPlanned': 5,
+                     'MadeShots': 2, 'MissedShots': 3}]
+
+        hub = LiveSessionHub(loader)
+        first = hub.subscribe(7)
+        second = hub.subscribe(7)
+        self.assertEqual([7], loads)
+        self.assertEqual(2, first.snapshot[0]['MadeShots'])
+
+        hub.publish(7, {1: 1})
+        hub.publish(7, {1: 1})
+        hub.publish(8, {1: 1})
+        seq, updates = first.wait(0)
+        self.assertEqual(2, seq)
+        self.assertEqual([{'BlockID': 1, 'TargetArea': 'Top Left', 'ShotsPlanned': 5,
+                           'MadeShots': 4, 'MissedShots': 1, 'delta': 2}], updates)
+        self.assertEqual((2, []), first.drain())
+
+        hub.unsubscribe(first)
+        hub.end(7)
+        self.assertTrue(second.closed)
+        self.assertEqual({'sessions': 0, 'subscribers': 0}, hub.stats())
+
+    def test_recorded_shots_reach_live_subscribers(self):
+        """
+        Tests that record_new_shot and remove_shot publish to the live hub
+        and that ending the session closes the stream.
+        """
+        subscription = get_live_hub().subscribe(1)
+        made = {block['BlockID']: block['MadeShots'] for block in subscription.snapshot}
+
+        db.record_new_shot(1)
+        _, updates = subscription.wait(1)
+        self.assertEqual([(1, made[1] + 1, 1)],
+                         [(u['BlockID'], u['MadeShots'], u['delta']) for u in updates])
+
+        db.update_session_end_time(1)
+        self.assertTrue(subscription.closed)
+        get_live_hub().unsubscribe(subscription)
+
+    def test_memory_session_store_counts_and_evicts(self):
+        """
+        Tests that the in-memory active session store counts shots per block,
+        ignores blocks of other sessions and evicts idle sessions.
+        """
+        now = [0.0]
+        store = MemorySessionStore(idle_timeout=100, clock=lambda: now[0])
+        store.register(5, 2, [(10, 'Top Left', 3), (11, 'Top Right', 4)])
+
+        self.assertEqual((2, 5), store.owner_of_block(11))
+        updates = store.add_shots(5, {10: 2, 99: 1})
+        self.assertEqual([{'BlockID': 10, 'TargetArea': 'Top Left', 'ShotsPlanned': 3,
+                           'MadeShots': 2, 'MissedShots': 1, 'delta': 2}], updates)
+        self.assertEqual([2, 0], [block['MadeShots'] for block in store.block_stats(5)[1]])
+        self.assertIsNone(store.add_shots(6, {10: 1}))
+
+        now[0] = 250.0
+        store.register(6, 2, [(12, 'Bottom Left', 1)])
+        self.assertIsNone(store.block_stats(5))
+        self.assertIsNone(store.owner_of_block(10))
+        store.evict_user(2)
+        self.assertEqual(0, store.stats()['active'])
+
+    def test_active_session_matches_database(self):
+        """
+        Tests that a new session is tracked in memory, that its counters
+        follow recorded and removed shots like the database aggregate does,
+        and that ending the session evicts it.
+        """
+        # The default backend ('none') tracks nothing
+        with mock.patch('api.active_sessions._store', MemorySessionStore()):
+            session = db.create_session(2, [{"targetArea": "Top Left", "shotsPlanned": 5},
+                                            {"targetArea": "Top Right", "shotsPlanned": 3}])
+            first, second = session[4][0][0], session[4][1][0]
+            db.record_new_shot(first)
+            db.record_new_shot(first)
+            db.record_new_shots(2, session[0], [{"block_id": second}])
+            shot_id = exec_get_one("SELECT MAX(ShotID) FROM shots WHERE BlockID = %s", (first,))[0]
+            db.remove_shot(2, shot_id)
+
+            live = get_active_sessions().block_stats(session[0])
+            self.assertEqual(db.get_session_block_stats(session[0]), live[1])
+            self.assertEqual(2, db.get_session_data(2, session[0])['made_shots'])
+
+            db.update_session_end_time(session[0])
+            self.assertIsNone(get_active_sessions().block_stats(session[0]))
+            self.assertEqual(2, db.get_session_data(2, session[0])['made_shots'])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,408 @@
+import asyncio
+import json
+import re
+from contextlib import aclosing, asynccontextmanager
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from email.utils import format_datetime
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+from api.db_utils import close_pool, prometheus_text, query_metrics_config, query_report
+from api.async_db import close_async_pool, exec_get_one, get_async_pool
+from api.auth_tokens import get_token_service, issue_token
+from api import accuaim_async as db
+from api.accuaim_db import (LEADERBOARD_PAGE_SIZE, SESSIONS_PAGE_SIZE, PASSWORD_BUSY_MESSAGE,
+                            SESSION_OWNER_SQL, SESSION_NOT_FOUND, _session_summary)
+from api.live_sessions import get_live_hub, live_config, sse_event
+from api.active_sessions import get_active_sessions
+from api.passwords import PasswordQueueFullError
+from api.query_metrics import PROMETHEUS_CONTENT_TYPE, metrics_access_allowed
+from api.resources.responses import make_etag
+
+# Async entry point serving the hot endpoints (users, login, sessions, the
+# active session, the leaderboard and the dashboard) on asyncpg, so one worker
+# can keep many requests waiting on the database at once. Paths, bodies and
+# ETags match the Flask app in server.py, which still serves everything else.
+#
+#     uvicorn asgi:app --host 0.0.0.0 --port 4949 --workers 4
+#
+# Live session counters are off by default (active_sessions.backend: none);
+# with more than one worker only the 'redis' backend is shared by all of them,
+# 'memory' keeps separate counters in each worker.
+
+
+def _json_default(value):
+    # Same conversions as Flask's JSON provider, so both apps send equal bodies
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+    if isinstance(value, date):
+        return format_datetime(datetime(value.year, value.month, value.day, tzinfo=timezone.utc),
+                               usegmt=True)
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(body):
+    return json.dumps(body, default=_json_default, sort_keys=True)
+
+
+class APIResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content).encode('utf-8')
+
+
+def message(text, status):
+    return APIResponse({"message": text}, status_code=status)
+
+
+_ENTITY_TAG = re.compile(r'\s*(W/)?"([^"]*)"\s*(?:,|$)|\s*(\*)\s*(?:,|$)')
+
+
+def if_none_match(header):
+    """
+    Parses an If-None-Match header like werkzeug's parse_etags: returns the
+    strong entity tags (unquoted) and whether it was '*'. Weak tags are
+    skipped, so both apps treat the same header alike.
+    """
+    strong, star = set(), False
+    for match in _ENTITY_TAG.finditer(header or ''):
+        weak, tag, any_tag = match.groups()
+        if any_tag:
+            star = True
+        elif not weak:
+            strong.add(tag)
+    return strong, star
+
+
+async def conditional_json(request, etag, producer):
+    """
+    Async form of resources.responses.conditional_json: 304 when the client's
+    If-None-Match already names etag (producer is not awaited), otherwise the
+    producer's body, status and headers with the ETag attached. The body may
+    be a ready-made Response (e.g. a streamed one).
+    """
+    quoted = f'"{etag}"' if etag is not None else None
+    strong, star = if_none_match(request.headers.get('if-none-match'))
+    if etag is not None and (star or etag in strong):
+        response = Response(status_code=304)
+    else:
+        result = await producer()
+        if not isinstance(result, tuple):
+            result = (result,)
+        status = result[1] if len(result) > 1 else 200
+        if isinstance(result[0], Response):
+            response = result[0]
+            response.status_code = status
+        else:
+            response = APIResponse(result[0], status_code=status,
+                                   headers=result[2] if len(result) > 2 else None)
+        if status >= 400:
+            return response
+
+    if quoted is not None:
+        response.headers['ETag'] = quoted
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+BODY_NOT_OBJECT = "Error: The request body must be a JSON object."
+
+
+async def _json_body(request):
+    # {} for a missing or malformed body, None when it is valid JSON but not
+    # an object (the handlers answer 400 then)
+    try:
+        body = await request.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else None
+
+
+def _int_arg(request, name, default=None):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+async def users(request):
+    if request.method == 'POST':
+        data = await _json_body(request)
+        if data is None:
+            return message(BODY_NOT_OBJECT, 400)
+        return APIResponse(await db.create_user(data["email"], data["name"], data["password"]))
+
+    email = request.query_params.get('email')
+    created_after = request.query_params.get('created_after')
+    after_id = _int_arg(request, 'after_id')
+    limit = _int_arg(request, 'limit')
+    etag = make_etag('users', await db.get_global_data_version(), email, created_after, after_id, limit)
+    if created_after:
+        try:
+            created_after = datetime.fromisoformat(created_after)
+        except ValueError:
+            return message("Error: created_after must be an ISO 8601 date.", 400)
+
+    async def generate():
+        rows = db.stream_all_users(email_contains=email, created_after=created_after or None,
+                                   after_id=after_id, limit=limit)
+        yield "["
+        index = 0
+        async for row in rows:
+            yield ("," if index else "") + dumps(row)
+            index += 1
+        yield "]"
+
+    async def load():
+        return StreamingResponse(generate(), media_type='application/json')
+
+    return await conditional_json(request, etag, load)
+
+
+async def login(request):
+    data = await _json_body(request)
+    if data is None:
+        return message(BODY_NOT_OBJECT, 400)
+    if not data.get("email"):
+        return APIResponse({"message": "Email is required"})
+    if not data.get("password"):
+        return APIResponse({"message": "Password is required"})
+
+    try:
+        user = await db.login(data["email"], data["password"])
+    except PasswordQueueFullError:
+        return message(PASSWORD_BUSY_MESSAGE, 503)
+
+    if user:
+        user["token"] = issue_token(user["UserID"])
+    return APIResponse(user)
+
+
+async def user_sessions(request):
+    user_id = request.path_params['UserID']
+    if request.method == 'PUT':
+        data = await _json_body(request)
+        if data is None:
+            return message(BODY_NOT_OBJECT, 400)
+        return APIResponse(await db.create_session(user_id, data.get('blocks', [])))
+
+    version = await db.get_user_data_version(user_id)
+    params = request.query_params
+    if 'limit' not in params and 'before' not in params:
+        etag = make_etag('sessions', version, user_id) if version is not None else None
+        return await conditional_json(request, etag, lambda: db.get_user_sessions(user_id, version))
+
+    limit = _int_arg(request, 'limit', SESSIONS_PAGE_SIZE)
+    before = params.get('before')
+    etag = make_etag('sessions', version, user_id, before, limit) if version is not None else None
+
+    async def load():
+        page = await db.get_user_sessions_page(user_id, before=before, limit=limit, version=version)
+        if "error" in page:
+            return {"message": page["error"]}, 400
+        headers = {'X-Next-Cursor': page['next_cursor']} if page['next_cursor'] else {}
+        return page['sessions'], 200, headers
+
+    return await conditional_json(request, etag, load)
+
+
+async def session_details(request):
+    user_id = request.path_params['UserID']
+    session_id = request.path_params['SessionID']
+    version = await db.get_user_data_version(user_id)
+    etag = make_etag('session', version, user_id, session_id, 'rows') if version is not None else None
+    return await conditional_json(request, etag, lambda: db.get_session_data(user_id, session_id, version))
+
+
+def _position(value, key):
+    if value is None:
+        return None, None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None, f'Error: {key} must be a number.'
+    if not 0 <= value <= 1:
+        return None, f'Error: {key} must be between 0 and 1.'
+    return value, None
+
+
+async def active_session(request):
+    session_id = request.path_params['SessionID']
+    if request.method == 'PUT':
+        result = await db.update_session_end_time(session_id)
+        if "correctly" in result:
+            return message(f'Session {session_id} finished successfully.', 200)
+        return message(f'Failed to end session: {result}', 500)
+
+    body = await _json_body(request)
+    if body is None:
+        return message(BODY_NOT_OBJECT, 400)
+    data = dict(request.query_params)
+    data.update(body)
+    try:
+        block_id = int(data['block_id'])
+    except (KeyError, TypeError, ValueError):
+        return message({'block_id': 'Block ID is required to record a shot'}, 400)
+
+    positions = {}
+    for key in ('position_x', 'position_y'):
+        positions[key], error = _position(data.get(key), key)
+        if error:
+            return message(error, 400)
+
+    result = await db.record_new_shot(block_id, positions['position_x'], positions['position_y'])
+    return message(result, 201 if "successfully" in result else 500)
+
+
+async def leaderboard(request):
+    sort_by = request.query_params.get('sort_by', 'accuracy')
+    after = request.query_params.get('after')
+    limit = _int_arg(request, 'limit', LEADERBOARD_PAGE_SIZE)
+    version = await db.get_global_data_version()
+    etag = make_etag('leaderboard', version, sort_by, after, limit)
+
+    async def load():
+        page = await db.get_leaderboard_page(sort_by=sort_by, after=after, limit=limit, version=version)
+        if "error" in page:
+            return {"message": page["error"]}, 400
+        headers = {'X-Next-Cursor': page['next_cursor']} if page['next_cursor'] else {}
+        return page['entries'], 200, headers
+
+    return await conditional_json(request, etag, load)
+
+
+async def dashboard(request):
+    user_id = request.path_params['UserID']
+    version = await db.get_user_data_version(user_id)
+    etag = make_etag('dashboard', version, user_id) if version is not None else None
+    return await conditional_json(request, etag, lambda: db.get_user_dashboard_stats(user_id, version))
+
+
+async def _live_events(session_id):
+    # Yields (event, data, id) for a live session, or None as a heartbeat;
+    # see resources.live_session for the events
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+
+    def notify():
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:  # loop already closed
+            pass
+
+    hub = get_live_hub()
+    # The first watcher loads the counters with a blocking query
+    subscription = await asyncio.to_thread(hub.subscribe, session_id, notify)
+    heartbeat = live_config()['heartbeat_seconds']
+    try:
+        yield 'snapshot', _session_summary(session_id, subscription.snapshot), subscription.seq
+        while True:
+            try:
+                await asyncio.wait_for(wakeup.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            seq, updates = subscription.drain()
+            if updates:
+                yield 'blocks', updates, seq
+            if subscription.closed:
+                yield 'end', {'session_id': session_id}, seq
+                return
+            if not updates:
+                yield None
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def live_session(request):
+    user_id = request.path_params['UserID']
+    session_id = request.path_params['SessionID']
+    if not await exec_get_one(SESSION_OWNER_SQL, (session_id, user_id)):
+        return message(SESSION_NOT_FOUND, 404)
+
+    async def generate():
+        async with aclosing(_live_events(session_id)) as events:
+            async for item in events:
+                yield sse_event(*item) if item else ": keepalive\n\n"
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def live_session_socket(websocket):
+    """
+    WebSocket form of live_session: each event is sent as one JSON text
+    message, {"event": ..., "id": ..., "data": ...}.
+    """
+    user_id = websocket.path_params['UserID']
+    session_id = websocket.path_params['SessionID']
+    if not await exec_get_one(SESSION_OWNER_SQL, (session_id, user_id)):
+        await websocket.close(code=4404)
+        return
+
+    await websocket.accept()
+    try:
+        async with aclosing(_live_events(session_id)) as events:
+            async for item in events:
+                if item:
+                    event, data, event_id = item
+                    await websocket.send_text(dumps({'event': event, 'id': event_id, 'data': data}))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
+async def query_stats(request):
+    """Same as resources.query_stats.QueryStats, for this worker's statements."""
+    if not metrics_access_allowed(request.headers.get('authorization'), query_metrics_config()['token']):
+        return message("Error: Not allowed to read query metrics.", 403)
+
+    if request.query_params.get('format') == 'prometheus':
+        return Response(prometheus_text(), headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+    return APIResponse(query_report())
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Fails fast when auth.secret is missing from db.yml or
+    # active_sessions.backend is not a known backend
+    get_token_service()
+    get_active_sessions()
+    await get_async_pool()
+    yield
+    await close_async_pool()
+    # Session-end heatmaps are stored through the psycopg2 pool
+    close_pool()
+
+
+routes = [
+    Route('/', users, methods=['GET', 'POST']),
+    Route('/user/login', login, methods=['POST']),
+    Route('/user/{UserID:int}/sessions', user_sessions, methods=['GET', 'PUT']),
+    Route('/user/{UserID:int}/sessions/{SessionID:int}', session_details, methods=['GET']),
+    Route('/user/{UserID:int}/sessions/{SessionID:int}/active-session', active_session,
+          methods=['POST', 'PUT']),
+    Route('/user/{UserID:int}/sessions/{SessionID:int}/live', live_session, methods=['GET']),
+    WebSocketRoute('/user/{UserID:int}/sessions/{SessionID:int}/live/ws', live_session_socket),
+    Route('/leaderboard', leaderboard, methods=['GET']),
+    Route('/user/{UserID:int}/dashboard', dashboard, methods=['GET']),
+    Route('/admin/queries', query_stats, methods=['GET']),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan,
+                middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'],
+                                       allow_headers=['*'], expose_headers=['ETag', 'X-Next-Cursor'])])
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=4949)
@@ -1,3 +1,5 @@
+import atexit
+
 from flask import Flask
 from flask_restful import Resource, Api
 from flask_cors import CORS
@@ -14,6 +16,11 @@ from api.resources.blocks import *
 from api.resources.active_session import *
 from api.resources.leaderboard import *
 from api.resources.dashboard import *
+from api.resources.heatmap import *
+from api.resources.live_session import *
+from api.resources.query_stats import *
+from api.auth_tokens import get_token_service
+from api.active_sessions import get_active_sessions
 
 app = Flask(__name__)
 CORS(app)
@@ -22,17 +29,31 @@ api = Api(app)
 api.add_resource(Users, '/')
 api.add_resource(User, '/user/<int:UserID>')
 api.add_resource(Login, '/user/login')
+api.add_resource(Logout, '/user/logout')
 api.add_resource(UserSessions, '/user/<int:UserID>/sessions')
 api.add_resource(SessionDetails, '/user/<int:UserID>/sessions/<int:SessionID>')
+api.add_resource(SessionShots, '/user/<int:UserID>/sessions/<int:SessionID>/shots')
 api.add_resource(ChangePassword, '/user/<int:UserID>/change-password')
 api.add_resource(Blocks, '/blocks')
 api.add_resource(ActiveSession, '/user/<int:UserID>/sessions/<int:SessionID>/active-session')
+api.add_resource(ActiveSessionShots, '/user/<int:UserID>/sessions/<int:SessionID>/active-session/shots')
+api.add_resource(LiveSessionEvents, '/user/<int:UserID>/sessions/<int:SessionID>/live')
 api.add_resource(Leaderboard, '/leaderboard')
 api.add_resource(Dashboard, "/user/<int:UserID>/dashboard")
+api.add_resource(Heatmap, "/user/<int:UserID>/heatmap")
+api.add_resource(QueryStats, '/admin/queries')
+
+# Fails fast when auth.secret is missing from db.yml or
+# active_sessions.backend is not a known backend
+get_token_service()
+get_active_sessions()
 
 
 if __name__ == "__main__":
+    load_config()
+    atexit.register(close_pool)
     print("Loading db...")
     rebuild_tables()
+    create_shot_partitions()
     print("Starting Flask")
     app.run(debug=True,host='0.0.0.0',port=4949)
\ No newline at end of file